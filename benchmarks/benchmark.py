@@ -0,0 +1,320 @@
+"""
+@package benchmarks
+
+@brief Offline benchmarks of pywsdp hot paths
+
+Benchmarks:
+ - DictEditor processing of ctiOS responses
+ - AttributeConverter.convert_attributes
+ - DbManager.get_posidents_from_db and DbManager.update_rows_in_db on generated OPSUB table
+ - CtiOS.uloz_vystup for every OutputFormat
+ - construction of ctiOS client (needs access to WSDL, skipped otherwise)
+
+Results are stored to benchmarks/vysledky/<version>.json and compared with
+the results of the previous version.
+
+Usage:
+    python benchmarks/benchmark.py [--radky 1000000] [--posidenty 10000]
+        [--vstup tests/data/input/ctios_template_all.json]
+
+(C) 2021 Linda Kladivova lindakladivova@gmail.com
+This library is free under the MIT License.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import logging
+import platform
+import argparse
+import tempfile
+import statistics
+from datetime import datetime
+
+library_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if library_path not in sys.path:
+    sys.path.insert(0, library_path)
+
+from pywsdp.base import __version__
+from pywsdp.base.exceptions import WSDPError
+from pywsdp.clients.factory import pywsdp
+from pywsdp.clients.helpers.ctiOS import DictEditor, Counter
+from pywsdp.modules.CtiOS import CtiOS, OutputFormat
+from pywsdp.modules.CtiOS import _XML2DB_mapping
+from pywsdp.modules.CtiOS.helpers import AttributeConverter, DbManager
+from tests.helpers import create_opsub_db, ctios_module, posident
+
+results_dir = os.path.join(os.path.dirname(__file__), "vysledky")
+
+# Share of posidents returned with an error in synthetic responses
+_ERRORS = (
+    (0.02, "NEPLATNY_IDENTIFIKATOR"),
+    (0.01, "EXPIROVANY_IDENTIFIKATOR"),
+    (0.01, "OPRAVNENY_SUBJEKT_NEEXISTUJE"),
+)
+
+logger = logging.getLogger("pywsdp.benchmark")
+logger.addHandler(logging.NullHandler())
+logger.propagate = False
+
+
+def os_record(rnd, posident_id):
+    """One item of osList of serialized ctiOS response."""
+    for probability, error in _ERRORS:
+        if rnd.random() < probability:
+            return {"pOSIdent": posident_id, "chybaPOSIdent": error}
+    return {
+        "pOSIdent": posident_id,
+        "chybaPOSIdent": None,
+        "osId": str(rnd.randrange(10**9)),
+        "osDetail": [
+            {
+                "stavDat": 0,
+                "datumVzniku": datetime(2000 + rnd.randrange(20), 1, 1),
+                "datumZaniku": None,
+                "priznakKontext": 1,
+                "rizeniIdVzniku": rnd.randrange(10**9),
+                "rizeniIdZaniku": None,
+                "partnerBsm1": None,
+                "partnerBsm2": None,
+                "opsubType": "OFO",
+                "charOsType": 1,
+                "jmeno": "Jan",
+                "jmenoU": "JAN",
+                "prijmeni": "Novak",
+                "prijmeniU": "NOVAK",
+                "rodneCislo": str(rnd.randrange(10**9, 10**10)),
+                "cisloDomovni": rnd.randrange(1, 3000),
+                "nazevUlice": "Thakurova",
+                "obec": "Praha",
+                "psc": 16000,
+                "kodAdresnihoMista": rnd.randrange(10**7),
+            }
+        ],
+    }
+
+
+def ctios_response(rnd, posidents):
+    """Serialized ctiOS response as returned by zeep.helpers.serialize_object."""
+    return {
+        "vysledek": {
+            "zprava": [{"_value_1": "Pozadovana akce byla uspesne provedena."}]
+        },
+        "osList": {"os": [os_record(rnd, p) for p in posidents]},
+    }
+
+
+def ctios_responses(rnd, posidents, chunk_size=10):
+    """Responses for all posidents split to requests of chunk_size posidents."""
+    return [
+        ctios_response(rnd, posidents[i : i + chunk_size])
+        for i in range(0, len(posidents), chunk_size)
+    ]
+
+
+def process_responses(responses):
+    """Process responses by DictEditor the same way as CtiOsClient does."""
+    dictionary = {}
+    errors = {}
+    counter = Counter()
+    for response in responses:
+        partial, partial_errors = DictEditor()(response, counter, logger)
+        dictionary.update(partial)
+        errors.update(partial_errors)
+    return dictionary, errors
+
+
+def measure(setup, func, repeat):
+    """
+    Best and median time of repeated calls of func. Setup prepares the arguments
+    and is not measured.
+    :rtype: dict
+    """
+    times = []
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "median": statistics.median(times), "opakovani": repeat}
+
+
+def run(args):
+    rnd = random.Random(0)
+    posidents = []
+    if args.vstup:
+        with open(args.vstup, encoding="utf-8") as f:
+            posidents = list(dict.fromkeys(json.load(f)["pOSIdent"]))
+    posidents = (posidents + [posident(rnd) for _ in range(args.posidenty)])[
+        : args.posidenty
+    ]
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix="pywsdp_benchmark_")
+
+    def report(name, result):
+        results[name] = result
+        print("{:<40} {:>10.4f} s".format(name, result["min"]))
+
+    try:
+        report(
+            "DictEditor",
+            measure(
+                lambda: (ctios_responses(random.Random(2), posidents),),
+                process_responses,
+                args.opakovani,
+            ),
+        )
+
+        dictionary, _ = process_responses(ctios_responses(random.Random(2), posidents))
+        big_db = os.path.join(work_dir, "opsub.db")
+        create_opsub_db(big_db, posidents, args.radky)
+        db = DbManager(big_db, logger)
+        db.add_column_to_db("OS_ID", "text")
+        columns = db.get_columns_names()
+
+        report(
+            "AttributeConverter.convert_attributes",
+            measure(
+                lambda: (),
+                lambda: AttributeConverter(
+                    _XML2DB_mapping, dictionary, columns, logger
+                ).convert_attributes(),
+                args.opakovani,
+            ),
+        )
+        report(
+            "DbManager.get_posidents_from_db",
+            measure(lambda: (), db.get_posidents_from_db, args.opakovani),
+        )
+
+        updated = dict(list(dictionary.items())[: args.aktualizace])
+        db_dictionary = AttributeConverter(
+            _XML2DB_mapping, updated, columns, logger
+        ).convert_attributes()
+        report(
+            "DbManager.update_rows_in_db",
+            measure(lambda: (db_dictionary,), db.update_rows_in_db, args.opakovani),
+        )
+        db.close_connection()
+
+        small_db = os.path.join(work_dir, "opsub_small.db")
+        create_opsub_db(small_db, list(updated), len(updated))
+        module = ctios_module(small_db, work_dir)
+        for output_format in OutputFormat:
+            data = updated if output_format == OutputFormat.GdalDb else dictionary
+            report(
+                "CtiOS.uloz_vystup({})".format(output_format.name),
+                measure(
+                    lambda: (),
+                    lambda: module.uloz_vystup(
+                        data, os.path.join(work_dir, "vystup"), output_format
+                    ),
+                    args.opakovani,
+                ),
+            )
+
+        try:
+            report(
+                "ClientFactory.create(ctiOS)",
+                measure(
+                    lambda: (),
+                    lambda: pywsdp.create(
+                        "ctios", "ctiOS", ["WSTEST", "WSHESLO"], logger, True
+                    ),
+                    args.opakovani,
+                ),
+            )
+        except WSDPError as exc:
+            print("ClientFactory.create(ctiOS) preskoceno: {}".format(exc.args[-1]))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def compare(results, previous, version):
+    """Print relative change against results of the previous version."""
+    print("\nPorovnani s verzi {}:".format(version))
+    for name, result in results.items():
+        if name in previous:
+            change = result["min"] / previous[name]["min"] - 1
+            print(
+                "{:<40} {:>+8.1%}{}".format(
+                    name, change, "  ZPOMALENI" if change > 0.1 else ""
+                )
+            )
+
+
+def previous_results(version):
+    """Results of the most recently stored other version."""
+    if not os.path.isdir(results_dir):
+        return None, None
+    files = sorted(
+        (
+            os.path.join(results_dir, f)
+            for f in os.listdir(results_dir)
+            if f.endswith(".json") and f != "{}.json".format(version)
+        ),
+        key=os.path.getmtime,
+    )
+    if not files:
+        return None, None
+    with open(files[-1], encoding="utf-8") as f:
+        stored = json.load(f)
+    return stored["verze"], stored["vysledky"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarky knihovny pywsdp")
+    parser.add_argument(
+        "--radky", type=int, default=1000000, help="pocet radku tabulky OPSUB"
+    )
+    parser.add_argument(
+        "--posidenty", type=int, default=10000, help="pocet zpracovanych posidentu"
+    )
+    parser.add_argument(
+        "--aktualizace",
+        type=int,
+        default=100,
+        help="pocet posidentu aktualizovanych v databazi",
+    )
+    parser.add_argument(
+        "--vstup",
+        help="JSON soubor s posidenty (doplnenymi nahodnymi do poctu --posidenty)",
+    )
+    parser.add_argument("--opakovani", type=int, default=3, help="pocet opakovani")
+    parser.add_argument("--verze", default=__version__, help="oznaceni vysledku")
+    parser.add_argument(
+        "--neukladat", action="store_true", help="vysledky neukladat na disk"
+    )
+    args = parser.parse_args()
+
+    results = run(args)
+
+    previous_version, previous = previous_results(args.verze)
+    if previous:
+        compare(results, previous, previous_version)
+
+    if not args.neukladat:
+        os.makedirs(results_dir, exist_ok=True)
+        path = os.path.join(results_dir, "{}.json".format(args.verze))
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "verze": args.verze,
+                    "datum": datetime.now().isoformat(),
+                    "python": platform.python_version(),
+                    "platforma": platform.platform(),
+                    "parametry": vars(args),
+                    "vysledky": results,
+                },
+                f,
+                indent=2,
+            )
+        print("\nVysledky ulozeny zde: {}".format(path))
+
+
+if __name__ == "__main__":
+    main()
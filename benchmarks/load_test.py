@@ -0,0 +1,182 @@
+"""
+@package benchmarks.load_test
+
+@brief End-to-end load test of the CtiOS pipeline against the local mock server
+
+Every client reads its share of posidents from generated OPSUB table, sends
+requests to the mock server and saves the output. The test reports throughput
+and tail latency of the requests.
+
+Usage:
+    python benchmarks/load_test.py --posidenty 10000 --klienti 4 --latence 0.2 --rozptyl 0.5
+
+(C) 2021 Linda Kladivova lindakladivova@gmail.com
+This library is free under the MIT License.
+"""
+
+import os
+import sys
+import time
+import shutil
+import random
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from zeep import Plugin
+
+library_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if library_path not in sys.path:
+    sys.path.insert(0, library_path)
+
+from tests.helpers import create_opsub_db, posident
+from tests.mock_server import MockWSDPServer, config_from_args, parse_args
+from pywsdp.base.exceptions import WSDPError
+from pywsdp.clients import factory
+from pywsdp.modules.CtiOS import CtiOS, OutputFormat
+
+_FORMATS = {
+    "json": OutputFormat.Json,
+    "csv": OutputFormat.Csv,
+    "db": OutputFormat.GdalDb,
+}
+
+
+class LatencyPlugin(Plugin):
+    """
+    Zeep plugin recording latency of every request.
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def egress(self, envelope, http_headers, operation, binding_options):
+        self._local.start = time.perf_counter()
+        return envelope, http_headers
+
+    def ingress(self, envelope, http_headers, operation):
+        with self._lock:
+            self.latencies.append(time.perf_counter() - self._local.start)
+        return envelope, http_headers
+
+
+def percentile(values, q):
+    """Percentile of sorted values (nearest rank)."""
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, max(0, int(round(q * len(values))) - 1))]
+
+
+def run_client(number, clients, db_path, output_dir, output_format, plugin):
+    """
+    Run the whole CtiOS pipeline for one share of posidents.
+    :rtype: tuple (int - number of posidents, int - number of requests)
+    """
+    ctios = CtiOS(["WSTEST", "WSHESLO"], trial=True)
+    ctios.client.client.plugins.append(plugin)
+    parametry = ctios.nacti_identifikatory_z_db(
+        db_path,
+        "SELECT ID FROM OPSUB WHERE ogr_fid % {} = {}".format(clients, number),
+    )
+    slovnik, chybne = ctios.posli_pozadavek(parametry)
+    # outputs are named by time, so every client needs its own directory
+    output_dir = os.path.join(output_dir, "klient_{}".format(number))
+    os.makedirs(output_dir, exist_ok=True)
+    ctios.uloz_vystup(slovnik, output_dir, output_format)
+    ctios.uloz_vystup_chybnych(chybne, output_dir)
+    return len(parametry["pOSIdent"]), ctios.client.number_of_requests
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Zatezovy test sluzby ctiOS proti lokalnimu serveru"
+    )
+    parser.add_argument(
+        "--posidenty", type=int, default=10000, help="pocet posidentu v databazi"
+    )
+    parser.add_argument(
+        "--klienti", type=int, default=4, help="pocet soubezne bezicich klientu"
+    )
+    parser.add_argument(
+        "--format", choices=sorted(_FORMATS), default="json", help="vystupni format"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=10.0, help="timeout pozadavku klienta [s]"
+    )
+    parser.add_argument(
+        "--logovat", action="store_true", help="logovat zpravy klientu na urovni INFO"
+    )
+    parse_args(parser)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="pywsdp_load_test_")
+    db_path = os.path.join(work_dir, "opsub.db")
+    rnd = random.Random(args.seed)
+    create_opsub_db(
+        db_path, [posident(rnd) for _ in range(args.posidenty)], args.posidenty
+    )
+
+    if not args.logovat:
+        logging.disable(logging.INFO)
+    plugin = LatencyPlugin()
+    timeout = factory.transport.operation_timeout
+    factory.transport.operation_timeout = args.timeout
+    server = MockWSDPServer(config_from_args(args)).start()
+    previous = factory.set_wsdls(server.wsdls)
+    failures = []
+    posidents = 0
+    requests = 0
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.klienti) as executor:
+            futures = [
+                executor.submit(
+                    run_client,
+                    number,
+                    args.klienti,
+                    db_path,
+                    work_dir,
+                    _FORMATS[args.format],
+                    plugin,
+                )
+                for number in range(args.klienti)
+            ]
+            for future in futures:
+                try:
+                    done, sent = future.result()
+                    posidents += done
+                    requests += sent
+                except WSDPError as exc:
+                    failures.append(exc.args[-1])
+        elapsed = time.perf_counter() - start
+    finally:
+        server.stop()
+        factory.set_wsdls(previous)
+        factory.transport.operation_timeout = timeout
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    latencies = sorted(plugin.latencies)
+    print("Zpracovano posidentu:        {}".format(posidents))
+    print("Pocet pozadavku:             {}".format(requests))
+    print("Celkovy cas [s]:             {:.3f}".format(elapsed))
+    print("Propustnost [posidentu/s]:   {:.1f}".format(posidents / elapsed))
+    print("Propustnost [pozadavku/s]:   {:.1f}".format(len(latencies) / elapsed))
+    for q in (0.5, 0.9, 0.99, 0.999):
+        print(
+            "Latence p{:<5g} [ms]:        {:.1f}".format(
+                q * 100, percentile(latencies, q) * 1000
+            )
+        )
+    if latencies:
+        print("Latence max [ms]:            {:.1f}".format(latencies[-1] * 1000))
+    print("Neuspesni klienti:           {}".format(len(failures)))
+    for failure in failures:
+        print("  {}".format(failure))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,6 @@
 from pywsdp.modules import GenerujCenoveUdajeDleKu
 from pywsdp.modules.SpravujSestavy import SeznamSestav, VratSestavu, SmazSestavu
-from pywsdp.modules.CtiOS import OutputFormat
+from pywsdp.modules.CtiOS import OutputFormat, Compression, InputFormat
 from pywsdp.base import __version__
 
 if __name__ == "__main__":
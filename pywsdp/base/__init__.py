@@ -14,11 +14,16 @@ This library is free under the MIT License.
 import os
 import json
 import tempfile
+import threading
 from pathlib import Path
+from contextlib import contextmanager
 
 from pywsdp.clients.factory import pywsdp
 from pywsdp.base.logger import WSDPLogger
 from pywsdp.base.exceptions import WSDPError
+from pywsdp.base.metrics import WSDPMetrics
+from pywsdp.base.profiling import Tracer
+from pywsdp.base.polling import AdaptivePolling, ReportWatcher
 
 __version__ = "2.2.0"
 
@@ -40,6 +45,7 @@ class WSDPBase:
         self._trial = trial
         self._creds = creds
         self._log_adresar = self._set_default_log_dir()
+        self.tracer = self.client.tracer
 
     @property
     def skupina_sluzeb(self) -> dict:
@@ -79,7 +85,7 @@ class WSDPBase:
             os.makedirs(log_adresar)
         self.logger.set_directory(log_adresar)
         self._log_adresar = log_adresar
-        self.logger.info("Logovaci adresar nastaven na cestu: {}".format(log_adresar))
+        self.logger.info("Logovaci adresar nastaven na cestu: %s", log_adresar)
 
     @property
     def testovaci_mod(self) -> bool:
@@ -89,6 +95,57 @@ class WSDPBase:
         """
         return self._trial
 
+    @property
+    def metriky(self) -> WSDPMetrics:
+        """Vraci metriky pozadavku (pocty, latence, prenesene bajty, chyby, ...)
+        sdilene vsemi klienty WSDP sluzeb. Metriky lze exportovat do textoveho formatu
+        Prometheus nebo predavat registrovanym callbackum (metoda add_callback)."""
+        return self.client.metrics
+
+    def uloz_metriky(self, cesta: str) -> str:
+        """Ulozi metriky pozadavku do textoveho souboru ve formatu Prometheus
+        (napr. pro textfile collector node exporteru).
+
+        :param cesta: cesta k vystupnimu .prom souboru
+        :return: cesta k vystupnimu souboru
+        """
+        self.client.metrics.write_textfile(cesta)
+        return cesta
+
+    @property
+    def profilovani(self) -> bool:
+        """Vraci, zda se pri behu verejnych metod zaznamenava profil cProfile
+        a alokace pameti (tracemalloc). Zaroven funguje i jako setter."""
+        return self.tracer.cprofile and self.tracer.memory
+
+    @profilovani.setter
+    def profilovani(self, zapnout: bool):
+        """Zapne nebo vypne profilovani cProfile a tracemalloc. Vysledky jsou
+        soucasti JSON reportu behu v logovacim adresari.
+
+        :param zapnout: True/False
+        """
+        self.tracer.cprofile = zapnout
+        self.tracer.memory = zapnout
+
+    @property
+    def casy_fazi(self) -> dict:
+        """Vraci casy jednotlivych fazi posledniho behu (pocet, celkem, min, max, prumer)
+        a seznam poslednich behu verejnych metod."""
+        return self.tracer.report()
+
+    @contextmanager
+    def _beh(self, nazev: str):
+        """Privatni metoda merici beh verejne metody. Po skonceni behu zapise
+        report s casy fazi do logovaciho adresare."""
+        try:
+            with self.tracer.run(nazev):
+                yield
+        finally:
+            if not self.tracer.running:
+                cesta = self.tracer.write_report(self.log_adresar, self.nazev_sluzby)
+                self.logger.debug("Report behu ulozen zde: %s", cesta)
+
     def posli_pozadavek(self, slovnik_identifikatoru: dict) -> dict:
         """Zpracuje vstupni parametry pomoci nektere ze sluzeb a
         vysledek ulozi do slovniku.
@@ -106,7 +163,7 @@ class WSDPBase:
         if not os.path.exists(log_dir):
             os.makedirs(log_dir)
         self.logger.set_directory(log_dir)
-        self.logger.info("Logovaci zpravy ulozeny v adresari: {}".format(log_dir))
+        self.logger.info("Logovaci zpravy ulozeny v adresari: %s", log_dir)
         return log_dir
 
 
@@ -122,6 +179,9 @@ class SestavyBase(WSDPBase):
 
     def __init__(self, creds: dict, trial: dict = False):
         self._skupina_sluzeb = "sestavy"
+        self._klienti = {}
+        self._klienti_zamek = threading.Lock()
+        self._hlidac = None
 
         super().__init__(creds, trial=trial)
 
@@ -159,15 +219,7 @@ class SestavyBase(WSDPBase):
              'elZnacka': ''}
 
         """
-        service = "seznamSestav"
-        seznam_sestav = pywsdp.create(
-            self._skupina_sluzeb,
-            service,
-            self.pristupove_udaje,
-            self.logger,
-            self.testovaci_mod,
-        )
-        return seznam_sestav.send_request(sestava["id"])
+        return self._klient_sestav("seznamSestav").send_request(sestava["id"])
 
     def zauctuj_sestavu(self, sestava: dict) -> dict:
         """Vezme id sestavy z vytvorene sestavy a zavola sluzbu VratSestavu,
@@ -189,15 +241,7 @@ class SestavyBase(WSDPBase):
             'souborSestavy': ''}
 
         """
-        service = "vratSestavu"
-        vrat_sestavu = pywsdp.create(
-            self._skupina_sluzeb,
-            service,
-            self.pristupove_udaje,
-            self.logger,
-            self.testovaci_mod,
-        )
-        return vrat_sestavu.send_request(sestava["id"])
+        return self._klient_sestav("vratSestavu").send_request(sestava["id"])
 
     def vymaz_sestavu(self, sestava: dict) -> dict:
         """Vezme id sestavy z vytvorene sestavy a zavola sluzbu SmazSestavu,
@@ -207,12 +251,103 @@ class SestavyBase(WSDPBase):
         :return: slovnik ve tvaru {'zprava': ''}
 
         """
-        service = "smazSestavu"
-        smaz_sestavu = pywsdp.create(
-            self._skupina_sluzeb,
-            service,
-            self.pristupove_udaje,
-            self.logger,
-            self.testovaci_mod,
+        return self._klient_sestav("smazSestavu").send_request(sestava["id"])
+
+    def cekej_na_sestavu(
+        self, sestava: dict, timeout: float = 600.0, interval: float = 1.0
+    ) -> dict:
+        """Pocka, nez bude sestava vygenerovana. Stav sestavy zjistuje sluzbou SeznamSestav
+        v prodluzujicich se intervalech, prvni dotaz planuje podle doby generovani
+        predchozich sestav. Pokud na sestavy ceka vice vlaken zaroven, zjisti se stav
+        vsech sestav jednim dotazem na seznam sestav.
+
+        Raises:
+            WSDPTimeoutError: sestava nebyla vygenerovana do timeoutu
+            WSDPResponseError: generovani sestavy skoncilo chybou
+
+        :param sestava: slovnik vraceny pri vytvoreni sestavy
+        :param timeout: maximalni doba cekani v sekundach
+        :param interval: pocatecni interval mezi dotazy na stav sestavy v sekundach
+        :return: slovnik s informacemi o vygenerovane sestave (viz vypis_info_o_sestave)
+        """
+        return self._hlidac_sestav().wait([sestava["id"]], timeout, interval)[
+            sestava["id"]
+        ]
+
+    def cekej_na_sestavy(
+        self, sestavy: list, timeout: float = 600.0, interval: float = 1.0
+    ) -> dict:
+        """Pocka, nez budou vygenerovany vsechny sestavy. Stav vsech sestav zjistuje
+        jednim dotazem na seznam sestav.
+
+        :param sestavy: seznam slovniku vracenych pri vytvoreni sestav
+        :param timeout: maximalni doba cekani v sekundach
+        :param interval: pocatecni interval mezi dotazy na stav sestav v sekundach
+        :return: slovnik {id sestavy: slovnik s informacemi o sestave}
+        """
+        return self._hlidac_sestav().wait(
+            [sestava["id"] for sestava in sestavy], timeout, interval
+        )
+
+    async def cekej_na_sestavu_async(
+        self, sestava: dict, timeout: float = 600.0, interval: float = 1.0
+    ) -> dict:
+        """Asynchronni varianta metody cekej_na_sestavu pro pouziti s asyncio.
+
+        :param sestava: slovnik vraceny pri vytvoreni sestavy
+        :param timeout: maximalni doba cekani v sekundach
+        :param interval: pocatecni interval mezi dotazy na stav sestavy v sekundach
+        :return: slovnik s informacemi o vygenerovane sestave
+        """
+        vysledek = await self._hlidac_sestav().wait_async(
+            [sestava["id"]], timeout, interval
         )
-        return smaz_sestavu.send_request(sestava["id"])
+        return vysledek[sestava["id"]]
+
+    async def cekej_na_sestavy_async(
+        self, sestavy: list, timeout: float = 600.0, interval: float = 1.0
+    ) -> dict:
+        """Asynchronni varianta metody cekej_na_sestavy pro pouziti s asyncio.
+
+        :param sestavy: seznam slovniku vracenych pri vytvoreni sestav
+        :param timeout: maximalni doba cekani v sekundach
+        :param interval: pocatecni interval mezi dotazy na stav sestav v sekundach
+        :return: slovnik {id sestavy: slovnik s informacemi o sestave}
+        """
+        return await self._hlidac_sestav().wait_async(
+            [sestava["id"] for sestava in sestavy], timeout, interval
+        )
+
+    def _klient_sestav(self, service: str):
+        """Privatni metoda vracejici klienta sluzby pro spravu sestav.
+        Klient se vytvori pri prvnim pouziti a dale se pouziva opakovane.
+
+        :param service: nazev sluzby (seznamSestav, vratSestavu, smazSestavu)
+        """
+        with self._klienti_zamek:
+            if service not in self._klienti:
+                self._klienti[service] = pywsdp.create(
+                    self._skupina_sluzeb,
+                    service,
+                    self.pristupove_udaje,
+                    self.logger,
+                    self.testovaci_mod,
+                )
+                self._klienti[service].tracer = self.tracer
+            return self._klienti[service]
+
+    def _hlidac_sestav(self) -> ReportWatcher:
+        """Privatni metoda vracejici sdileny objekt pro cekani na sestavy.
+        Interval dotazu se predava kazdemu cekani zvlast, sdileny objekt se nemeni.
+        """
+        with self._klienti_zamek:
+            if self._hlidac is None:
+                self._hlidac = ReportWatcher(
+                    lambda id_sestavy: self._klient_sestav("seznamSestav").send_request(
+                        id_sestavy
+                    ),
+                    lambda: self._klient_sestav("seznamSestav").list_reports(),
+                    AdaptivePolling(self.nazev_sluzby),
+                    self.logger,
+                )
+            return self._hlidac
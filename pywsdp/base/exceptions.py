@@ -7,6 +7,8 @@ Classes:
  - base::WSDPError
  - base::WSDPRequestError
  - base::WSDPResponseError
+ - base::WSDPTimeoutError
+ - base::WSDPPosidentError
  
 (C) 2021 Linda Kladivova lindakladivova@gmail.com
 This library is free under the MIT License.
@@ -32,3 +34,20 @@ class WSDPResponseError(WSDPError):
 
     def __init__(self, logger, msg):
         super().__init__(logger, "{} - {}".format("WSDP RESPONSE ERROR", msg))
+
+
+class WSDPTimeoutError(WSDPError):
+    """Basic exception for waiting on any WSDP service longer than allowed"""
+
+    def __init__(self, logger, msg):
+        super().__init__(logger, "{} - {}".format("WSDP TIMEOUT ERROR", msg))
+
+
+class WSDPPosidentError(WSDPError):
+    """Exception for posident returned by ctiOS service with an error (chybaPOSIdent).
+    The error is logged when the response is processed, so it is not logged again."""
+
+    def __init__(self, logger, posident, chyba):
+        Exception.__init__(self, "POSIDENT {} - {}".format(posident, chyba))
+        self.posident = posident
+        self.chyba = chyba
@@ -10,46 +10,111 @@ Classes:
 This library is free under the MIT License.
 """
 
+import os
+import queue
+import atexit
 import logging
+import weakref
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+
+# Loggers whose queues are drained at exit of the interpreter
+_loggers = weakref.WeakSet()
+
+
+@atexit.register
+def _stop_listeners():
+    for logger in list(_loggers):
+        logger.close()
+
+
+class _LocalQueueHandler(QueueHandler):
+    """
+    Queue handler passing records to the listener unchanged. The records do not
+    leave the process, so formatting of the message is left to the listener thread.
+    """
+
+    def prepare(self, record):
+        return record
 
 
 class WSDPLogger(logging.getLoggerClass()):
     """
-    General WSDP class for logging
+    General WSDP class for logging. Records are passed through a queue and written
+    to the console and to the rotating log file by a background thread.
     """
 
-    def __init__(self, name: str, level=logging.ERROR):
+    def __init__(
+        self,
+        name: str,
+        level=logging.ERROR,
+        max_bytes=10 * 1024 * 1024,
+        backup_count=5,
+    ):
         """
         Contructor of WSDPLogger class, format console handler
         :param name: service name (str)
-        :param level: logging level ()
+        :param level: not used, the logger does not configure the root logger
+            of the application any more (kept for backward compatibility)
+        :param max_bytes: size of log file when it is rotated (int)
+        :param backup_count: number of kept rotated log files (int)
         """
         super().__init__(name)
 
-        # Define a level of log messages
-        logging.basicConfig(level=level)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.log_file = None
+        self._file_handler = None
+        self._listener = None
+        self._queue = queue.SimpleQueue()
 
         # Define a Stream Console Handler
-        console = logging.StreamHandler()
+        self._console = logging.StreamHandler()
 
         # Create formats and add it to console handler
         formatter = logging.Formatter("%(name)-12s - %(levelname)-8s - %(message)s")
-        console.setFormatter(formatter)
+        self._console.setFormatter(formatter)
 
         # Add handlers to the logger
-        self.addHandler(console)
+        self.addHandler(_LocalQueueHandler(self._queue))
+        self._start_listener()
+        _loggers.add(self)
+
+    def _start_listener(self):
+        handlers = [self._console]
+        if self._file_handler:
+            handlers.append(self._file_handler)
+        self._listener = QueueListener(
+            self._queue, *handlers, respect_handler_level=True
+        )
+        self._listener.start()
+
+    def _stop_listener(self):
+        if self._listener:
+            self._listener.stop()
+            self._listener = None
 
     def set_directory(self, log_dir: dir):
         """
-        Set log directory
+        Set log directory. The log file in previous directory is closed,
+        setting the same directory again keeps the current file.
         :param log_dir: path to log directory (str)
         """
+        if self._file_handler and os.path.dirname(self.log_file) == os.path.abspath(
+            log_dir
+        ):
+            return
 
         log_filename = datetime.now().strftime("%H_%M_%S_%d_%m_%Y.log")
-
-        file_handler = logging.FileHandler(
-            filename=log_dir + "/" + log_filename, mode="w"
+        self.log_file = os.path.join(os.path.abspath(log_dir), log_filename)
+
+        file_handler = RotatingFileHandler(
+            filename=self.log_file,
+            mode="w",
+            maxBytes=self.max_bytes,
+            backupCount=self.backup_count,
+            encoding="utf-8",
         )
 
         formatter = logging.Formatter(
@@ -57,8 +122,34 @@ class WSDPLogger(logging.getLoggerClass()):
         )
         file_handler.setFormatter(formatter)
 
-        # Add handlers to the logger
-        self.addHandler(file_handler)
+        # Replace file handler of the listener
+        self._stop_listener()
+        if self._file_handler:
+            self._file_handler.close()
+        self._file_handler = file_handler
+        self._start_listener()
+
+    def setLevel(self, level):
+        super().setLevel(level)
+        # The logger is not registered in logging manager, so its cache
+        # of enabled levels has to be cleared here
+        self._cache.clear()
+
+    def flush(self):
+        """Wait until all queued records are written."""
+        if self._listener:
+            self._stop_listener()
+            self._start_listener()
+
+    def close(self):
+        """Write queued records and close the log file."""
+        self._stop_listener()
+        if self._file_handler:
+            self._file_handler.close()
+            self._file_handler = None
 
     def __del__(self):
-        logging.shutdown()
+        try:
+            self.close()
+        except Exception:
+            pass
@@ -0,0 +1,328 @@
+"""
+@package base.metrics
+
+@brief Metrics of requests shared by all WSDP clients
+
+Classes:
+ - metrics::Histogram
+ - metrics::WSDPMetrics
+
+(C) 2021 Linda Kladivova lindakladivova@gmail.com
+This library is free under the MIT License.
+"""
+
+import os
+import time
+import tempfile
+import threading
+from contextlib import contextmanager
+
+
+# Upper bounds of latency histogram buckets in seconds
+_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """
+    Cumulative histogram of observed values (Prometheus style).
+    """
+
+    def __init__(self, buckets=_LATENCY_BUCKETS):
+        """
+        :param buckets: tuple of upper bounds of buckets
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """
+        Add observed value.
+        :param value: float
+        """
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class WSDPMetrics:
+    """
+    Registry of metrics of all WSDP clients - number of requests, latency, bytes sent
+    and received, retries, errors by type, processed posidents and requests in flight.
+    Metrics can be exported to Prometheus text format or passed to callbacks.
+    """
+
+    def __init__(self, prefix="pywsdp"):
+        """
+        :param prefix: str - prefix of metric names
+        """
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.reset()
+
+    def reset(self):
+        """Set all metrics to zero."""
+        with self._lock:
+            self.start = time.time()
+            self.requests = {}
+            self.latency = {}
+            self.bytes_sent = {}
+            self.bytes_received = {}
+            self.retries = {}
+            self.hedges = {}
+            self.errors = {}
+            self.posidents = {}
+            self.in_flight = {}
+
+    @staticmethod
+    def _add(dictionary, key, value=1):
+        dictionary[key] = dictionary.get(key, 0) + value
+
+    def observe_request(self, service, duration, sent=0, received=0):
+        """
+        Record one finished request.
+        :param service: str - name of the service (operation)
+        :param duration: float - latency in seconds
+        :param sent: int - number of bytes sent
+        :param received: int - number of bytes received
+        """
+        with self._lock:
+            self._add(self.requests, service)
+            self._add(self.bytes_sent, service, sent)
+            self._add(self.bytes_received, service, received)
+            self.latency.setdefault(service, Histogram()).observe(duration)
+
+    def add_error(self, service, error_type):
+        """
+        Record error (eg. chybaPOSIdent value or exception name).
+        :param service: str - name of the service
+        :param error_type: str - type of the error
+        """
+        with self._lock:
+            self._add(self.errors, (service, error_type))
+
+    def add_retry(self, service):
+        """
+        Record repeated request (eg. duplicate request sent by hedging).
+        :param service: str - name of the service
+        """
+        with self._lock:
+            self._add(self.retries, service)
+
+    def add_hedge(self, service):
+        """
+        Record duplicate (hedged) request.
+        :param service: str - name of the service
+        """
+        with self._lock:
+            self._add(self.hedges, service)
+
+    def add_posidents(self, service, number):
+        """
+        Record processed posidents.
+        :param service: str - name of the service
+        :param number: int - number of processed posidents
+        """
+        with self._lock:
+            self._add(self.posidents, service, number)
+
+    @contextmanager
+    def track_in_flight(self, service):
+        """
+        Context manager counting requests being processed.
+        :param service: str - name of the service
+        """
+        with self._lock:
+            self._add(self.in_flight, service)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._add(self.in_flight, service, -1)
+
+    def snapshot(self):
+        """
+        Current values of all metrics.
+        :rtype: dict
+        """
+        with self._lock:
+            elapsed = max(time.time() - self.start, 1e-9)
+            return {
+                "requests": dict(self.requests),
+                "latency": {
+                    service: {
+                        "count": h.count,
+                        "sum": h.sum,
+                        "buckets": dict(zip(h.buckets, h.counts)),
+                    }
+                    for service, h in self.latency.items()
+                },
+                "bytes_sent": dict(self.bytes_sent),
+                "bytes_received": dict(self.bytes_received),
+                "retries": dict(self.retries),
+                "hedges": dict(self.hedges),
+                "errors": {
+                    service: {
+                        error: n
+                        for (s, error), n in self.errors.items()
+                        if s == service
+                    }
+                    for service, _ in self.errors
+                },
+                "posidents": dict(self.posidents),
+                "posidents_per_second": {
+                    service: n / elapsed for service, n in self.posidents.items()
+                },
+                "in_flight": dict(self.in_flight),
+            }
+
+    def add_callback(self, callback):
+        """
+        Register function called with snapshot of metrics on every publish.
+        :param callback: callable accepting dict
+        """
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        """
+        Unregister callback.
+        :param callback: callable
+        """
+        self._callbacks.remove(callback)
+
+    def publish(self):
+        """Pass snapshot of metrics to all registered callbacks."""
+        if self._callbacks:
+            snapshot = self.snapshot()
+            for callback in list(self._callbacks):
+                callback(snapshot)
+
+    def to_prometheus(self):
+        """
+        Export metrics in Prometheus text format.
+        :rtype: str
+        """
+        p = self.prefix
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append("# HELP {}_{} {}".format(p, name, help_text))
+            lines.append("# TYPE {}_{} {}".format(p, name, kind))
+            for labels, value in samples:
+                label_text = ",".join(
+                    '{}="{}"'.format(k, str(v).replace('"', '\\"'))
+                    for k, v in labels.items()
+                )
+                lines.append(
+                    "{}_{}{} {}".format(
+                        p, name, "{" + label_text + "}" if label_text else "", value
+                    )
+                )
+
+        snapshot = self.snapshot()
+        metric(
+            "requests_total",
+            "counter",
+            "Number of requests sent to WSDP services.",
+            [({"service": s}, n) for s, n in snapshot["requests"].items()],
+        )
+        lines.append(
+            "# HELP {}_request_duration_seconds Latency of requests.".format(p)
+        )
+        lines.append("# TYPE {}_request_duration_seconds histogram".format(p))
+        for service, h in snapshot["latency"].items():
+            for bound, n in h["buckets"].items():
+                lines.append(
+                    '{}_request_duration_seconds_bucket{{service="{}",le="{}"}} {}'.format(
+                        p, service, bound, n
+                    )
+                )
+            lines.append(
+                '{}_request_duration_seconds_bucket{{service="{}",le="+Inf"}} {}'.format(
+                    p, service, h["count"]
+                )
+            )
+            lines.append(
+                '{}_request_duration_seconds_sum{{service="{}"}} {}'.format(
+                    p, service, h["sum"]
+                )
+            )
+            lines.append(
+                '{}_request_duration_seconds_count{{service="{}"}} {}'.format(
+                    p, service, h["count"]
+                )
+            )
+        metric(
+            "bytes_sent_total",
+            "counter",
+            "Bytes sent to WSDP services.",
+            [({"service": s}, n) for s, n in snapshot["bytes_sent"].items()],
+        )
+        metric(
+            "bytes_received_total",
+            "counter",
+            "Bytes received from WSDP services.",
+            [({"service": s}, n) for s, n in snapshot["bytes_received"].items()],
+        )
+        metric(
+            "retries_total",
+            "counter",
+            "Number of repeated requests.",
+            [({"service": s}, n) for s, n in snapshot["retries"].items()],
+        )
+        metric(
+            "hedged_requests_total",
+            "counter",
+            "Number of duplicate requests sent because of slow responses.",
+            [({"service": s}, n) for s, n in snapshot["hedges"].items()],
+        )
+        metric(
+            "errors_total",
+            "counter",
+            "Number of errors by type.",
+            [
+                ({"service": s, "type": e}, n)
+                for s, errors in snapshot["errors"].items()
+                for e, n in errors.items()
+            ],
+        )
+        metric(
+            "posidents_total",
+            "counter",
+            "Number of processed posidents.",
+            [({"service": s}, n) for s, n in snapshot["posidents"].items()],
+        )
+        metric(
+            "posidents_per_second",
+            "gauge",
+            "Processed posidents per second since the start.",
+            [
+                ({"service": s}, round(n, 3))
+                for s, n in snapshot["posidents_per_second"].items()
+            ],
+        )
+        metric(
+            "in_flight_requests",
+            "gauge",
+            "Number of requests being processed.",
+            [({"service": s}, n) for s, n in snapshot["in_flight"].items()],
+        )
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """
+        Atomically write metrics to Prometheus textfile (node exporter textfile collector).
+        :param path: str - path to .prom file
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp, path)
+
+
+metrics = WSDPMetrics()
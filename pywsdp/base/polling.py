@@ -0,0 +1,261 @@
+"""
+@package base.polling
+
+@brief Adaptive polling of report state for WSDP services of group sestavy
+
+Classes:
+ - polling::AdaptivePolling
+ - polling::ReportWatcher
+
+(C) 2021 Linda Kladivova lindakladivova@gmail.com
+This library is free under the MIT License.
+"""
+
+import time
+import asyncio
+import threading
+import unicodedata
+
+from pywsdp.base.exceptions import WSDPResponseError, WSDPTimeoutError
+
+
+# Normalized values of "stav" meaning that the report generation has ended
+_FINISHED_STATES = ("zpracovana", "vytvorena", "dokoncena", "hotova")
+_FAILED_STATES = ("chyba", "chybna")
+
+
+def _normalize_state(stav):
+    """
+    Lower case and strip diacritics of the report state (eg. Zpracována to zpracovana)
+    :param stav: str - state returned by SeznamSestav service
+    :rtype: str
+    """
+    stav = unicodedata.normalize("NFKD", stav or "")
+    return "".join(c for c in stav if not unicodedata.combining(c)).strip().lower()
+
+
+def is_report_finished(info):
+    """
+    Check if the report has been generated and can be charged.
+    :param info: dict - report info returned by SeznamSestav service
+    :rtype: bool
+    """
+    return bool(info.get("datumVytvoreni")) or (
+        _normalize_state(info.get("stav")) in _FINISHED_STATES
+    )
+
+
+def is_report_failed(info):
+    """
+    Check if the report generation has failed on the server side.
+    :param info: dict - report info returned by SeznamSestav service
+    :rtype: bool
+    """
+    return _normalize_state(info.get("stav")) in _FAILED_STATES
+
+
+class AdaptivePolling:
+    """
+    Schedule of polling intervals. The first check is planned close to the typical
+    generation time observed so far, then the interval grows exponentially.
+    """
+
+    # typical generation time (exponential moving average) shared per service
+    _typical = {}
+    _lock = threading.Lock()
+
+    def __init__(self, name, initial=1.0, factor=1.5, max_interval=30.0, smoothing=0.3):
+        """
+        :param name: str - name of the service the reports belong to
+        :param initial: float - first polling interval in seconds
+        :param factor: float - growth of the interval after every unsuccessful check
+        :param max_interval: float - upper bound of the interval in seconds
+        :param smoothing: float - weight of the last observation in the moving average
+        """
+        self.name = name
+        self.initial = initial
+        self.factor = factor
+        self.max_interval = max_interval
+        self.smoothing = smoothing
+
+    @property
+    def typical(self):
+        """Typical generation time in seconds or None if nothing was observed yet."""
+        return self._typical.get(self.name)
+
+    def observe(self, duration):
+        """
+        Update typical generation time by the observed one.
+        :param duration: float - seconds from the start of waiting to the finished state
+        """
+        with self._lock:
+            typical = self._typical.get(self.name)
+            if typical is None:
+                self._typical[self.name] = duration
+            else:
+                self._typical[self.name] = (
+                    self.smoothing * duration + (1 - self.smoothing) * typical
+                )
+
+    def intervals(self, initial=None):
+        """
+        Generate polling intervals in seconds.
+        :param initial: float - first polling interval of this wait, self.initial if None
+        :rtype: generator of floats
+        """
+        typical = self.typical
+        initial = self.initial if initial is None else initial
+        interval = initial
+        if typical:
+            yield min(0.8 * typical, self.max_interval)
+            interval = max(initial, 0.1 * typical)
+        while True:
+            yield min(interval, self.max_interval)
+            interval *= self.factor
+
+
+class ReportWatcher:
+    """
+    Wait for reports to be generated. Concurrent waiters share the requests - one report
+    is checked by SeznamSestav on its id, more reports by one listing of all reports.
+    """
+
+    def __init__(self, fetch_one, fetch_all, polling, logger):
+        """
+        :param fetch_one: callable - returns info dict of the report with the given id
+        :param fetch_all: callable - returns list of info dicts of all reports on the account
+        :param polling: AdaptivePolling
+        :param logger: logger object (class Logger)
+        """
+        self.fetch_one = fetch_one
+        self.fetch_all = fetch_all
+        self.polling = polling
+        self.logger = logger
+        self._cond = threading.Condition()
+        self._waiting = {}
+        self._round = 0
+        self._fetching = False
+        self._latest = {}
+
+    def _register(self, ids):
+        with self._cond:
+            for id_sestavy in ids:
+                self._waiting[id_sestavy] = self._waiting.get(id_sestavy, 0) + 1
+
+    def _unregister(self, ids):
+        with self._cond:
+            for id_sestavy in ids:
+                self._waiting[id_sestavy] -= 1
+                if not self._waiting[id_sestavy]:
+                    del self._waiting[id_sestavy]
+
+    def refresh(self, ids):
+        """
+        Get the current state of reports. If some other thread is just asking the server,
+        its response is reused instead of sending a new request.
+        :param ids: list of report ids
+        :rtype: dict - report id: report info
+        """
+        with self._cond:
+            while self._fetching:
+                started = self._round
+                while self._fetching and self._round == started:
+                    self._cond.wait()
+                if all(id_sestavy in self._latest for id_sestavy in ids):
+                    return {id_sestavy: self._latest[id_sestavy] for id_sestavy in ids}
+            self._fetching = True
+            outstanding = set(self._waiting) | set(ids)
+        latest = {}
+        try:
+            if len(outstanding) == 1:
+                info = self.fetch_one(next(iter(outstanding)))
+                latest = {next(iter(outstanding)): info}
+            else:
+                for info in self.fetch_all():
+                    if info.get("id") in outstanding:
+                        latest[info["id"]] = info
+                for id_sestavy in set(ids) - set(latest):
+                    latest[id_sestavy] = self.fetch_one(id_sestavy)
+        finally:
+            with self._cond:
+                self._latest = latest
+                self._round += 1
+                self._fetching = False
+                self._cond.notify_all()
+        return {id_sestavy: latest[id_sestavy] for id_sestavy in ids}
+
+    def _check(self, finished, ids, start, deadline, timeout):
+        """
+        Move finished reports to the result and raise if some report failed or the
+        deadline was reached.
+        Raises:
+            WSDPResponseError: report generation failed
+            WSDPTimeoutError: reports were not generated in time
+        """
+        for id_sestavy, info in self.refresh(ids).items():
+            if is_report_finished(info):
+                self.polling.observe(time.monotonic() - start)
+                finished[id_sestavy] = info
+            elif is_report_failed(info):
+                raise WSDPResponseError(
+                    self.logger,
+                    "Sestava {} skoncila ve stavu {}".format(
+                        id_sestavy, info.get("stav")
+                    ),
+                )
+        remaining = [id_sestavy for id_sestavy in ids if id_sestavy not in finished]
+        if remaining and time.monotonic() >= deadline:
+            raise WSDPTimeoutError(
+                self.logger,
+                "Sestavy {} nebyly vygenerovany do {} s".format(remaining, timeout),
+            )
+        return remaining
+
+    def wait(self, ids, timeout, interval=None):
+        """
+        Block until all reports are generated.
+        :param ids: list of report ids
+        :param timeout: float - max number of seconds to wait
+        :param interval: float - first polling interval, initial of the polling if None
+        :rtype: dict - report id: report info
+        """
+        start = time.monotonic()
+        deadline = start + timeout
+        intervals = self.polling.intervals(interval)
+        finished = {}
+        remaining = list(ids)
+        self._register(ids)
+        try:
+            while remaining:
+                time.sleep(max(0.0, min(next(intervals), deadline - time.monotonic())))
+                remaining = self._check(finished, remaining, start, deadline, timeout)
+        finally:
+            self._unregister(ids)
+        return finished
+
+    async def wait_async(self, ids, timeout, interval=None):
+        """
+        Asynchronous variant of wait, requests run in the default executor.
+        :param ids: list of report ids
+        :param timeout: float - max number of seconds to wait
+        :param interval: float - first polling interval, initial of the polling if None
+        :rtype: dict - report id: report info
+        """
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        deadline = start + timeout
+        intervals = self.polling.intervals(interval)
+        finished = {}
+        remaining = list(ids)
+        self._register(ids)
+        try:
+            while remaining:
+                await asyncio.sleep(
+                    max(0.0, min(next(intervals), deadline - time.monotonic()))
+                )
+                remaining = await loop.run_in_executor(
+                    None, self._check, finished, remaining, start, deadline, timeout
+                )
+        finally:
+            self._unregister(ids)
+        return finished
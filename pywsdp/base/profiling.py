@@ -0,0 +1,209 @@
+"""
+@package base.profiling
+
+@brief Per-stage timing and optional profiling of WSDP modules
+
+Classes:
+ - profiling::Tracer
+
+(C) 2021 Linda Kladivova lindakladivova@gmail.com
+This library is free under the MIT License.
+"""
+
+import os
+import io
+import json
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from datetime import datetime
+from collections import deque
+from contextlib import contextmanager
+
+
+class Tracer:
+    """
+    Measure time spent in named stages of the processing. Optionally capture
+    cProfile statistics and memory allocations (tracemalloc) of whole runs
+    and write machine-readable run report. Runs can be measured from several
+    threads at once - the depth of nested runs is kept per thread, profilers
+    are active from the start of the first run to the end of the last running one.
+    Stages are reset when a run starts while no other run is measured, so they
+    break down the last run (or the concurrent runs together). Only the last
+    max_runs runs are kept, so long-lived modules do not grow the report.
+    """
+
+    def __init__(self, cprofile=False, memory=False, top=25, max_runs=100):
+        """
+        :param cprofile: bool - capture cProfile statistics of runs
+        :param memory: bool - capture memory allocations of runs by tracemalloc
+        :param top: int - number of reported functions and allocation sites
+        :param max_runs: int - number of last runs kept in the report
+        """
+        self.cprofile = cprofile
+        self.memory = memory
+        self.top = top
+        self.stages = {}
+        self.runs = deque(maxlen=max_runs)
+        self._lock = threading.Lock()
+        self._profile = None
+        self._local = threading.local()
+        self._active = 0
+        self._started_tracemalloc = False
+        self.report_path = None
+
+    @property
+    def _depth(self):
+        """Depth of nested runs in the current thread."""
+        return getattr(self._local, "depth", 0)
+
+    @property
+    def running(self):
+        """True if some run is being measured in the current thread."""
+        return self._depth > 0
+
+    def add(self, name, duration):
+        """
+        Add duration to the stage.
+        :param name: str - name of the stage
+        :param duration: float - seconds
+        """
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                self.stages[name] = {
+                    "pocet": 1,
+                    "celkem": duration,
+                    "min": duration,
+                    "max": duration,
+                }
+            else:
+                stage["pocet"] += 1
+                stage["celkem"] += duration
+                stage["min"] = min(stage["min"], duration)
+                stage["max"] = max(stage["max"], duration)
+
+    @contextmanager
+    def span(self, name):
+        """
+        Context manager measuring one stage.
+        :param name: str - name of the stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    @contextmanager
+    def run(self, name):
+        """
+        Context manager measuring one run (public method of the module). Only the
+        outermost run of the thread is recorded.
+        :param name: str - name of the run
+        """
+        outermost = self._depth == 0
+        self._local.depth = self._depth + 1
+        if outermost:
+            with self._lock:
+                self._active += 1
+                if self._active == 1:
+                    self.stages = {}
+                    self._start_profilers()
+        start = time.perf_counter()
+        try:
+            with self.span(name):
+                yield
+        finally:
+            self._local.depth -= 1
+            if outermost:
+                with self._lock:
+                    self._active -= 1
+                    profile = self._stop_profilers() if not self._active else {}
+                    self.runs.append(
+                        dict(
+                            nazev=name,
+                            zacatek=datetime.now().isoformat(),
+                            trvani=time.perf_counter() - start,
+                            **profile
+                        )
+                    )
+
+    def _start_profilers(self):
+        if self.cprofile:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            elif hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+
+    def _stop_profilers(self):
+        result = {}
+        if self._profile is not None:
+            self._profile.disable()
+            stats = pstats.Stats(self._profile, stream=io.StringIO())
+            functions = sorted(
+                stats.stats.items(), key=lambda item: item[1][3], reverse=True
+            )
+            result["cprofile"] = [
+                {
+                    "funkce": "{}:{}({})".format(*func),
+                    "volani": calls[1],
+                    "vlastni_cas": calls[2],
+                    "kumulativni_cas": calls[3],
+                }
+                for func, calls in functions[: self.top]
+            ]
+            self._profile = None
+        if self.memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            result["pamet"] = {
+                "aktualni": current,
+                "spicka": peak,
+                "alokace": [
+                    {"misto": str(stat.traceback), "velikost": stat.size}
+                    for stat in snapshot.statistics("lineno")[: self.top]
+                ],
+            }
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+        return result
+
+    def report(self):
+        """
+        Per-stage breakdown of the processing.
+        :rtype: dict
+        """
+        with self._lock:
+            stages = {
+                name: dict(stage, prumer=stage["celkem"] / stage["pocet"])
+                for name, stage in self.stages.items()
+            }
+            runs = list(self.runs)
+        return {"faze": stages, "behy": runs}
+
+    def write_report(self, log_dir, prefix):
+        """
+        Write run report to JSON file in the log directory. The same file is
+        rewritten by following runs.
+        :param log_dir: str - path to log directory
+        :param prefix: str - prefix of the file name
+        :rtype: str - path to the report
+        """
+        if self.report_path is None or os.path.dirname(self.report_path) != log_dir:
+            self.report_path = os.path.join(
+                log_dir,
+                "{}_run_{}.json".format(
+                    prefix, datetime.now().strftime("%H_%M_%S_%d_%m_%Y")
+                ),
+            )
+        with open(self.report_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        return self.report_path
@@ -0,0 +1,256 @@
+"""
+@package base.readers
+
+@brief Streaming readers of identifiers from large input files
+
+Identifiers are yielded one by one while the file is read, so the whole
+list is never held in memory. Supported inputs are JSON object with an array
+of identifiers (or JSON array itself), JSON Lines, CSV and plain text with
+one identifier per line. Files ending with .gz are decompressed on the fly.
+
+Classes:
+ - readers::InputFormat
+
+(C) 2021 Linda Kladivova lindakladivova@gmail.com
+This library is free under the MIT License.
+"""
+
+import csv
+import gzip
+import json
+import re
+from enum import Enum
+from pathlib import Path
+
+from pywsdp.base.exceptions import WSDPError
+
+
+# Size of blocks read by the incremental JSON parser
+_BLOCK_SIZE = 1 << 16
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class InputFormat(Enum):
+    """
+    Formats of input files with identifiers.
+    """
+
+    Json = 1
+    JsonLines = 2
+    Csv = 3
+    Text = 4
+
+
+_EXTENSIONS = {
+    ".json": InputFormat.Json,
+    ".jsonl": InputFormat.JsonLines,
+    ".ndjson": InputFormat.JsonLines,
+    ".csv": InputFormat.Csv,
+}
+
+
+def detect_format(path):
+    """
+    Format of the input file by its extension (.gz is ignored), text otherwise.
+    :param path: str - path to input file
+    :rtype: InputFormat
+    """
+    suffixes = [s.lower() for s in Path(path).suffixes]
+    if suffixes and suffixes[-1] == ".gz":
+        suffixes.pop()
+    return _EXTENSIONS.get(suffixes[-1] if suffixes else "", InputFormat.Text)
+
+
+def _open(path, logger):
+    if not Path(path).exists():
+        raise WSDPError(logger, "Soubor {} nebyl nalezen!".format(path))
+    if str(path).lower().endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8-sig", newline="")
+    return open(path, encoding="utf-8-sig", newline="")
+
+
+def iter_json(path, logger, key="pOSIdent"):
+    """
+    Incrementally parse array of identifiers from JSON object {key: [...]} or from
+    JSON array. Other items of the object are skipped.
+    Raises:
+        WSDPError: invalid JSON or missing key
+    :param path: str - path to JSON file
+    :param logger: logger object (class Logger)
+    :param key: str - key of the array in the top level object
+    :rtype: generator of str
+    """
+    decoder = json.JSONDecoder()
+    with _open(path, logger) as f:
+        buffer = ""
+        position = 0
+        eof = False
+
+        def more():
+            nonlocal buffer, position, eof
+            block = f.read(_BLOCK_SIZE)
+            if not block:
+                eof = True
+                return False
+            buffer = buffer[position:] + block
+            position = 0
+            return True
+
+        def skip_whitespace():
+            nonlocal position
+            while True:
+                position = _WHITESPACE.match(buffer, position).end()
+                if position < len(buffer) or not more():
+                    return
+
+        def decode():
+            """Decode one JSON value, read more data if the value is not complete."""
+            nonlocal position
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError as exc:
+                    if eof or not more():
+                        raise WSDPError(
+                            logger, "Neplatny JSON soubor {}: {}".format(path, exc)
+                        ) from exc
+                    continue
+                if end == len(buffer) and not eof and more():
+                    # number or literal may continue in the next block
+                    continue
+                position = end
+                return value
+
+        def expect(chars):
+            nonlocal position
+            skip_whitespace()
+            if position >= len(buffer) or buffer[position] not in chars:
+                found = buffer[position : position + 20] if not eof else "konec souboru"
+                raise WSDPError(
+                    logger,
+                    "Neplatny JSON soubor {}: ocekavano {}, nalezeno {}".format(
+                        path, " nebo ".join(chars), found
+                    ),
+                )
+            position += 1
+            return buffer[position - 1]
+
+        more()
+        if expect("{[") == "{":
+            # find the key in the top level object
+            while True:
+                skip_whitespace()
+                if buffer[position : position + 1] == "}":
+                    raise WSDPError(
+                        logger, "V souboru {} chybi polozka {}".format(path, key)
+                    )
+                name = decode()
+                expect(":")
+                skip_whitespace()
+                if name == key:
+                    expect("[")
+                    break
+                decode()
+                expect(",}")
+                if buffer[position - 1] == "}":
+                    raise WSDPError(
+                        logger, "V souboru {} chybi polozka {}".format(path, key)
+                    )
+
+        skip_whitespace()
+        if buffer[position : position + 1] == "]":
+            return
+        while True:
+            skip_whitespace()
+            yield str(decode())
+            if expect(",]") == "]":
+                return
+
+
+def iter_json_lines(path, logger, key="pOSIdent"):
+    """
+    Identifiers from JSON Lines file - every line is JSON string or object with the key.
+    Raises:
+        WSDPError: invalid line
+    :rtype: generator of str
+    """
+    with _open(path, logger) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                value = json.loads(line)
+            except ValueError as exc:
+                raise WSDPError(
+                    logger, "Neplatny radek {} souboru {}: {}".format(number, path, exc)
+                ) from exc
+            if isinstance(value, dict):
+                if key not in value:
+                    raise WSDPError(
+                        logger,
+                        "Na radku {} souboru {} chybi polozka {}".format(
+                            number, path, key
+                        ),
+                    )
+                value = value[key]
+            yield str(value)
+
+
+def iter_csv(path, logger, column="pOSIdent"):
+    """
+    Identifiers from the column of CSV file with header. The name of the column
+    is case insensitive, so CSV outputs of CtiOS (column posident) can be read too.
+    The delimiter (comma, semicolon, tab) is detected from the header.
+    Raises:
+        WSDPError: missing column
+    :rtype: generator of str
+    """
+    with _open(path, logger) as f:
+        header = f.readline()
+        delimiter = max(",;\t", key=header.count)
+        names = next(csv.reader([header], delimiter=delimiter), [])
+        lowered = [name.strip().lower() for name in names]
+        if column.lower() not in lowered:
+            raise WSDPError(
+                logger,
+                "V souboru {} chybi sloupec {} (nalezeno: {})".format(
+                    path, column, ", ".join(names)
+                ),
+            )
+        index = lowered.index(column.lower())
+        for row in csv.reader(f, delimiter=delimiter):
+            if len(row) > index and row[index].strip():
+                yield row[index].strip()
+
+
+def iter_lines(path, logger):
+    """
+    Identifiers from plain text file, one per line. Empty lines and lines
+    starting with # are skipped.
+    :rtype: generator of str
+    """
+    with _open(path, logger) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+
+def iter_identifiers(path, logger, input_format=None, key="pOSIdent"):
+    """
+    Identifiers from the input file of any supported format.
+    :param path: str - path to input file
+    :param logger: logger object (class Logger)
+    :param input_format: InputFormat, detected by extension if None
+    :param key: str - key of JSON array, JSON Lines object or name of CSV column
+    :rtype: generator of str
+    """
+    input_format = input_format or detect_format(path)
+    if input_format == InputFormat.Json:
+        return iter_json(path, logger, key)
+    if input_format == InputFormat.JsonLines:
+        return iter_json_lines(path, logger, key)
+    if input_format == InputFormat.Csv:
+        return iter_csv(path, logger, key)
+    return iter_lines(path, logger)
@@ -0,0 +1,431 @@
+"""
+@package cli
+
+@brief Command-line interface for batch jobs with WSDP services
+
+Usage:
+    pywsdp ctios --db vstup.db --out vystup --format csv --workers 4
+    pywsdp ctios --input posidenty.csv.gz --out vystup
+    pywsdp cenove-udaje --params-file parametry.json --out vystup
+
+Exit codes:
+ - 0 - everything processed
+ - 1 - partial failure (some requests or reports failed)
+ - 2 - invalid arguments
+ - 3 - fatal error (e.g. connection to the service, input file)
+
+Classes:
+ - cli::Progress
+ - cli::RateLimiter
+
+(C) 2021 Linda Kladivova lindakladivova@gmail.com
+This library is free under the MIT License.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from pywsdp.base import __version__
+from pywsdp.base.exceptions import WSDPError
+from pywsdp.modules import CtiOS, GenerujCenoveUdajeDleKu
+from pywsdp.modules.CtiOS import Compression, OutputFormat
+
+EXIT_OK = 0
+EXIT_PARTIAL = 1
+EXIT_USAGE = 2
+EXIT_FATAL = 3
+
+_FORMATS = {
+    "json": OutputFormat.Json,
+    "csv": OutputFormat.Csv,
+    "db": OutputFormat.GdalDb,
+    "parquet": OutputFormat.Parquet,
+    "feather": OutputFormat.Feather,
+}
+
+_COMPRESSIONS = {
+    "gzip": Compression.Gzip,
+    "zstd": Compression.Zstd,
+    "lz4": Compression.Lz4,
+}
+
+
+class Progress:
+    """
+    Thread-safe progress of the job with rate and ETA. On terminal the line is
+    rewritten, otherwise (cron, Airflow logs) one line is written per interval.
+    """
+
+    def __init__(self, total, unit, stream=None, interval=None, enabled=True):
+        """
+        :param total: number of processed items (int), None if not known yet
+        :param unit: name of items (str)
+        :param stream: output stream, standard error output if None
+        :param interval: min time between two reports [s], 0.5 on terminal, 10 otherwise
+        :param enabled: bool - report progress at all
+        """
+        self.total = total
+        self.unit = unit
+        self.stream = stream or sys.stderr
+        self.enabled = enabled
+        self.tty = self.stream.isatty()
+        self.interval = interval if interval is not None else (0.5 if self.tty else 10)
+        self.done = 0
+        self.start = time.monotonic()
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def rate(self):
+        """Processed items per second."""
+        elapsed = time.monotonic() - self.start
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        """Estimated remaining time [s], None if not known yet."""
+        rate = self.rate()
+        if not rate or self.total is None:
+            return None
+        return (self.total - self.done) / rate
+
+    def line(self):
+        eta = self.eta()
+        if self.total is None:
+            return "{} {} | {:.1f} {}/s".format(
+                self.done, self.unit, self.rate(), self.unit
+            )
+        return "{}/{} {} ({:.0%}) | {:.1f} {}/s | ETA {}".format(
+            self.done,
+            self.total,
+            self.unit,
+            self.done / self.total if self.total else 1,
+            self.rate(),
+            self.unit,
+            "--:--:--" if eta is None else _format_time(eta),
+        )
+
+    def update(self, number=1):
+        with self._lock:
+            self.done += number
+            now = time.monotonic()
+            if self.enabled and (
+                now - self._last >= self.interval
+                or (self.total is not None and self.done >= self.total)
+            ):
+                self._last = now
+                self._write(self.line())
+
+    def _write(self, line):
+        if self.tty:
+            self.stream.write("\r" + line)
+        else:
+            self.stream.write(line + "\n")
+        self.stream.flush()
+
+    def close(self):
+        if self.enabled and self.tty:
+            self.stream.write("\n")
+            self.stream.flush()
+
+
+class RateLimiter:
+    """
+    Spread requests evenly so that at most rate requests per second are sent.
+    Can be shared by more threads.
+    """
+
+    def __init__(self, rate):
+        """
+        :param rate: max number of requests per second (float)
+        """
+        self.interval = 1.0 / rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next, now)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def _format_time(seconds):
+    seconds = int(seconds)
+    return "{:02d}:{:02d}:{:02d}".format(
+        seconds // 3600, seconds // 60 % 60, seconds % 60
+    )
+
+
+def _print_summary(summary):
+    print(json.dumps(summary, ensure_ascii=False, indent=2, default=str))
+
+
+def run_ctios(args):
+    """Subcommand ctios - personal data of posidents from SQLite database or input file."""
+    ctios = CtiOS([args.user, args.password], trial=args.trial)
+    if args.log_dir:
+        ctios.log_adresar = args.log_dir
+    ctios.logovani_posidentu = args.log_every
+    if args.db:
+        parametry = ctios.nacti_identifikatory_z_db(args.db, args.sql)
+    elif args.json:
+        parametry = ctios.nacti_identifikatory_z_json_souboru(args.json)
+    else:
+        parametry = ctios.nacti_identifikatory_ze_souboru(args.input)
+
+    klient = ctios.client
+    # the service accepts at most posidents_per_request posidents in one request
+    chunk_size = min(
+        args.chunk_size or klient.posidents_per_request, klient.posidents_per_request
+    )
+    progress = Progress(None, "posidentu", enabled=not args.quiet)
+    limiter = RateLimiter(args.rate_limit) if args.rate_limit else None
+
+    def read_chunks():
+        # the input is read lazily, duplicates are removed by the set of seen posidents
+        seen = set()
+        chunk = []
+        klient.number_of_posidents = 0
+        for posident in parametry["pOSIdent"]:
+            klient.number_of_posidents += 1
+            if posident in seen:
+                continue
+            seen.add(posident)
+            chunk.append(posident)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+        klient.number_of_posidents_final = len(seen)
+        progress.total = len(seen)
+
+    def send(chunk):
+        if limiter:
+            limiter.wait()
+        try:
+            return klient.send_chunk(chunk)
+        except WSDPError as exc:
+            return exc
+        finally:
+            progress.update(len(chunk))
+
+    slovnik = {}
+    chybne = {}
+    selhane = []
+
+    def collect(chunk, vysledek):
+        if isinstance(vysledek, WSDPError):
+            selhane.extend(chunk)
+        else:
+            slovnik.update(vysledek[0])
+            chybne.update(vysledek[1])
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        # at most two chunks per worker are submitted ahead and results are taken
+        # in the order of chunks, so outputs keep the order of input
+        pending = deque()
+        for chunk in read_chunks():
+            pending.append((chunk, executor.submit(send, chunk)))
+            if len(pending) >= 2 * args.workers:
+                chunk, future = pending.popleft()
+                collect(chunk, future.result())
+        while pending:
+            chunk, future = pending.popleft()
+            collect(chunk, future.result())
+    progress.close()
+    klient.log_statistics()
+
+    os.makedirs(args.out, exist_ok=True)
+    komprese = _COMPRESSIONS.get(args.compress)
+    vystup = ctios.uloz_vystup(slovnik, args.out, _FORMATS[args.format], komprese)
+    vystup_chybnych = ctios.uloz_vystup_chybnych(chybne, args.out, komprese)
+    vystup_selhanych = None
+    if selhane:
+        cas = datetime.now().strftime("%H_%M_%S_%d_%m_%Y")
+        vystup_selhanych = os.path.join(args.out, "ctios_failed_{}.json".format(cas))
+        with open(vystup_selhanych, "w", encoding="utf-8") as f:
+            json.dump({"pOSIdent": selhane}, f)
+    _print_summary(
+        {
+            "posidenty": klient.number_of_posidents_final,
+            "uspesne": len(slovnik),
+            "chybne": len(chybne),
+            "neodeslane": len(selhane),
+            "pozadavky": klient.number_of_requests,
+            "cas [s]": round(time.monotonic() - progress.start, 3),
+            "posidentu/s": round(progress.rate(), 1),
+            "vystup": vystup,
+            "vystup chybnych": vystup_chybnych,
+            "vystup neodeslanych": vystup_selhanych,
+        }
+    )
+    return EXIT_PARTIAL if selhane else EXIT_OK
+
+
+def run_cenove_udaje(args):
+    """Subcommand cenove-udaje - batch of reports GenerujCenoveUdajeDleKu."""
+    with open(args.params_file, encoding="utf-8") as f:
+        parametry = json.load(f)
+    if isinstance(parametry, dict):
+        parametry = [parametry]
+    modul = GenerujCenoveUdajeDleKu([args.user, args.password], trial=args.trial)
+    if args.log_dir:
+        modul.log_adresar = args.log_dir
+    if args.cache:
+        modul.cache = args.cache
+    progress = Progress(len(parametry), "sestav", enabled=not args.quiet)
+    souhrn = modul.zpracuj_davku(
+        parametry,
+        args.out,
+        max_soubeznych=args.workers,
+        interval=args.interval,
+        timeout=args.timeout,
+        smazat=not args.keep,
+        prubeh=lambda job: progress.update(),
+    )
+    progress.close()
+    del souhrn["sestavy"]
+    _print_summary(souhrn)
+    return EXIT_PARTIAL if souhrn["pocet chybnych sestav"] else EXIT_OK
+
+
+def _common_arguments(parser):
+    parser.add_argument(
+        "--user",
+        default=os.environ.get("PYWSDP_UZIVATEL"),
+        help="uzivatel WSDP (nebo promenna PYWSDP_UZIVATEL)",
+    )
+    parser.add_argument(
+        "--password",
+        default=os.environ.get("PYWSDP_HESLO"),
+        help="heslo WSDP (nebo promenna PYWSDP_HESLO)",
+    )
+    parser.add_argument("--trial", action="store_true", help="testovaci sluzby WSDP")
+    parser.add_argument("--out", required=True, help="vystupni adresar")
+    parser.add_argument(
+        "--workers", type=_positive(int), default=4, help="pocet soubeznych pozadavku"
+    )
+    parser.add_argument("--log-dir", help="logovaci adresar")
+    parser.add_argument(
+        "--quiet", action="store_true", help="nevypisovat prubeh zpracovani"
+    )
+
+
+def _positive(type_):
+    def convert(value):
+        value = type_(value)
+        if value <= 0:
+            raise argparse.ArgumentTypeError("hodnota musi byt kladna")
+        return value
+
+    return convert
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        prog="pywsdp", description="Davkove zpracovani sluzeb WSDP"
+    )
+    parser.add_argument("--version", action="version", version=__version__)
+    subparsers = parser.add_subparsers(dest="prikaz", required=True)
+
+    ctios = subparsers.add_parser(
+        "ctios", help="osobni udaje k POSIdentum (sluzba ctiOS)"
+    )
+    vstup = ctios.add_mutually_exclusive_group(required=True)
+    vstup.add_argument("--db", help="SQLite databaze vytvorena z VFK souboru")
+    vstup.add_argument("--json", help="JSON soubor s POSIdenty")
+    vstup.add_argument(
+        "--input",
+        help="soubor s POSIdenty cteny proudove (json, jsonl, csv, txt, i .gz)",
+    )
+    ctios.add_argument("--sql", help="SQL dotaz omezujici POSIdenty z databaze")
+    ctios.add_argument(
+        "--format", choices=sorted(_FORMATS), default="json", help="vystupni format"
+    )
+    ctios.add_argument(
+        "--compress",
+        choices=sorted(_COMPRESSIONS),
+        help="komprese vystupu json a csv a souboru chybnych POSIdentu",
+    )
+    ctios.add_argument(
+        "--chunk-size",
+        type=_positive(int),
+        help="pocet POSIdentu v jednom pozadavku (implicitne a nejvyse 10)",
+    )
+    ctios.add_argument(
+        "--rate-limit",
+        type=_positive(float),
+        help="maximalni pocet pozadavku za sekundu",
+    )
+    ctios.add_argument(
+        "--log-every",
+        type=int,
+        default=1,
+        help="logovat kazdy n-ty POSIdent (0 = pouze souhrny odpovedi)",
+    )
+    _common_arguments(ctios)
+    ctios.set_defaults(func=run_ctios)
+
+    cenove_udaje = subparsers.add_parser(
+        "cenove-udaje", help="sestavy cenovych udaju (GenerujCenoveUdajeDleKu)"
+    )
+    cenove_udaje.add_argument(
+        "--params-file",
+        required=True,
+        help="JSON soubor s parametry sestavy nebo seznamem parametru sestav",
+    )
+    cenove_udaje.add_argument(
+        "--interval",
+        type=_positive(float),
+        default=1.0,
+        help="pocatecni interval dotazu na stav sestavy [s]",
+    )
+    cenove_udaje.add_argument(
+        "--timeout",
+        type=_positive(float),
+        default=3600.0,
+        help="maximalni doba generovani sestavy [s]",
+    )
+    cenove_udaje.add_argument(
+        "--keep", action="store_true", help="nemazat sestavy z uctu po stazeni"
+    )
+    cenove_udaje.add_argument("--cache", help="adresar cache sestav")
+    _common_arguments(cenove_udaje)
+    cenove_udaje.set_defaults(func=run_cenove_udaje)
+    return parser
+
+
+def main(argv=None):
+    parser = create_parser()
+    args = parser.parse_args(argv)
+    if not args.user or not args.password:
+        # exits with EXIT_USAGE
+        parser.error(
+            "chybi prihlasovaci udaje (--user a --password "
+            "nebo promenne PYWSDP_UZIVATEL a PYWSDP_HESLO)"
+        )
+    if getattr(args, "compress", None) and args.format not in ("json", "csv"):
+        parser.error("--compress lze pouzit pouze s formatem json nebo csv")
+    if getattr(args, "format", None) == "db" and not args.db:
+        parser.error("format db lze pouzit pouze se vstupem --db")
+    try:
+        return args.func(args)
+    except WSDPError as exc:
+        print(exc.args[-1], file=sys.stderr)
+        return EXIT_FATAL
+    except (OSError, ValueError) as exc:
+        print(exc, file=sys.stderr)
+        return EXIT_FATAL
+
+
+if __name__ == "__main__":
+    sys.exit(main())
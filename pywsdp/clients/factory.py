@@ -16,23 +16,32 @@ Classes:
 This library is free under the MIT License.
 """
 
-import math
+import os
+import time
+import threading
 from abc import ABC, abstractmethod
+from itertools import islice
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from lxml import etree
 from zeep import Client, Settings, helpers
 from zeep.cache import SqliteCache
-from zeep.transports import Transport
 from zeep.wsse.username import UsernameToken
 from zeep.plugins import HistoryPlugin
+from zeep.wsdl.bindings import Soap12Binding
 
-from pywsdp.base.exceptions import WSDPRequestError
+from pywsdp.base.exceptions import WSDPRequestError, WSDPResponseError
+from pywsdp.base.metrics import metrics
+from pywsdp.base.profiling import Tracer
+from pywsdp.clients.transports import MetricsTransport, operation_name
 from pywsdp.clients.helpers.ctiOS import DictEditor as CtiOSDict
-from pywsdp.clients.helpers.ctiOS import Counter
+from pywsdp.clients.helpers.ctiOS import Counter, HedgingPolicy, PosidentValidator
 from pywsdp.clients.helpers.generujCenoveUdajeDleKu import (
     DictEditor as SestavyDict,
+    ReportStreamTarget,
 )
 
 
-transport = Transport(cache=SqliteCache())
+transport = MetricsTransport(cache=SqliteCache(), metrics=metrics)
 settings = Settings(raw_response=False, strict=False, xml_huge_tree=True)
 settings = Settings(strict=False, xml_huge_tree=True)
 history = HistoryPlugin()
@@ -50,11 +59,49 @@ _prodWsdls = {
 }
 
 
+def set_wsdls(wsdls, trial=True):
+    """
+    Override WSDL endpoints of service groups (eg. local mock server).
+    :param wsdls: dict - service group (ctios, sestavy): link to wsdl document
+    :param trial: bool - override trial (True) or production (False) endpoints
+    :rtype: dict - previous endpoints of the overridden groups
+    """
+    endpoints = _trialWsdls if trial else _prodWsdls
+    previous = {group: endpoints.get(group) for group in wsdls}
+    endpoints.update(wsdls)
+    return previous
+
+
+def get_wsdls(trial=True):
+    """
+    Current WSDL endpoints of service groups.
+    :param trial: bool - trial (True) or production (False) endpoints
+    :rtype: dict - service group: link to wsdl document
+    """
+    return dict(_trialWsdls if trial else _prodWsdls)
+
+
+def set_transport(new_transport):
+    """
+    Set transport used by clients created afterwards (eg. RecordingTransport
+    or ReplayTransport).
+    :param new_transport: zeep transport
+    :rtype: previous transport
+    """
+    global transport
+    previous = transport
+    transport = new_transport
+    return previous
+
+
 class WSDPClient(ABC):
     """
     Abstract class creating interface for all WSDP clients.
     """
 
+    def __init__(self):
+        self.tracer = Tracer()  # Measures stages of request processing
+
     @classmethod
     def from_recipe(cls, wsdl, service_name, creds, logger, trial):
         """
@@ -88,6 +135,7 @@ class WSDPClient(ABC):
         result.service_name = service_name
         result.logger = logger
         result.creds = creds
+        result.metrics = metrics
         return result
 
     @abstractmethod
@@ -124,6 +172,12 @@ class ClientFactory:
 
 pywsdp = ClientFactory()
 
+# Max number of threads sending hedged ctiOS requests of one client
+_HEDGE_WORKERS = 32
+
+# Number of posidents read at once from the iterable input of ctiOS client
+_STREAM_BLOCK = 1000
+
 
 @pywsdp.register
 class CtiOsClient(WSDPClient):
@@ -139,17 +193,28 @@ class CtiOsClient(WSDPClient):
         self.posidents_per_request = 10  # Set max number of posidents per request
         self.number_of_posidents = 0
         self.number_of_posidents_final = 0
+        self.number_of_requests = 0
         self.response_xml = []
         self.counter = Counter()  # Counts statistics
+        self.log_every = 1  # Log every n-th posident (0 = only summaries)
+        self.validator = PosidentValidator()  # Local check of posidents (None = off)
+        self.hedging = None  # HedgingPolicy of duplicate requests (None = off)
+        self._hedge_executor = None
+        self._lock = threading.Lock()  # Guards statistics of concurrent requests
 
-    def send_request(self, dictionary):
+    def send_request(self, dictionary, collector=None):
         """
         Send the request in the form of dictionary and get the response.
         Raises:
             WSDPRequestError: Zeep library request error
-        :param dictionary: input service attributes
+        :param dictionary: input service attributes, pOSIdent can be a list
+            or any iterable (e.g. generator reading the input file)
+        :param collector: callable receiving results of every chunk (dict), results
+            are not merged to the returned dictionary then
         :rtype: tuple (dict - xml response, dict - errorneous posidents)
         """
+        if not isinstance(dictionary["pOSIdent"], (list, tuple)):
+            return self._send_stream(dictionary["pOSIdent"], collector)
 
         def create_chunks(lst, chunk_size):
             """ "Create n-sized chunks from list as a generator"""
@@ -163,83 +228,255 @@ class CtiOsClient(WSDPClient):
         posidents = list(dict.fromkeys(dictionary["pOSIdent"]))
         self.number_of_posidents_final = len(posidents)
 
+        # invalid posidents are not sent to the service
+        valid, dictionary_errors = self._validate(posidents)
+
         # create chunks
-        chunks = create_chunks(posidents, self.posidents_per_request)
+        chunks = create_chunks(valid, self.posidents_per_request)
 
         # process posident chunks and return xml response as the dict
         dictionary = {}
-        dictionary_errors = {}
         for chunk in chunks:
-            partial_dictionary = {}
-            partial_dictionary_errors = {}
-            try:
-                vysledek = self.client.service.ctios(pOSIdent=chunk)
-                partial_dictionary, partial_dictionary_errors = CtiOSDict()(
-                    helpers.serialize_object(vysledek, dict), self.counter, self.logger
-                )
-            except Exception as exc:
-                raise WSDPRequestError(self.logger, exc) from exc
+            partial_dictionary, partial_dictionary_errors = self._process_chunk(chunk)
+            if collector is None:
+                dictionary.update(partial_dictionary)
+            else:
+                collector(partial_dictionary)
+            dictionary_errors.update(partial_dictionary_errors)
+        self.metrics.publish()
+        if len(valid) < len(posidents):
+            # keep the order of input posidents
+            dictionary_errors = {
+                p: dictionary_errors[p] for p in posidents if p in dictionary_errors
+            }
+        return dictionary, dictionary_errors
 
-            dictionary = {**dictionary, **partial_dictionary}
-            dictionary_errors = {**dictionary_errors, **partial_dictionary_errors}
+    def _send_stream(self, posidents, collector=None):
+        """
+        Send posidents read lazily from the iterable. Posidents are read by blocks,
+        duplicates are removed by the set of already seen posidents and full chunks
+        are sent as soon as they are ready.
+        Raises:
+            WSDPRequestError: Zeep library request error
+        :param posidents: iterable of posidents
+        :param collector: see send_request
+        :rtype: tuple (dict - xml response, dict - errorneous posidents)
+        """
+        self.number_of_posidents = 0
+        self.number_of_posidents_final = 0
+        seen = set()
+        pending = []
+        dictionary = {}
+        dictionary_errors = {}
+        chunk_size = max(1, self.posidents_per_request)
+        posidents = iter(posidents)
+
+        def send(chunk):
+            partial_dictionary, partial_dictionary_errors = self._process_chunk(chunk)
+            if collector is None:
+                dictionary.update(partial_dictionary)
+            else:
+                collector(partial_dictionary)
+            dictionary_errors.update(partial_dictionary_errors)
+
+        while True:
+            block = list(islice(posidents, _STREAM_BLOCK))
+            if not block:
+                break
+            self.number_of_posidents += len(block)
+            unique = []
+            for posident in block:
+                if posident not in seen:
+                    seen.add(posident)
+                    unique.append(posident)
+            self.number_of_posidents_final += len(unique)
+            valid, invalid_errors = self._validate(unique)
+            dictionary_errors.update(invalid_errors)
+            pending.extend(valid)
+            full = len(pending) - len(pending) % chunk_size
+            for i in range(0, full, chunk_size):
+                send(pending[i : i + chunk_size])
+            del pending[:full]
+        if pending:
+            send(pending)
+        self.metrics.publish()
+        return dictionary, dictionary_errors
+
+    def send_chunk(self, chunk):
+        """
+        Send one request with at most posidents_per_request posidents.
+        Can be called from more threads at once.
+        Raises:
+            WSDPRequestError: Zeep library request error
+        :param chunk: list of posidents
+        :rtype: tuple (dict - xml response, dict - errorneous posidents)
+        """
+        valid, dictionary_errors = self._validate(chunk)
+        dictionary = {}
+        if valid:
+            dictionary, partial_dictionary_errors = self._process_chunk(valid)
+            dictionary_errors.update(partial_dictionary_errors)
+        self.metrics.publish()
         return dictionary, dictionary_errors
 
+    def _validate(self, posidents):
+        """
+        Check posidents locally, invalid posidents are counted as NEPLATNY_IDENTIFIKATOR.
+        :param posidents: list of posidents
+        :rtype: tuple (list - posidents to be sent, dict - errorneous posidents)
+        """
+        if self.validator is None:
+            return posidents, {}
+        valid, invalid = self.validator(posidents)
+        if not invalid:
+            return valid, {}
+        chyba = "NEPLATNY_IDENTIFIKATOR"
+        with self._lock:
+            for posident in invalid:
+                self.counter.add_neplatny_identifikator()
+        if self.log_every == 1:
+            for posident in invalid:
+                self.logger.info(
+                    "POSIDENT %s NEPLATNY IDENTIFIKATOR (LOKALNI KONTROLA)", posident
+                )
+        else:
+            self.logger.info(
+                "LOKALNI KONTROLOU VYRAZENO %s NEPLATNYCH POSIDENTU", len(invalid)
+            )
+        self.metrics.add_posidents(self.service_name, len(invalid))
+        for posident in invalid:
+            self.metrics.add_error(self.service_name, chyba)
+        return valid, dict.fromkeys(invalid, chyba)
+
+    def _process_chunk(self, chunk):
+        """
+        Send one request with the chunk of posidents and process the response.
+        Raises:
+            WSDPRequestError: Zeep library request error
+        :param chunk: list of posidents
+        :rtype: tuple (dict - xml response, dict - errorneous posidents)
+        """
+        try:
+            with self._lock:
+                self.number_of_requests += 1
+            with self.tracer.span("soap"):
+                if self.hedging is None:
+                    vysledek = self.client.service.ctios(pOSIdent=chunk)
+                else:
+                    vysledek = self._call_hedged(chunk)
+            with self.tracer.span("serialize_object"):
+                serializovany = helpers.serialize_object(vysledek, dict)
+            with self.tracer.span("DictEditor"), self._lock:
+                partial_dictionary, partial_dictionary_errors = CtiOSDict(
+                    self.log_every
+                )(serializovany, self.counter, self.logger)
+        except Exception as exc:
+            raise WSDPRequestError(self.logger, exc) from exc
+
+        self.metrics.add_posidents(self.service_name, len(chunk))
+        for chyba in partial_dictionary_errors.values():
+            self.metrics.add_error(self.service_name, chyba)
+        return partial_dictionary, partial_dictionary_errors
+
+    def _call_hedged(self, chunk):
+        """
+        Call the service, the request slower than the hedging policy allows is
+        sent once more and the first successful response wins. Only the winning
+        response is processed.
+        :param chunk: list of posidents
+        :rtype: zeep response object
+        """
+        policy = self.hedging
+        with self._lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(
+                    max_workers=_HEDGE_WORKERS, thread_name_prefix="pywsdp-hedge"
+                )
+        executor = self._hedge_executor
+        start = time.monotonic()
+        delay = policy.delay()
+        primary = executor.submit(self.client.service.ctios, pOSIdent=chunk)
+        primary.add_done_callback(
+            lambda future: policy.observe(time.monotonic() - start)
+        )
+        if not wait([primary], timeout=delay).done and policy.try_hedge():
+            self.metrics.add_hedge(self.service_name)
+            self.metrics.add_retry(self.service_name)
+            self.logger.info(
+                "Pozadavek trva dele nez %.3f s, odeslan duplicitni pozadavek", delay
+            )
+            hedge = executor.submit(self.client.service.ctios, pOSIdent=chunk)
+            pending = {primary, hedge}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                winners = [f for f in done if f.exception() is None]
+                if winners:
+                    if primary not in winners:
+                        won = time.monotonic()
+                        policy.add_win()
+                        primary.add_done_callback(
+                            lambda future: policy.add_saved(time.monotonic() - won)
+                        )
+                    return winners[0].result()
+        return primary.result()
+
     def print_statistics(self):
         """
         Print statistics of the process to the standard output device.
         """
-        print(
-            {
-                "celkovy pocet identifikatoru na vstupu": self.number_of_posidents,
-                "pocet odstranenych duplicit": self.number_of_posidents
-                - self.number_of_posidents_final,
-                "pocet dotazu na server": math.ceil(
-                    self.number_of_posidents_final / self.posidents_per_request
-                ),
-                "pocet uspesne zpracovanych identifikatoru": self.counter.uspesne_stazeno,
-                "pocet neplatnych identifikatoru": self.counter.neplatny_identifikator,
-                "pocet expirovanych identifikatoru": self.counter.expirovany_identifikator,
-                "pocet identifikatoru k neexistujicim OS": self.counter.opravneny_subjekt_neexistuje,
-            }
-        )
+        statistics = {
+            "celkovy pocet identifikatoru na vstupu": self.number_of_posidents,
+            "pocet odstranenych duplicit": self.number_of_posidents
+            - self.number_of_posidents_final,
+            "pocet dotazu na server": self.number_of_requests,
+            "pocet uspesne zpracovanych identifikatoru": self.counter.uspesne_stazeno,
+            "pocet neplatnych identifikatoru": self.counter.neplatny_identifikator,
+            "pocet expirovanych identifikatoru": self.counter.expirovany_identifikator,
+            "pocet identifikatoru k neexistujicim OS": self.counter.opravneny_subjekt_neexistuje,
+        }
+        if self.hedging is not None:
+            statistics["zdvojovani pozadavku"] = self.hedging.statistics()
+        print(statistics)
 
     def log_statistics(self):
         """Log statistics of the process to the log file."""
         self.logger.info(
-            "Celkovy pocet dotazovanych identifikatoru na vstupu: {}".format(
-                self.number_of_posidents
-            )
+            "Celkovy pocet dotazovanych identifikatoru na vstupu: %s",
+            self.number_of_posidents,
         )
         self.logger.info(
-            "Pocet odstranenych duplicitnich identifikatoru: {}".format(
-                self.number_of_posidents - self.number_of_posidents_final
-            )
+            "Pocet odstranenych duplicitnich identifikatoru: %s",
+            self.number_of_posidents - self.number_of_posidents_final,
         )
         self.logger.info(
-            "Pocet pozadavku, do kterych byl dotaz rozdelen (pocet dotazu na server): {}".format(
-                math.ceil(self.number_of_posidents_final / self.posidents_per_request)
-            )
+            "Pocet pozadavku, do kterych byl dotaz rozdelen (pocet dotazu na server): %s",
+            self.number_of_requests,
         )
         self.logger.info(
-            "Realny uspesne zpracovanych identifikatoru: {}".format(
-                self.counter.uspesne_stazeno
-            )
+            "Realny uspesne zpracovanych identifikatoru: %s",
+            self.counter.uspesne_stazeno,
         )
         self.logger.info(
-            "Pocet neplatnych identifikatoru: {}".format(
-                self.counter.neplatny_identifikator
-            )
+            "Pocet neplatnych identifikatoru: %s", self.counter.neplatny_identifikator
         )
         self.logger.info(
-            "Pocet expirovanych identifikatoru: {}".format(
-                self.counter.expirovany_identifikator
-            )
+            "Pocet expirovanych identifikatoru: %s",
+            self.counter.expirovany_identifikator,
         )
         self.logger.info(
-            "Pocet identifikatoru k neexistujicim OS: {}".format(
-                self.counter.opravneny_subjekt_neexistuje
-            )
+            "Pocet identifikatoru k neexistujicim OS: %s",
+            self.counter.opravneny_subjekt_neexistuje,
         )
+        if self.hedging is not None:
+            hedging = self.hedging.statistics()
+            self.logger.info(
+                "Pocet zdvojenych pozadavku: %s (%.1f %% pozadavku), "
+                "z toho rychlejsich nez puvodni pozadavek: %s, usetreny cas: %s s",
+                hedging["zdvojene"],
+                100 * hedging["podil zdvojenych"],
+                hedging["vyhry zdvojenych"],
+                hedging["usetreny cas [s]"],
+            )
 
 
 @pywsdp.register
@@ -299,6 +536,23 @@ class SeznamSestavClient(WSDPClient):
         except Exception as exc:
             raise WSDPRequestError(self.logger, exc) from exc
 
+    def list_reports(self):
+        """
+        Send the request without id and get all reports on the account.
+        Raises:
+            WSDPRequestError: Zeep library request error
+        :rtype: list of dicts
+        """
+        try:
+            zeep_object = self.client.service.seznamSestav()
+            return SestavyDict()(
+                helpers.serialize_object(zeep_object, dict),
+                self.logger,
+                all_reports=True,
+            )
+        except Exception as exc:
+            raise WSDPRequestError(self.logger, exc) from exc
+
 
 @pywsdp.register
 class VratSestavuClient(WSDPClient):
@@ -325,6 +579,109 @@ class VratSestavuClient(WSDPClient):
         except Exception as exc:
             raise WSDPRequestError(self.logger, exc) from exc
 
+    def send_request_to_file(self, id_sestavy, file_path, block_size=1024 * 1024):
+        """
+        Send the request on specific id and decode the report file from the response
+        straight to disk while the response is being downloaded and parsed.
+        Raises:
+            WSDPRequestError: HTTP request error
+            WSDPResponseError: SOAP fault or missing report file in the response
+        :param id_sestavy: id (number)
+        :param file_path: str - path to the output file
+        :param block_size: int - size of downloaded and decoded blocks
+        :rtype: dict - report info without souborSestavy
+        """
+        start = time.perf_counter()
+        service = self.service_name
+        try:
+            port = self._port()
+            operation = port.binding.get("vratSestavu")
+            envelope = self.client.create_message(
+                self.client.service, "vratSestavu", idSestavy=id_sestavy
+            )
+            service = operation_name(envelope)
+            message = etree.tostring(envelope)
+            response = self.client.transport.post_stream(
+                port.binding_options["address"],
+                message,
+                self._http_headers(operation),
+            )
+        except Exception as exc:
+            self.metrics.add_error(service, exc.__class__.__name__)
+            raise WSDPRequestError(self.logger, exc) from exc
+
+        tmp_path = file_path + ".part"
+        received = 0
+        try:
+            with response, open(tmp_path, "wb") as f:
+                target = ReportStreamTarget(
+                    f, block_size, self._report_types(operation)
+                )
+                parser = etree.XMLParser(target=target, huge_tree=True)
+                for block in response.iter_content(block_size):
+                    received += len(block)
+                    parser.feed(block)
+                report = parser.close()
+            if target.fault or not target.found:
+                raise WSDPResponseError(
+                    self.logger,
+                    target.fault
+                    or target.zprava
+                    or "Odpoved neobsahuje soubor sestavy",
+                )
+            os.replace(tmp_path, file_path)
+        except WSDPResponseError:
+            self.metrics.add_error(service, "WSDPResponseError")
+            raise
+        except Exception as exc:
+            self.metrics.add_error(service, exc.__class__.__name__)
+            raise WSDPResponseError(self.logger, exc) from exc
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self.metrics.observe_request(
+                service, time.perf_counter() - start, len(message), received
+            )
+        self.logger.info(" ")
+        self.logger.info(target.zprava)
+        return SestavyDict()._edit_report(report)
+
+    def _port(self):
+        """WSDL port of the default service (the port bound to client.service)."""
+        service = next(iter(self.client.wsdl.services.values()))
+        return next(iter(service.ports.values()))
+
+    def _http_headers(self, operation):
+        """HTTP headers of the SOAP request of the operation."""
+        if isinstance(operation.binding, Soap12Binding):
+            headers = {
+                "Content-Type": 'application/soap+xml; charset=utf-8; action="{}"'.format(
+                    operation.soapaction
+                )
+            }
+        else:
+            headers = {
+                "Content-Type": "text/xml; charset=utf-8",
+                "SOAPAction": '"{}"'.format(operation.soapaction or ""),
+            }
+        headers.update(self.client.settings.extra_http_headers or {})
+        return headers
+
+    @staticmethod
+    def _report_types(operation):
+        """
+        Schema types of the report elements in the response of the operation, so values
+        of the streamed report have the same types as in the zeep response.
+        :rtype: dict - element name: xsd type
+        """
+        elements = [operation.output.body]
+        while elements:
+            element = elements.pop()
+            if element.name == "report":
+                return {name: child.type for name, child in element.type.elements}
+            elements.extend(child for _, child in getattr(element.type, "elements", []))
+        return {}
+
 
 @pywsdp.register
 class SmazSestavuClient(WSDPClient):
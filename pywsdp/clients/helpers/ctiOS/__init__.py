@@ -6,15 +6,34 @@
 Classes:
  - helpers::DictEditor
  - helpers::Counter
+ - helpers::PosidentValidator
+ - helpers::HedgingPolicy
 
 (C) 2021 Linda Kladivova lindakladivova@gmail.com
 This library is free under the MIT License.
 """
 
+import re
+import threading
+from collections import deque
+
 
 class DictEditor:
     """Class processing ctiOS dict response."""
 
+    def __init__(self, log_every=1):
+        """
+        :param log_every: int - log every n-th posident (1 = every posident,
+            0 = only summary of the response)
+        """
+        self.log_every = log_every
+
+    def _log_posident(self, counter):
+        """Decide if the next posident is logged (sampling by the number of processed)."""
+        if self.log_every == 1:
+            return True
+        return self.log_every > 1 and counter.processed() % self.log_every == 0
+
     def __call__(self, input_dict, counter, logger):
         """
         Process dictionary for output.
@@ -33,19 +52,23 @@ class DictEditor:
         dictionary_errors = {}
         posident_list = input_dict["osList"]["os"]
 
+        errors = {}
         for identifikator in posident_list:
             posident = identifikator["pOSIdent"]
+            log = self._log_posident(counter)
             if identifikator["chybaPOSIdent"]:
                 chyba_posident = identifikator["chybaPOSIdent"]
+                errors[chyba_posident] = errors.get(chyba_posident, 0) + 1
                 if chyba_posident == "NEPLATNY_IDENTIFIKATOR":
                     counter.add_neplatny_identifikator()
                 elif chyba_posident == "EXPIROVANY_IDENTIFIKATOR":
                     counter.add_expirovany_identifikator()
                 elif chyba_posident == "OPRAVNENY_SUBJEKT_NEEXISTUJE":
                     counter.add_opravneny_subjekt_neexistuje()
-                logger.info(
-                    "POSIDENT {} {}".format(posident, chyba_posident.replace("_", " "))
-                )
+                if log:
+                    logger.info(
+                        "POSIDENT %s %s", posident, chyba_posident.replace("_", " ")
+                    )
                 dictionary_errors[posident] = chyba_posident
             else:
                 os_detail = identifikator["osDetail"][0]
@@ -59,8 +82,19 @@ class DictEditor:
                         "%Y-%m-%dT%H:%M:%S"
                     )
                 counter.add_uspesne_stazeno()
-                logger.info("POSIDENT {} USPESNE STAZEN".format(posident))
+                if log:
+                    logger.info("POSIDENT %s USPESNE STAZEN", posident)
                 dictionary[posident] = os_detail
+        if self.log_every != 1:
+            logger.info(
+                "ZPRACOVANO %s POSIDENTU, USPESNE STAZENO %s%s",
+                len(posident_list),
+                len(dictionary),
+                "".join(
+                    ", {} {}".format(chyba.replace("_", " "), pocet)
+                    for chyba, pocet in errors.items()
+                ),
+            )
         return dictionary, dictionary_errors
 
 
@@ -89,3 +123,153 @@ class Counter:
 
     def add_uspesne_stazeno(self):
         self.uspesne_stazeno += 1
+
+    def add_error(self, chyba):
+        """Count posident error by its type (value of chybaPOSIdent)."""
+        if chyba == "NEPLATNY_IDENTIFIKATOR":
+            self.add_neplatny_identifikator()
+        elif chyba == "EXPIROVANY_IDENTIFIKATOR":
+            self.add_expirovany_identifikator()
+        elif chyba == "OPRAVNENY_SUBJEKT_NEEXISTUJE":
+            self.add_opravneny_subjekt_neexistuje()
+
+    def processed(self):
+        """Number of processed posidents."""
+        return (
+            self.neplatny_identifikator
+            + self.expirovany_identifikator
+            + self.opravneny_subjekt_neexistuje
+            + self.uspesne_stazeno
+        )
+
+
+class PosidentValidator:
+    """
+    Local check of posidents before sending them to the service. Posident is
+    base64 encoded pseudonymized identifier, so it has to consist of base64
+    alphabet, have correct padding and decode to one of the known lengths.
+    Missing padding is accepted, the service accepts it too.
+    """
+
+    # Decoded lengths of valid posidents (e.g. tests/data/input/ctios_template.json)
+    DECODED_LENGTHS = (80, 96)
+
+    def __init__(self, decoded_lengths=DECODED_LENGTHS):
+        """
+        :param decoded_lengths: accepted lengths of decoded posidents (bytes)
+        """
+        patterns = []
+        for length in decoded_lengths:
+            chars = -(-length * 4 // 3)  # number of base64 chars without padding
+            padding = -chars % 4
+            patterns.append(
+                "[A-Za-z0-9+/]{{{}}}{}".format(
+                    chars, "={{0,{}}}".format(padding) if padding else ""
+                )
+            )
+        self._pattern = re.compile("|".join(patterns))
+
+    def __call__(self, posidents):
+        """
+        Split posidents to possibly valid and invalid ones. The whole list is checked
+        by one compiled regular expression, the order of posidents is kept.
+        :param posidents: list of posidents
+        :rtype: tuple (list - possibly valid posidents, list - invalid posidents)
+        """
+        matches = list(map(self._pattern.fullmatch, posidents))
+        valid = [p for p, match in zip(posidents, matches) if match]
+        if len(valid) == len(posidents):
+            return posidents, []
+        invalid = [p for p, match in zip(posidents, matches) if not match]
+        return valid, invalid
+
+
+class HedgingPolicy:
+    """
+    Policy of hedged requests. When the request takes longer than the given
+    percentile of latencies observed so far, a duplicate request is sent and
+    the first response wins. Extra load is capped by max_extra - the share
+    of duplicated requests among all requests.
+    """
+
+    def __init__(
+        self,
+        percentile=0.95,
+        max_extra=0.05,
+        min_samples=20,
+        min_delay=0.0,
+        window=1000,
+    ):
+        """
+        :param percentile: percentile of observed latencies after which the request
+            is duplicated (float 0-1)
+        :param max_extra: max share of duplicated requests (float 0-1)
+        :param min_samples: number of observed latencies before the first duplicate (int)
+        :param min_delay: min time before the request is duplicated [s] (float)
+        :param window: number of the last latencies the percentile is computed from (int)
+        """
+        self.percentile = percentile
+        self.max_extra = max_extra
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.saved = 0.0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        """
+        Time after which the running request is duplicated.
+        :rtype: float [s], None when there are not enough observed latencies
+        """
+        with self._lock:
+            self.requests += 1
+            if len(self._latencies) < max(1, self.min_samples):
+                return None
+            ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(self.percentile * len(ordered)))
+        return max(self.min_delay, ordered[index])
+
+    def observe(self, latency):
+        """Record latency of the original (not duplicated) request."""
+        with self._lock:
+            self._latencies.append(latency)
+
+    def try_hedge(self):
+        """
+        Reserve one duplicate request if the cap of extra load allows it.
+        :rtype: bool
+        """
+        with self._lock:
+            if self.hedges + 1 > self.max_extra * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def add_win(self):
+        """Record the duplicate request answered before the original one."""
+        with self._lock:
+            self.hedge_wins += 1
+
+    def add_saved(self, seconds):
+        """Record time saved by the duplicate request."""
+        with self._lock:
+            self.saved += seconds
+
+    def statistics(self):
+        """
+        Statistics of hedging.
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                "pozadavky": self.requests,
+                "zdvojene": self.hedges,
+                "podil zdvojenych": self.hedges / self.requests
+                if self.requests
+                else 0.0,
+                "vyhry zdvojenych": self.hedge_wins,
+                "usetreny cas [s]": round(self.saved, 3),
+            }
@@ -5,41 +5,178 @@
 
 Classes:
  - helpers::DictEditor
+ - helpers::Base64StreamDecoder
+ - helpers::ReportStreamTarget
 
 (C) 2021 Linda Kladivova lindakladivova@gmail.com
 This library is free under the MIT License.
 """
 
+import re
+import base64
+
+# Characters ignored in base64 text (same as base64.b64decode without validation)
+_NON_ALPHABET = re.compile(rb"[^A-Za-z0-9+/=]+")
+
 
 class DictEditor:
     """Class processing Sestavy dict response."""
 
-    def __call__(self, input_dict, logger):
+    def __call__(self, input_dict, logger, all_reports=False):
         """
         Process dictionary for output.
 
         :param input_dict: input dictioonary gained from zeep object
         :param logger: logging class (WSDPLogger)
+        :param all_reports: return list of all reports instead of the first one
         :rtype: dict: successfully processed attributes (nested dictonary))
         """
         akce = input_dict["vysledek"]["zprava"][0]["_value_1"]
         logger.info(" ")
         logger.info(akce)
 
+        if all_reports:
+            if not input_dict["reportList"]:
+                return []
+            return [self._edit_report(r) for r in input_dict["reportList"]["report"]]
+
         if input_dict["reportList"]:
-            report = input_dict["reportList"]["report"][0]
-
-            if report["datumPozadavku"]:
-                report["datumPozadavku"] = report["datumPozadavku"].strftime(
-                    "%Y-%m-%dT%H:%M:%S"
-                )
-            if report["datumSpusteni"]:
-                report["datumSpusteni"] = report["datumSpusteni"].strftime(
-                    "%Y-%m-%dT%H:%M:%S"
-                )
-            if report["datumVytvoreni"]:
-                report["datumVytvoreni"] = report["datumVytvoreni"].strftime(
-                    "%Y-%m-%dT%H:%M:%S"
-                )
-            return report
+            return self._edit_report(input_dict["reportList"]["report"][0])
         return {"zprava": akce}
+
+    def _edit_report(self, report):
+        """
+        Convert dates of the report to strings.
+
+        :param report: dict - one report from the report list
+        :rtype: dict
+        """
+        if report["datumPozadavku"]:
+            report["datumPozadavku"] = report["datumPozadavku"].strftime(
+                "%Y-%m-%dT%H:%M:%S"
+            )
+        if report["datumSpusteni"]:
+            report["datumSpusteni"] = report["datumSpusteni"].strftime(
+                "%Y-%m-%dT%H:%M:%S"
+            )
+        if report["datumVytvoreni"]:
+            report["datumVytvoreni"] = report["datumVytvoreni"].strftime(
+                "%Y-%m-%dT%H:%M:%S"
+            )
+        return report
+
+
+class Base64StreamDecoder:
+    """
+    Decode base64 text written in arbitrary pieces and write the binary
+    data to a file object block by block.
+    """
+
+    def __init__(self, output, block_size=1024 * 1024):
+        """
+        :param output: binary file object
+        :param block_size: int - number of base64 characters decoded at once
+        """
+        self.output = output
+        self.block_size = max(4, block_size - block_size % 4)
+        self.carry = b""
+        self.bytes_written = 0
+
+    def write(self, text):
+        """
+        Decode the next piece of base64 text. Characters out of base64 alphabet are ignored.
+        Raises:
+            binascii.Error: invalid base64 data
+        :param text: str or bytes - piece of base64 text
+        """
+        if isinstance(text, str):
+            text = text.encode("ascii")
+        data = self.carry + _NON_ALPHABET.sub(b"", text)
+        complete = len(data) - len(data) % 4
+        for start in range(0, complete, self.block_size):
+            end = min(start + self.block_size, complete)
+            binary = base64.b64decode(data[start:end], validate=True)
+            self.output.write(binary)
+            self.bytes_written += len(binary)
+        self.carry = data[complete:]
+
+    def close(self):
+        """
+        Decode rest of the data.
+        Raises:
+            binascii.Error: truncated base64 data
+        """
+        if self.carry:
+            binary = base64.b64decode(self.carry + b"=" * (-len(self.carry) % 4))
+            self.output.write(binary)
+            self.bytes_written += len(binary)
+            self.carry = b""
+
+
+class ReportStreamTarget:
+    """
+    Target of lxml parser processing the VratSestavu response incrementally.
+    Content of souborSestavy element is decoded straight to the file, other
+    report elements are collected to a dictionary. Values are converted by xsd types
+    of the elements (as in zeep response), elements without type stay strings and
+    missing elements of the type are None.
+    """
+
+    def __init__(self, output, block_size=1024 * 1024, types=None):
+        """
+        :param output: binary file object for the decoded report file
+        :param block_size: int - number of base64 characters decoded at once
+        :param types: dict - element name: zeep xsd type of report elements
+        """
+        self.decoder = Base64StreamDecoder(output, block_size)
+        self.types = types or {}
+        self.report = {name: None for name in self.types if name != "souborSestavy"}
+        self.zprava = None
+        self.fault = None
+        self.found = False
+        self._path = []
+        self._text = []
+        self._in_file = False
+        self._in_report = False
+
+    @staticmethod
+    def _local(tag):
+        return tag.rsplit("}", 1)[-1]
+
+    def start(self, tag, attrib):
+        name = self._local(tag)
+        self._path.append(name)
+        self._text = []
+        if name == "report":
+            self._in_report = True
+        elif name == "souborSestavy":
+            self._in_file = True
+            self.found = True
+
+    def data(self, data):
+        if self._in_file:
+            self.decoder.write(data)
+        else:
+            self._text.append(data)
+
+    def end(self, tag):
+        name = self._path.pop()
+        text = "".join(self._text).strip()
+        self._text = []
+        if name == "souborSestavy":
+            self.decoder.close()
+            self._in_file = False
+        elif name == "report":
+            self._in_report = False
+        elif self._in_report and self._path and self._path[-1] == "report":
+            if text and name in self.types:
+                self.report[name] = self.types[name].pythonvalue(text)
+            else:
+                self.report[name] = text or None
+        elif name == "zprava" and self.zprava is None:
+            self.zprava = text
+        elif name == "faultstring":
+            self.fault = text
+
+    def close(self):
+        return self.report
@@ -0,0 +1,268 @@
+"""
+@package clients.transports
+
+@brief HTTP transports for WSDP clients
+
+Classes:
+ - transports::MetricsTransport
+ - transports::RecordingTransport
+ - transports::ReplayTransport
+
+(C) 2021 Linda Kladivova lindakladivova@gmail.com
+This library is free under the MIT License.
+"""
+
+import json
+import gzip
+import time
+import base64
+import hashlib
+import threading
+from collections import deque
+from lxml import etree
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from zeep.transports import Transport
+
+from pywsdp.base.metrics import metrics as default_metrics
+
+
+def operation_name(envelope):
+    """
+    Name of the operation called by the SOAP envelope (first element of the Body).
+    :param envelope: lxml element
+    :rtype: str
+    """
+    for child in envelope:
+        if isinstance(child.tag, str) and child.tag.endswith("}Body"):
+            for operation in child:
+                if isinstance(operation.tag, str):
+                    return operation.tag.rsplit("}", 1)[-1]
+    return "unknown"
+
+
+class MetricsTransport(Transport):
+    """
+    Zeep transport recording latency, size and errors of every request to metrics.
+    """
+
+    def __init__(self, *args, metrics=None, **kwargs):
+        """
+        :param metrics: WSDPMetrics - registry of metrics (shared one by default)
+        """
+        super().__init__(*args, **kwargs)
+        self.metrics = metrics or default_metrics
+        self._local = threading.local()
+
+    def post(self, address, message, headers):
+        response = super().post(address, message, headers)
+        self._local.sent = len(message)
+        self._local.received = len(response.content)
+        return response
+
+    def post_stream(self, address, message, headers):
+        """
+        Post the message and return response with the body not downloaded yet.
+        :param address: str - URL of the service
+        :param message: bytes - SOAP envelope
+        :param headers: dict - HTTP headers
+        :rtype: requests.Response
+        """
+        return self.session.post(
+            address,
+            data=message,
+            headers=headers,
+            stream=True,
+            timeout=self.operation_timeout,
+        )
+
+    def post_xml(self, address, envelope, headers):
+        service = operation_name(envelope)
+        self._local.sent = 0
+        self._local.received = 0
+        start = time.perf_counter()
+        with self.metrics.track_in_flight(service):
+            try:
+                response = super().post_xml(address, envelope, headers)
+            except Exception as exc:
+                self.metrics.add_error(service, exc.__class__.__name__)
+                raise
+            finally:
+                self.metrics.observe_request(
+                    service,
+                    time.perf_counter() - start,
+                    self._local.sent,
+                    self._local.received,
+                )
+        if response.status_code >= 400:
+            self.metrics.add_error(service, "HTTP_{}".format(response.status_code))
+        self.metrics.publish()
+        return response
+
+
+def request_key(address, message):
+    """
+    Key identifying the request in the cassette. SOAP Header (WSSE nonce and
+    timestamps) is left out, so the same request made again has the same key.
+    :param address: str - URL of the service
+    :param message: bytes - SOAP envelope
+    :rtype: tuple (str - operation name, str - hash of the request)
+    """
+    try:
+        envelope = etree.fromstring(message)
+    except etree.XMLSyntaxError:
+        return "unknown", hashlib.sha1(address.encode() + message).hexdigest()
+    for child in list(envelope):
+        if isinstance(child.tag, str) and child.tag.endswith("}Header"):
+            envelope.remove(child)
+    canonical = etree.tostring(envelope, method="c14n")
+    return (
+        operation_name(envelope),
+        hashlib.sha1(address.encode() + canonical).hexdigest(),
+    )
+
+
+def _encode(content):
+    try:
+        return {"telo": content.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"telo_base64": base64.b64encode(content).decode("ascii")}
+
+
+def _decode(entry):
+    if "telo_base64" in entry:
+        return base64.b64decode(entry["telo_base64"])
+    return entry["telo"].encode("utf-8")
+
+
+class RecordingTransport(MetricsTransport):
+    """
+    Transport saving every loaded WSDL document and every SOAP request/response
+    pair with its duration to a cassette (gzipped JSON lines).
+    """
+
+    def __init__(self, cassette, *args, **kwargs):
+        """
+        :param cassette: str - path to the cassette file (overwritten)
+        """
+        super().__init__(*args, **kwargs)
+        self.cassette = cassette
+        self._file = gzip.open(cassette, "wt", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def _record(self, entry):
+        with self._lock:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def load(self, url):
+        content = super().load(url)
+        self._record(dict(typ="dokument", adresa=url, **_encode(content)))
+        return content
+
+    def post(self, address, message, headers):
+        start = time.perf_counter()
+        response = super().post(address, message, headers)
+        self._record_response(address, message, response, start)
+        return response
+
+    def post_stream(self, address, message, headers):
+        start = time.perf_counter()
+        response = super().post_stream(address, message, headers)
+        response.content  # download the body to record it
+        self._record_response(address, message, response, start)
+        return response
+
+    def _record_response(self, address, message, response, start):
+        operation, key = request_key(address, message)
+        self._record(
+            dict(
+                typ="pozadavek",
+                adresa=address,
+                operace=operation,
+                klic=key,
+                status=response.status_code,
+                content_type=response.headers.get("Content-Type"),
+                trvani=round(time.perf_counter() - start, 6),
+                **_encode(response.content)
+            )
+        )
+
+    def close(self):
+        """Close the cassette."""
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ReplayTransport(MetricsTransport):
+    """
+    Transport serving responses from the cassette recorded by RecordingTransport
+    without any network access. Requests are matched by operation and content;
+    repeated identical requests get the recorded responses in the original order.
+    """
+
+    def __init__(self, cassette, *args, latency_scale=1.0, **kwargs):
+        """
+        :param cassette: str - path to the cassette file
+        :param latency_scale: float - multiplier of recorded durations (0 = no delay)
+        """
+        super().__init__(*args, **kwargs)
+        self.latency_scale = latency_scale
+        self.documents = {}
+        self.responses = {}
+        self._last = {}
+        self._lock = threading.Lock()
+        with gzip.open(cassette, "rt", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry["typ"] == "dokument":
+                    self.documents[entry["adresa"]] = _decode(entry)
+                else:
+                    self.responses.setdefault(entry["klic"], deque()).append(entry)
+
+    def load(self, url):
+        try:
+            return self.documents[url]
+        except KeyError:
+            raise ValueError("Dokument {} neni v nahravce".format(url)) from None
+
+    def _replay(self, address, message):
+        operation, key = request_key(address, message)
+        with self._lock:
+            queue = self.responses.get(key)
+            if queue:
+                entry = queue.popleft()
+                self._last[key] = entry
+            elif key in self._last:
+                entry = self._last[key]
+            else:
+                raise ValueError(
+                    "Pozadavek {} na {} neni v nahravce".format(operation, address)
+                )
+        if self.latency_scale > 0:
+            time.sleep(entry["trvani"] * self.latency_scale)
+        response = Response()
+        response.status_code = entry["status"]
+        response.url = address
+        response.headers = CaseInsensitiveDict(
+            {"Content-Type": entry.get("content_type") or "text/xml; charset=utf-8"}
+        )
+        response.encoding = "utf-8"
+        response._content = _decode(entry)
+        response._content_consumed = True
+        return response
+
+    def post(self, address, message, headers):
+        response = self._replay(address, message)
+        self._local.sent = len(message)
+        self._local.received = len(response.content)
+        return response
+
+    def post_stream(self, address, message, headers):
+        return self._replay(address, message)
@@ -0,0 +1,400 @@
+"""
+@package daemon
+
+@brief Long-running pywsdp service with warm clients and local HTTP/JSON API
+
+Modules (and their zeep clients) are created once per service, credentials
+and trial mode and reused by all requests. Single ctiOS lookups of concurrent
+callers are sent together by PosidentBatcher.
+
+API:
+ - GET /stav - state of the daemon
+ - GET /metriky - metrics in Prometheus text format
+ - POST /ctios {"posidenty": [...]}
+ - POST /sestavy/generujCenoveUdajeDleKu {"parametry": {...}}
+ - POST /sestavy/seznamSestav {"sestava": {"id": ...}}
+ - POST /sestavy/vratSestavu {"sestava": {"id": ...}, "vystupni_adresar": "..."}
+   (vystupni_adresar is optional subdirectory of the output directory of the daemon)
+ - POST /sestavy/smazSestavu {"sestava": {"id": ...}}
+Every POST request can contain "prihlaseni": [user, password] and "testovaci": bool,
+otherwise the daemon defaults are used.
+
+Classes:
+ - daemon::WSDPDaemon
+
+(C) 2021 Linda Kladivova lindakladivova@gmail.com
+This library is free under the MIT License.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pywsdp.base import __version__
+from pywsdp.base.logger import WSDPLogger
+from pywsdp.base.metrics import metrics
+from pywsdp.base.exceptions import WSDPError, WSDPPosidentError
+from pywsdp.modules import CtiOS, GenerujCenoveUdajeDleKu
+
+
+class _RequestError(Exception):
+    """Invalid request of the API client (HTTP 400)."""
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        self.server.wsdp_daemon.logger.debug(format, *args)
+
+    def _send(self, status, body, content_type="application/json; charset=utf-8"):
+        if not isinstance(body, str):
+            body = json.dumps(body, ensure_ascii=False, default=str)
+        body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        daemon = self.server.wsdp_daemon
+        path = self.path.split("?")[0]
+        if path == "/stav":
+            self._send(200, daemon.state())
+        elif path == "/metriky":
+            self._send(200, metrics.to_prometheus(), "text/plain; version=0.0.4")
+        else:
+            self._send(404, {"chyba": "Neznama cesta {}".format(path)})
+
+    def do_POST(self):
+        daemon = self.server.wsdp_daemon
+        path = self.path.split("?")[0]
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                request = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError as exc:
+                raise _RequestError("Neplatny JSON: {}".format(exc))
+            if not isinstance(request, dict):
+                raise _RequestError("Pozadavek musi byt JSON objekt")
+            self._send(200, daemon.handle(path, request))
+        except _RequestError as exc:
+            self._send(400, {"chyba": str(exc)})
+        except LookupError as exc:
+            self._send(404, {"chyba": str(exc)})
+        except WSDPError as exc:
+            self._send(502, {"chyba": exc.args[-1]})
+        except Exception as exc:
+            daemon.logger.error("Chyba zpracovani pozadavku %s: %r", path, exc)
+            self._send(
+                500,
+                {"chyba": "Vnitrni chyba: {}: {}".format(exc.__class__.__name__, exc)},
+            )
+
+
+class WSDPDaemon:
+    """
+    Local HTTP/JSON server keeping warm WSDP clients.
+    """
+
+    def __init__(
+        self,
+        creds=None,
+        trial=False,
+        host="127.0.0.1",
+        port=8765,
+        max_wait=0.02,
+        max_concurrent=8,
+        output_dir=None,
+    ):
+        """
+        :param creds: default credentials [user, password] (list or None)
+        :param trial: default trial mode (bool)
+        :param host: listening address (str)
+        :param port: listening port, 0 = random free port (int)
+        :param max_wait: max time the posident waits for others to be sent together [s]
+        :param max_concurrent: max number of concurrent ctiOS requests per client
+        :param output_dir: directory of reports saved by vratSestavu, the endpoint
+            is disabled if None (str)
+        """
+        self.creds = list(creds) if creds else None
+        self.trial = trial
+        self.max_wait = max_wait
+        self.max_concurrent = max_concurrent
+        self.output_dir = os.path.realpath(output_dir) if output_dir else None
+        self.logger = WSDPLogger("pywsdp-daemon")
+        self.requests = 0
+        self._modules = {}
+        self._batchers = {}
+        self._module_locks = {}
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._thread = None
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.wsdp_daemon = self
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def _key(self, module_class, creds, trial):
+        """
+        Key of warm module, the password is kept only in the module itself.
+        :rtype: tuple (key, credentials, trial mode)
+        """
+        creds = creds or self.creds
+        if not creds or len(creds) != 2:
+            raise _RequestError("Chybi prihlasovaci udaje [uzivatel, heslo]")
+        trial = self.trial if trial is None else bool(trial)
+        password = hashlib.sha256(creds[1].encode("utf-8")).hexdigest()
+        return (module_class.__name__, creds[0], password, trial), creds, trial
+
+    def module(self, module_class, creds=None, trial=None):
+        """
+        Warm module of the given class, the module is created at the first use.
+        The module (downloading WSDL) is created under the lock of its key only,
+        so requests of other clients are not blocked.
+        :param module_class: CtiOS or GenerujCenoveUdajeDleKu
+        :param creds: credentials [user, password], default credentials if None
+        :param trial: trial mode, default trial mode if None
+        """
+        key, creds, trial = self._key(module_class, creds, trial)
+        with self._lock:
+            module = self._modules.get(key)
+            if module is not None:
+                return module
+            key_lock = self._module_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                module = self._modules.get(key)
+            if module is not None:
+                return module
+            module = module_class(list(creds), trial=trial)
+            batcher = None
+            if module_class is CtiOS:
+                batcher = module.davkovac(
+                    max_cekani=self.max_wait, max_soubeznych=self.max_concurrent
+                )
+            with self._lock:
+                if batcher is not None:
+                    self._batchers[key] = batcher
+                self._modules[key] = module
+            self.logger.info(
+                "Vytvoren klient %s pro uzivatele %s", module.nazev_sluzby, creds[0]
+            )
+            return module
+
+    def _batcher(self, creds=None, trial=None):
+        self.module(CtiOS, creds, trial)
+        return self._batchers[self._key(CtiOS, creds, trial)[0]]
+
+    def warm_up(self):
+        """Create modules for default credentials before the first request."""
+        self.module(CtiOS)
+        self.module(GenerujCenoveUdajeDleKu)
+
+    def handle(self, path, request):
+        """
+        Process one API request.
+        :param path: path of the request (str)
+        :param request: JSON body of the request (dict)
+        :rtype: dict
+        """
+        with self._lock:
+            self.requests += 1
+        creds = request.get("prihlaseni")
+        trial = request.get("testovaci")
+        if path == "/ctios":
+            return self.ctios(request.get("posidenty"), creds, trial)
+        if path.startswith("/sestavy/"):
+            module = self.module(GenerujCenoveUdajeDleKu, creds, trial)
+            service = path[len("/sestavy/") :]
+            if service == "generujCenoveUdajeDleKu":
+                return module.posli_pozadavek(self._get(request, "parametry"))
+            sestava = self._get(request, "sestava")
+            if service == "seznamSestav":
+                return module.vypis_info_o_sestave(sestava)
+            if service == "vratSestavu":
+                cesta, info = module.zauctuj_a_uloz_sestavu(
+                    sestava, self._output_dir(request.get("vystupni_adresar"))
+                )
+                return {"cesta": cesta, "info": info}
+            if service == "smazSestavu":
+                return module.vymaz_sestavu(sestava)
+        raise LookupError("Neznama cesta {}".format(path))
+
+    def _output_dir(self, subdirectory=None):
+        """
+        Directory for the report - output directory of the daemon or its subdirectory.
+        Raises:
+            _RequestError: no output directory or the path leads out of it
+        :param subdirectory: relative path requested by the client (str or None)
+        :rtype: str
+        """
+        if self.output_dir is None:
+            raise _RequestError("Sluzba nema nastaven vystupni adresar")
+        path = os.path.realpath(os.path.join(self.output_dir, subdirectory or ""))
+        if os.path.commonpath([self.output_dir, path]) != self.output_dir:
+            raise _RequestError(
+                "Vystupni adresar musi byt uvnitr adresare {}".format(self.output_dir)
+            )
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @staticmethod
+    def _get(request, key):
+        if key not in request:
+            raise _RequestError("Chybi polozka {}".format(key))
+        return request[key]
+
+    def ctios(self, posidents, creds=None, trial=None):
+        """
+        Lookup of posidents, posidents of concurrent requests are sent together.
+        :param posidents: list of posidents
+        :rtype: dict {"vysledky": {posident: personal data}, "chyby": {posident: error}}
+        """
+        if not isinstance(posidents, list) or not all(
+            isinstance(p, str) for p in posidents
+        ):
+            raise _RequestError("Polozka posidenty musi byt seznam retezcu")
+        batcher = self._batcher(creds, trial)
+        futures = {posident: batcher.submit(posident) for posident in posidents}
+        wait(futures.values())
+        results = {}
+        errors = {}
+        for posident, future in futures.items():
+            exc = future.exception()
+            if exc is None:
+                results[posident] = future.result()
+            elif isinstance(exc, WSDPPosidentError):
+                errors[posident] = exc.chyba
+            else:
+                raise exc
+        return {"vysledky": results, "chyby": errors}
+
+    def state(self):
+        """State of the daemon and its clients."""
+        with self._lock:
+            modules = [
+                {"sluzba": key[0], "uzivatel": key[1], "testovaci": key[3]}
+                for key in self._modules
+            ]
+            batchers = [batcher.statistics() for batcher in self._batchers.values()]
+            requests = self.requests
+        return {
+            "verze": __version__,
+            "bezi": time.monotonic() - self._started,
+            "pozadavky": requests,
+            "klienti": modules,
+            "davkovace": batchers,
+        }
+
+    def serve_forever(self):
+        self.logger.info("Sluzba pywsdp posloucha na adrese %s", self.url)
+        self._server.serve_forever()
+
+    def start(self):
+        """Run the server in background thread."""
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="pywsdp-daemon", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server and send the waiting posidents."""
+        if self._thread:
+            self._server.shutdown()
+            self._thread.join()
+        self._server.server_close()
+        with self._lock:
+            batchers = list(self._batchers.values())
+        for batcher in batchers:
+            batcher.close()
+        self.logger.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Sluzba pywsdp s lokalnim HTTP/JSON rozhranim"
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="adresa serveru")
+    parser.add_argument("--port", type=int, default=8765, help="port serveru")
+    parser.add_argument(
+        "--uzivatel",
+        default=os.environ.get("PYWSDP_UZIVATEL"),
+        help="vychozi uzivatel WSDP (nebo promenna PYWSDP_UZIVATEL)",
+    )
+    parser.add_argument(
+        "--heslo",
+        default=os.environ.get("PYWSDP_HESLO"),
+        help="vychozi heslo WSDP (nebo promenna PYWSDP_HESLO)",
+    )
+    parser.add_argument(
+        "--testovaci", action="store_true", help="pouzit testovaci sluzby WSDP"
+    )
+    parser.add_argument(
+        "--max-cekani",
+        type=float,
+        default=0.02,
+        help="maximalni doba cekani POSIdentu na spolecny pozadavek [s]",
+    )
+    parser.add_argument(
+        "--max-soubeznych",
+        type=int,
+        default=8,
+        help="maximalni pocet soubeznych pozadavku ctiOS",
+    )
+    parser.add_argument(
+        "--vystupni-adresar",
+        help="adresar pro sestavy ulozene sluzbou vratSestavu",
+    )
+    parser.add_argument(
+        "--predehrat",
+        action="store_true",
+        help="vytvorit klienty pro vychozi prihlaseni pri spusteni",
+    )
+    args = parser.parse_args(argv)
+
+    creds = [args.uzivatel, args.heslo] if args.uzivatel and args.heslo else None
+    daemon = WSDPDaemon(
+        creds,
+        args.testovaci,
+        args.host,
+        args.port,
+        args.max_cekani,
+        args.max_soubeznych,
+        args.vystupni_adresar,
+    )
+    try:
+        if args.predehrat:
+            daemon.warm_up()
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except WSDPError as exc:
+        print(exc.args[-1], file=sys.stderr)
+        return 1
+    finally:
+        daemon.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
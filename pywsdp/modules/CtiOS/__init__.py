@@ -15,12 +15,28 @@ import csv
 import json
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
 import shutil
 
 from pywsdp.base import WSDPBase
 from pywsdp.base.exceptions import WSDPError
-from pywsdp.modules.CtiOS.formats import OutputFormat
+from pywsdp.base.readers import InputFormat, iter_identifiers
+from pywsdp.clients.factory import get_wsdls
+from pywsdp.clients.helpers.ctiOS import HedgingPolicy
+from pywsdp.modules.CtiOS import sharding
+from pywsdp.modules.CtiOS.batcher import PosidentBatcher
+from pywsdp.modules.CtiOS.cache import NegativeCache
+from pywsdp.modules.CtiOS.columnar import ColumnarWriter
+from pywsdp.modules.CtiOS.dataframe import DataFrameCollector
+from pywsdp.modules.CtiOS.compression import (
+    check_compression,
+    compressed_path,
+    open_output,
+)
+from pywsdp.modules.CtiOS.formats import Compression, OutputFormat
 from pywsdp.modules.CtiOS.helpers import AttributeConverter, DbManager
+from pywsdp.modules.CtiOS.pipeline import EnrichmentPipeline
 
 
 # Mapping dictionary for conversion from XML response and DB Gdal SQLITE db
@@ -33,6 +49,12 @@ _XML2DB_mapping = {
     "idNadrizenePravnickeOsoby": "ID_NADRIZENE_PO",
 }
 
+# Pripony souboru sloupcovych formatu
+_COLUMNAR_FORMATS = {
+    OutputFormat.Parquet: ".parquet",
+    OutputFormat.Feather: ".arrow",
+}
+
 
 class CtiOS(WSDPBase):
     """Trida definujici rozhrani pro praci se sluzbou ctiOS.
@@ -46,9 +68,66 @@ class CtiOS(WSDPBase):
         self._nazev_sluzby = "ctiOS"
         self._skupina_sluzeb = "ctios"
         self._input_db = None
+        self._negativni_cache = None
 
         super().__init__(creds, trial=trial)
 
+    @property
+    def negativni_cache(self) -> NegativeCache:
+        """Vraci negativni cache chybnych POSIdentu (None, pokud neni nastavena).
+        Zaroven funguje i jako setter - lze nastavit cestu k souboru cache
+        nebo vlastni objekt NegativeCache s nastavenou platnosti podle typu chyby."""
+        return self._negativni_cache
+
+    @negativni_cache.setter
+    def negativni_cache(self, cache):
+        """Nastavi negativni cache chybnych POSIdentu. POSIdenty, ktere v ni jsou,
+        se pri dalsich behech na server neodesilaji.
+
+        :param cache: cesta k souboru cache, objekt NegativeCache nebo None
+        """
+        if cache is not None and not isinstance(cache, NegativeCache):
+            cache = NegativeCache(cache, self.logger)
+        self._negativni_cache = cache
+        if cache is not None:
+            self.logger.info(
+                "Negativni cache POSIdentu nastavena na cestu: %s", cache.path
+            )
+
+    @property
+    def zdvojovani_pozadavku(self) -> HedgingPolicy:
+        """Vraci pravidlo zdvojovani pomalych pozadavku (None, pokud je vypnuto).
+        Zaroven funguje i jako setter."""
+        return self.client.hedging
+
+    @zdvojovani_pozadavku.setter
+    def zdvojovani_pozadavku(self, pravidlo):
+        """Nastavi zdvojovani pomalych pozadavku. Pokud pozadavek trva dele nez zvoleny
+        percentil dosud namerenych dob odezvy, odesle se znovu a pouzije se prvni odpoved.
+
+        :param pravidlo: True (vychozi HedgingPolicy), objekt HedgingPolicy, nebo None/False (vypnuto)
+        """
+        if pravidlo is True:
+            pravidlo = HedgingPolicy()
+        self.client.hedging = pravidlo or None
+
+    @property
+    def logovani_posidentu(self) -> int:
+        """Vraci, kolikaty POSIdent se zaloguje (1 = kazdy, n = kazdy n-ty,
+        0 = pouze souhrn kazde odpovedi). Zaroven funguje i jako setter."""
+        return self.client.log_every
+
+    @logovani_posidentu.setter
+    def logovani_posidentu(self, kazdy: int):
+        """Nastavi vzorkovani logovani POSIdentu. U velkych davek se logovanim
+        kazdeho POSIdentu zbytecne prodluzuje zpracovani a zvetsuji log soubory.
+
+        :param kazdy: 1 = kazdy POSIdent, n = kazdy n-ty POSIdent, 0 = pouze souhrn
+        """
+        if kazdy < 0:
+            raise WSDPError(self.logger, "Hodnota musi byt nezaporna")
+        self.client.log_every = kazdy
+
     def nacti_identifikatory_z_db(self, db_path: str, sql_dotaz=None) -> dict:
         """Pripravi identifikatory z SQLITE databaze pro vstup do zavolani sluzby ctiOS.
 
@@ -56,16 +135,18 @@ class CtiOS(WSDPBase):
         :param sql_dotaz: omezeni zpracovavanych identifikatoru pres SQL dotaz, napr. SELECT * FROM OPSUB order by ID LIMIT 10
         :return: data pro vstup do sluzby ctiOS
         """
-        db = DbManager(db_path, self.logger)  # pripojeni k SQLite databazi
+        with self._beh("nacti_identifikatory_z_db"):
+            db = DbManager(db_path, self.logger)  # pripojeni k SQLite databazi
 
-        if sql_dotaz:
-            posidents = db.get_posidents_from_db(sql_dotaz)
-        else:
-            posidents = db.get_posidents_from_db()
+            with self.tracer.span("DbManager.get_posidents_from_db"):
+                if sql_dotaz:
+                    posidents = db.get_posidents_from_db(sql_dotaz)
+                else:
+                    posidents = db.get_posidents_from_db()
 
-        self._input_db = db_path  # zpristupneni cesty k vstupni databazi
+            self._input_db = db_path  # zpristupneni cesty k vstupni databazi
 
-        db.close_connection()
+            db.close_connection()
         return {"pOSIdent": posidents}
 
     def nacti_identifikatory_z_json_souboru(self, json_path: str) -> dict:
@@ -83,34 +164,150 @@ class CtiOS(WSDPBase):
         else:
             raise WSDPError(self.logger, "File is not found!")
 
-    def posli_pozadavek(self, slovnik_identifikatoru: dict) -> dict:
+    def nacti_identifikatory_ze_souboru(
+        self, cesta: str, format_vstupu: InputFormat = None, klic: str = "pOSIdent"
+    ) -> dict:
+        """Pripravi proudove cteni identifikatoru z velkeho souboru pro vstup do sluzby ctiOS.
+        Identifikatory se ctou postupne az pri odesilani pozadavku, soubor se tedy
+        nikdy nenacita do pameti cely. Podporovany jsou JSON ({"pOSIdent": [...]}
+        nebo samotne pole), JSON Lines, CSV se sloupcem pOSIdent (napr. CSV vystup
+        CtiOS se sloupcem posident) a textovy soubor s jednim POSIdentem na radek.
+        Soubory s priponou .gz se rozbaluji za behu.
+
+        :param cesta: cesta k souboru s identifikatory
+        :param format_vstupu: format souboru (InputFormat), implicitne podle pripony
+        :param klic: polozka JSON objektu nebo nazev sloupce CSV s identifikatory
+        :return: data pro vstup do sluzby ctiOS, pOSIdent je generator identifikatoru
+        """
+        if not Path(cesta).exists():
+            raise WSDPError(self.logger, "Soubor {} nebyl nalezen!".format(cesta))
+        return {"pOSIdent": iter_identifiers(cesta, self.logger, format_vstupu, klic)}
+
+    def posli_pozadavek(
+        self, slovnik_identifikatoru: dict, jako_dataframe: bool = False
+    ) -> dict:
         """Zpracuje vstupni parametry pomoci nektere ze sluzeb a
         vysledek ulozi do slovniku. Zaroven vypocte zaloguje statistiku procesu.
+        S parametrem jako_dataframe se osobni udaje z kazde odpovedi rovnou pripisuji
+        do typovych sloupcu a na konci se z nich jednou vytvori pandas DataFrame
+        (vyzaduje knihovnu pandas).
 
         :param slovnik: vstupni parametry specificke pro danou sluzbu.
+        :param jako_dataframe: vratit vysledky jako pandas DataFrame
         :return: tuple (slovnik - uspesne vracene pseudoidentifikatory s osobnimi udaji,
-                        slovnik - chybne pseudoidentifikatory s popisem chyby)
+                        slovnik - chybne pseudoidentifikatory s popisem chyby),
+            s jako_dataframe tuple (DataFrame osobnich udaju s indexem posident,
+                                    DataFrame chybnych POSIdentu se sloupcem chyba)
         """
-        response, response_errors = self.client.send_request(slovnik_identifikatoru)
+        collector = DataFrameCollector(self.logger) if jako_dataframe else None
+        sber = collector.add if collector is not None else None
+        with self._beh("posli_pozadavek"):
+            if self._negativni_cache is None:
+                response, response_errors = self.client.send_request(
+                    slovnik_identifikatoru, sber
+                )
+            else:
+                response, response_errors = self._posli_s_negativni_cache(
+                    slovnik_identifikatoru["pOSIdent"], sber
+                )
+            if collector is not None:
+                with self.tracer.span("DataFrameCollector.frames"):
+                    response, response_errors = collector.frames(response_errors)
         self.client.log_statistics()
         return response, response_errors
 
+    def _posli_s_negativni_cache(self, posidenty: list, sber=None) -> tuple:
+        """Privatni metoda odesilajici pouze POSIdenty, ktere nejsou v negativni cache."""
+        if not isinstance(posidenty, (list, tuple)):
+            # cache filtruje cely seznam najednou, proudovy vstup se nacte
+            posidenty = list(posidenty)
+        unikatni = list(dict.fromkeys(posidenty))
+        with self.tracer.span("NegativeCache.filter"):
+            k_odeslani, zname_chyby = self._negativni_cache.filter(unikatni)
+        if zname_chyby:
+            self.logger.info(
+                "Z negativni cache preskoceno %s POSIdentu", len(zname_chyby)
+            )
+        response, response_errors = self.client.send_request(
+            {"pOSIdent": k_odeslani}, sber
+        )
+        self._negativni_cache.add(response_errors)
+        for chyba in zname_chyby.values():
+            self.client.counter.add_error(chyba)
+        # statistika se vztahuje ke vsem vstupnim POSIdentum
+        self.client.number_of_posidents = len(posidenty)
+        self.client.number_of_posidents_final = len(unikatni)
+        if zname_chyby:
+            response_errors = {
+                p: response_errors.get(p) or zname_chyby[p]
+                for p in unikatni
+                if p in response_errors or p in zname_chyby
+            }
+        return response, response_errors
+
+    def davkovac(
+        self, max_cekani: float = 0.05, max_soubeznych: int = 4
+    ) -> PosidentBatcher:
+        """Vytvori davkovac jednotlivych dotazu na POSIdenty (napr. z webove aplikace).
+        Dotazy se sdruzuji do pozadavku po 10 POSIdentech, pozadavek se odesle po
+        naplneni nebo po uplynuti max_cekani od prvniho cekajiciho POSIdentu.
+
+        :param max_cekani: maximalni doba cekani POSIdentu na odeslani [s]
+        :param max_soubeznych: maximalni pocet soubezne odeslanych pozadavku
+        :return: davkovac s metodami lookup (blokujici), lookup_async (asyncio) a submit (Future)
+        """
+        return PosidentBatcher(
+            self.client.send_chunk,
+            self.logger,
+            batch_size=self.client.posidents_per_request,
+            max_wait=max_cekani,
+            max_concurrent=max_soubeznych,
+        )
+
     def uloz_vystup(
         self,
         vysledny_slovnik: dict,
         vystupni_adresar: str,
         format_souboru: OutputFormat,
+        komprese: Compression = None,
     ):
         """Konvertuje osobni udaje typu slovnik ziskane ze sluzby ctiOS do souboru o definovanem
         formatu a soubor ulozi do definovaneho vystupniho adresare. Pokud adresar neexistuje, vytvori ho.
         U databaze nejprve prekopiruje vstupni soubor do pozadovaneho adresare a pak databazi updatuje o osobni udaje.
+        Formaty OutputFormat.Parquet a OutputFormat.Feather vyzaduji knihovnu pyarrow.
+        Soubory JSON a CSV lze pri zapisu rovnou komprimovat, k nazvu souboru se prida pripona komprese.
 
         :param vysledny_slovnik: slovnik vraceny pro uspesne zpracovane identifikatory
         :param vystupni_adresar: cesta k vystupnimu adresari
-        :param format_souboru: format typu OutputFormat.GdalDb, OutputFormat.Json nebo OutputFormat.Csv
+        :param format_souboru: format typu OutputFormat.GdalDb, OutputFormat.Json, OutputFormat.Csv,
+            OutputFormat.Parquet nebo OutputFormat.Feather
+        :param komprese: Compression.Gzip, Compression.Zstd (knihovna zstandard),
+            Compression.Lz4 (knihovna lz4) nebo None (bez komprese), pouze pro JSON a CSV
         :return: cesta k vystupnimu souboru
         """
+        with self._beh("uloz_vystup"):
+            return self._uloz_vystup(
+                vysledny_slovnik, vystupni_adresar, format_souboru, komprese
+            )
+
+    def _uloz_vystup(
+        self,
+        vysledny_slovnik: dict,
+        vystupni_adresar: str,
+        format_souboru: OutputFormat,
+        komprese: Compression = None,
+    ):
+        """Privatni metoda ukladajici vystup, viz uloz_vystup."""
         cas = datetime.now().strftime("%H_%M_%S_%d_%m_%Y")
+        if komprese is not None and format_souboru not in (
+            OutputFormat.Json,
+            OutputFormat.Csv,
+        ):
+            raise WSDPError(
+                self.logger,
+                "Komprese neni pro format {} podporovana".format(format_souboru),
+            )
+        check_compression(komprese, self.logger)
 
         # kontrola existence vystupniho souboru
         if os.path.exists(vystupni_adresar) == False:
@@ -128,42 +325,48 @@ class CtiOS(WSDPBase):
                 )  # prekopirovani souboru db do cilove cesty
             except:
                 raise WSDPError(self.logger, "Soubor nelze ulozit do ciloveho adresare")
-            db = DbManager(vystupni_cesta, self.logger)
-            db.add_column_to_db("OS_ID", "text")
-            input_db_columns = db.get_columns_names()
-            db_dictionary = AttributeConverter(
-                _XML2DB_mapping, vysledny_slovnik, input_db_columns, self.logger
-            ).convert_attributes()
-            db.update_rows_in_db(db_dictionary)
-            db.close_connection()
+            self._aktualizuj_db(vystupni_cesta, vysledny_slovnik)
         elif format_souboru == OutputFormat.Json:
             vystupni_soubor = "".join(["ctios_", cas, ".json"])
-            vystupni_cesta = os.path.join(vystupni_adresar, vystupni_soubor)
+            vystupni_cesta = compressed_path(
+                os.path.join(vystupni_adresar, vystupni_soubor), komprese
+            )
             try:
-                with open(vystupni_cesta, "w", newline="", encoding="utf-8") as f:
+                with open_output(vystupni_cesta, komprese, self.logger) as f:
                     json.dump(vysledny_slovnik, f, ensure_ascii=False)
             except:
                 raise WSDPError(self.logger, "Soubor nelze ulozit do ciloveho adresare")
         elif format_souboru == OutputFormat.Csv:
             vystupni_soubor = "".join(["ctios_", cas, ".csv"])
-            vystupni_cesta = os.path.join(vystupni_adresar, vystupni_soubor)
+            vystupni_cesta = compressed_path(
+                os.path.join(vystupni_adresar, vystupni_soubor), komprese
+            )
             header = sorted(
                 set(i for b in map(dict.keys, vysledny_slovnik.values()) for i in b)
             )
             try:
-                with open(vystupni_cesta, "w", newline="") as f:
+                with open_output(vystupni_cesta, komprese, self.logger) as f:
                     write = csv.writer(f)
                     write.writerow(["posident", *header])
                     for a, b in vysledny_slovnik.items():
                         write.writerow([a] + [b.get(i, "") for i in header])
             except:
                 raise WSDPError(self.logger, "Soubor nelze ulozit do ciloveho adresare")
+        elif format_souboru in _COLUMNAR_FORMATS:
+            vystupni_soubor = "".join(
+                ["ctios_", cas, _COLUMNAR_FORMATS[format_souboru]]
+            )
+            vystupni_cesta = os.path.join(vystupni_adresar, vystupni_soubor)
+            with ColumnarWriter(
+                vystupni_cesta, format_souboru.name.lower(), self.logger
+            ) as writer:
+                writer.write(vysledny_slovnik)
         else:
             raise WSDPError(
                 self.logger, "Format {} neni podporovan".format(format_souboru)
             )
         # logovani ulozeni vystupu
-        self.logger.info("Vystup byl ulozen zde: {}".format(vystupni_cesta))
+        self.logger.info("Vystup byl ulozen zde: %s", vystupni_cesta)
         return vystupni_cesta
 
     def uloz_vystup_aktualizuj_db(
@@ -175,38 +378,393 @@ class CtiOS(WSDPBase):
         :param vysledny_slovnik: slovnik vraceny pro uspesne zpracovane identifikatory
         :return: cesta k updatovane databazi
         """
-        db = DbManager(self._input_db, self.logger)
+        with self._beh("uloz_vystup_aktualizuj_db"):
+            self._aktualizuj_db(self._input_db, vysledny_slovnik)
+        self.logger.info("Databaze v ceste %s byla aktualizovana", self._input_db)
+        return self._input_db
+
+    def _aktualizuj_db(self, db_path: str, vysledny_slovnik: dict):
+        """Privatni metoda doplnujici osobni udaje do databaze."""
+        db = DbManager(db_path, self.logger)
         db.add_column_to_db("OS_ID", "text")
         input_db_columns = db.get_columns_names()
-        db_dictionary = AttributeConverter(
-            _XML2DB_mapping, vysledny_slovnik, input_db_columns, self.logger
-        ).convert_attributes()
-        db.update_rows_in_db(db_dictionary)
+        with self.tracer.span("AttributeConverter"):
+            db_dictionary = AttributeConverter(
+                _XML2DB_mapping, vysledny_slovnik, input_db_columns, self.logger
+            ).convert_attributes()
+        with self.tracer.span("DbManager.update_rows_in_db"):
+            db.update_rows_in_db(db_dictionary)
         db.close_connection()
+
+    def _k_odeslani(self, posidenty: list) -> tuple:
+        """Privatni metoda pripravujici POSIdenty k prubeznemu odeslani - odstrani duplicity
+        a POSIdenty z negativni cache a nastavi statistiku klienta.
+
+        :return: tuple (seznam POSIdentu k odeslani, slovnik chyb z negativni cache)
+        """
+        if not isinstance(posidenty, (list, tuple)):
+            posidenty = list(posidenty)
+        unikatni = list(dict.fromkeys(posidenty))
+        self.client.number_of_posidents = len(posidenty)
+        self.client.number_of_posidents_final = len(unikatni)
+        if self._negativni_cache is None:
+            return unikatni, {}
+        with self.tracer.span("NegativeCache.filter"):
+            unikatni, zname_chyby = self._negativni_cache.filter(unikatni)
+        for chyba in zname_chyby.values():
+            self.client.counter.add_error(chyba)
+        return unikatni, zname_chyby
+
+    def uloz_vystup_proudove(
+        self,
+        slovnik_identifikatoru: dict,
+        vystupni_adresar: str,
+        format_souboru: OutputFormat,
+        max_soubeznych: int = 4,
+        velikost_skupiny: int = 10000,
+    ) -> tuple:
+        """Ziska osobni udaje ze sluzby ctiOS a prubezne je zapisuje do sloupcoveho souboru
+        (OutputFormat.Parquet nebo OutputFormat.Feather) s typovym schematem. Soubor se zapisuje
+        po skupinach radku (row groups) velikosti velikost_skupiny, takze se v pameti drzi
+        pouze rozepsana skupina.
+
+        :param slovnik_identifikatoru: slovnik ve tvaru {"pOSIdent": [...]}
+        :param vystupni_adresar: cesta k vystupnimu adresari
+        :param format_souboru: format typu OutputFormat.Parquet nebo OutputFormat.Feather
+        :param max_soubeznych: maximalni pocet soubezne odeslanych pozadavku
+        :param velikost_skupiny: pocet radku v jedne skupine radku souboru
+        :return: tuple (cesta k vystupnimu souboru, slovnik chybnych POSIdentu)
+        """
+        if format_souboru not in _COLUMNAR_FORMATS:
+            raise WSDPError(
+                self.logger, "Format {} neni podporovan".format(format_souboru)
+            )
+        os.makedirs(vystupni_adresar, exist_ok=True)
+        cas = datetime.now().strftime("%H_%M_%S_%d_%m_%Y")
+        vystupni_cesta = os.path.join(
+            vystupni_adresar,
+            "".join(["ctios_", cas, _COLUMNAR_FORMATS[format_souboru]]),
+        )
+        klient = self.client
+        with self._beh("uloz_vystup_proudove"):
+            unikatni, chybne = self._k_odeslani(slovnik_identifikatoru["pOSIdent"])
+            davky = [
+                unikatni[i : i + klient.posidents_per_request]
+                for i in range(0, len(unikatni), klient.posidents_per_request)
+            ]
+            # omezeni poctu rozpracovanych pozadavku (a tedy pameti)
+            okno = max(1, max_soubeznych) * 4
+            with ColumnarWriter(
+                vystupni_cesta,
+                format_souboru.name.lower(),
+                self.logger,
+                row_group_size=velikost_skupiny,
+            ) as writer, ThreadPoolExecutor(
+                max_workers=max(1, max_soubeznych)
+            ) as executor:
+                for i in range(0, len(davky), okno):
+                    for vysledky, chyby in executor.map(
+                        klient.send_chunk, davky[i : i + okno]
+                    ):
+                        writer.write(vysledky)
+                        if self._negativni_cache is not None:
+                            self._negativni_cache.add(chyby)
+                        chybne.update(chyby)
+        klient.log_statistics()
         self.logger.info(
-            "Databaze v ceste {} byla aktualizovana".format(self._input_db)
+            "Vystup byl ulozen zde: %s (%s radku, %s skupin radku)",
+            vystupni_cesta,
+            writer.rows,
+            writer.row_groups,
         )
-        return self._input_db
+        return vystupni_cesta, chybne
+
+    def aktualizuj_db_proudove(
+        self,
+        slovnik_identifikatoru: dict,
+        db_path: str = None,
+        max_soubeznych: int = 4,
+        velikost_fronty: int = 16,
+        davka_zapisu: int = 1000,
+    ) -> dict:
+        """Ziska osobni udaje ze sluzby ctiOS a prubezne je zapisuje do databaze. Odesilani
+        pozadavku, konverze odpovedi na sloupce databaze a zapis do databaze bezi soubezne
+        (propojene omezenymi frontami), takze celkova doba je blizka delsi z dob site a zapisu,
+        nikoli jejich souctu. Databazi zapisuje jedine vlakno, ktere potvrzuje transakce
+        po davka_zapisu radcich.
+
+        :param slovnik_identifikatoru: slovnik ve tvaru {"pOSIdent": [...]}
+        :param db_path: cesta k aktualizovane databazi, implicitne vstupni databaze
+            nactena metodou nacti_identifikatory_z_db
+        :param max_soubeznych: maximalni pocet soubezne odeslanych pozadavku
+        :param velikost_fronty: maximalni pocet odpovedi cekajicich na konverzi nebo zapis
+        :param davka_zapisu: pocet radku zapsanych v jedne transakci
+        :return: slovnik ve tvaru {"databaze": cesta, "aktualizovano": pocet, "chybne": slovnik
+            chybnych POSIdentu, "pozadavky": pocet, "transakce": pocet, "cas": s,
+            "cas konverze": s, "cas zapisu": s}
+        """
+        db_path = db_path or self._input_db
+        if db_path is None:
+            raise WSDPError(self.logger, "Neni zadana databaze k aktualizaci")
+        klient = self.client
+        with self._beh("aktualizuj_db_proudove"):
+            db = DbManager(db_path, self.logger)
+            db.add_column_to_db("OS_ID", "text")
+            sloupce = db.get_columns_names()
+            db.close_connection()
+
+            unikatni, zname_chyby = self._k_odeslani(slovnik_identifikatoru["pOSIdent"])
+
+            def konvertuj(vysledky):
+                return AttributeConverter(
+                    _XML2DB_mapping, vysledky, sloupce, self.logger
+                ).convert_attributes()
+
+            proud = EnrichmentPipeline(
+                klient.send_chunk,
+                konvertuj,
+                db_path,
+                self.logger,
+                chunk_size=klient.posidents_per_request,
+                max_concurrent=max_soubeznych,
+                queue_size=velikost_fronty,
+                commit_size=davka_zapisu,
+            )
+            statistika, chybne = proud.run(unikatni)
+            if self._negativni_cache is not None:
+                self._negativni_cache.add(chybne)
+                chybne.update(zname_chyby)
+        klient.log_statistics()
+        self.logger.info(
+            "Databaze v ceste %s byla aktualizovana (%s radku, %s transakci)",
+            db_path,
+            statistika["aktualizovano"],
+            statistika["transakce"],
+        )
+        return {"databaze": db_path, "chybne": chybne, **statistika}
+
+    def zpracuj_databaze(
+        self,
+        databaze,
+        vystupni_adresar: str = None,
+        sql_dotaz: str = None,
+        max_soubeznych: int = 4,
+    ) -> dict:
+        """Doplni osobni udaje do vice SQLITE databazi najednou (napr. VFK soubory jednotlivych
+        katastralnich uzemi). POSIdenty ze vsech databazi se odstrani duplicity a kazdy unikatni
+        POSIdent se ze sluzby ziska jen jednou. Vysledky se pak do databazi zapisi soubezne.
+
+        :param databaze: cesta k adresari s databazemi (*.db) nebo seznam cest k databazim
+        :param vystupni_adresar: cesta k adresari, do ktereho se databaze pred aktualizaci prekopiruji,
+            pokud neni zadan, aktualizuji se vstupni databaze; databaze se stejnym nazvem souboru
+            z ruznych adresaru dostanou priponu _1, _2, ...
+        :param sql_dotaz: omezeni zpracovavanych identifikatoru pres SQL dotaz (pro kazdou databazi)
+        :param max_soubeznych: maximalni pocet soubezne aktualizovanych databazi
+        :return: slovnik ve tvaru {"databaze": {cesta: {"vystup": cesta, "posidenty": pocet,
+            "aktualizovano": pocet}}, "pocet posidentu": pocet, "pocet unikatnich posidentu": pocet,
+            "chybne": slovnik chybnych POSIdentu}
+        """
+        if isinstance(databaze, (str, os.PathLike)):
+            if not os.path.isdir(databaze):
+                raise WSDPError(self.logger, "Adresar {} neexistuje".format(databaze))
+            databaze = sorted(str(cesta) for cesta in Path(databaze).glob("*.db"))
+        # kazda databaze se aktualizuje pouze jednou
+        databaze = list(dict.fromkeys(str(cesta) for cesta in databaze))
+        if not databaze:
+            raise WSDPError(self.logger, "Nebyla zadana zadna databaze")
+        vystupy = {db_path: db_path for db_path in databaze}
+        if vystupni_adresar:
+            os.makedirs(vystupni_adresar, exist_ok=True)
+            nazvy = set()
+            for db_path in databaze:
+                nazev = os.path.basename(db_path)
+                zaklad, pripona = os.path.splitext(nazev)
+                poradi = 0
+                while nazev in nazvy:
+                    poradi += 1
+                    nazev = "{}_{}{}".format(zaklad, poradi, pripona)
+                nazvy.add(nazev)
+                vystupy[db_path] = os.path.join(vystupni_adresar, nazev)
+
+        with self._beh("zpracuj_databaze"):
+            posidenty_db = {}
+            for db_path in databaze:
+                db = DbManager(db_path, self.logger)
+                with self.tracer.span("DbManager.get_posidents_from_db"):
+                    posidenty_db[db_path] = db.get_posidents_from_db(sql_dotaz)
+                db.close_connection()
+            vsechny = [p for posidenty in posidenty_db.values() for p in posidenty]
+            self.logger.info(
+                "Nacteno %s POSIdentu z %s databazi", len(vsechny), len(databaze)
+            )
+
+            slovnik, chybne = self.posli_pozadavek({"pOSIdent": vsechny})
+
+            def aktualizuj(db_path):
+                vystup = vystupy[db_path]
+                if vystupni_adresar:
+                    try:
+                        shutil.copyfile(db_path, vystup)
+                    except OSError as exc:
+                        raise WSDPError(
+                            self.logger, "Soubor nelze ulozit do ciloveho adresare"
+                        ) from exc
+                cast = {p: slovnik[p] for p in posidenty_db[db_path] if p in slovnik}
+                self._aktualizuj_db(vystup, cast)
+                self.logger.info("Databaze v ceste %s byla aktualizovana", vystup)
+                return db_path, {
+                    "vystup": vystup,
+                    "posidenty": len(posidenty_db[db_path]),
+                    "aktualizovano": len(cast),
+                }
+
+            with ThreadPoolExecutor(max_workers=max(1, max_soubeznych)) as executor:
+                vysledky = dict(executor.map(aktualizuj, databaze))
+
+        return {
+            "databaze": vysledky,
+            "pocet posidentu": len(vsechny),
+            "pocet unikatnich posidentu": self.client.number_of_posidents_final,
+            "chybne": chybne,
+        }
+
+    def zpracuj_paralelne(
+        self,
+        db_path: str,
+        vystupni_adresar: str,
+        format_souboru: OutputFormat,
+        pocet_procesu: int = 4,
+        rozdeleni: str = "rozsah",
+    ) -> dict:
+        """Zpracuje velke mnozstvi POSIdentu z SQLITE databaze ve vice procesech. POSIdenty se
+        rozdeli na casti podle rozsahu hodnot OPSUB.ID nebo podle hashe, kazda cast se zpracuje
+        ve vlastnim procesu s vlastnim klientem a prubezne se zapisuje do deniku. Preruseny beh
+        lze spustit znovu, jiz zpracovane POSIdenty se znovu neodesilaji. Nakonec se deniky
+        slouci do jednoho vystupu zvoleneho formatu a statistika vsech casti se secte.
+
+        :param db_path: cesta k SQLITE databazi ziskane rozbalenim VFK souboru
+        :param vystupni_adresar: cesta k vystupnimu adresari
+        :param format_souboru: format typu OutputFormat.GdalDb, OutputFormat.Json nebo OutputFormat.Csv
+        :param pocet_procesu: pocet casti (procesu)
+        :param rozdeleni: "rozsah" - podle rozsahu OPSUB.ID, "hash" - podle hashe POSIdentu
+        :return: slovnik ve tvaru {"vystup": cesta, "vystup chybnych": cesta,
+            "casti": [statistika casti]}
+        """
+        if rozdeleni not in ("rozsah", "hash"):
+            raise WSDPError(
+                self.logger, "Neznamy zpusob rozdeleni {}".format(rozdeleni)
+            )
+        if format_souboru not in (
+            OutputFormat.GdalDb,
+            OutputFormat.Json,
+            OutputFormat.Csv,
+        ):
+            raise WSDPError(
+                self.logger, "Format {} neni podporovan".format(format_souboru)
+            )
+        os.makedirs(vystupni_adresar, exist_ok=True)
+        nazev = os.path.splitext(os.path.basename(db_path))[0]
+        adresar_casti = os.path.join(vystupni_adresar, ".casti_{}".format(nazev))
+        os.makedirs(adresar_casti, exist_ok=True)
+
+        with self._beh("zpracuj_paralelne"):
+            if rozdeleni == "rozsah":
+                rozsahy = sharding.key_ranges(db_path, pocet_procesu, self.logger)
+            else:
+                rozsahy = [None] * pocet_procesu
+            ulohy = [
+                {
+                    "cast": i,
+                    "pocet_casti": len(rozsahy),
+                    "rozdeleni": rozdeleni,
+                    "rozsah": rozsah,
+                    "posidenty": os.path.join(
+                        adresar_casti, "cast_{}_{}.txt".format(i, len(rozsahy))
+                    ),
+                    "db_path": os.path.abspath(db_path),
+                    "denik": os.path.join(
+                        adresar_casti, "cast_{}_{}.jsonl".format(i, len(rozsahy))
+                    ),
+                    "format": format_souboru.name,
+                    "creds": self._creds,
+                    "trial": self._trial,
+                    "wsdls": get_wsdls(trial=True),
+                    "wsdls_ostre": get_wsdls(trial=False),
+                    "log_adresar": self.log_adresar,
+                    "logovani_posidentu": self.logovani_posidentu,
+                }
+                for i, rozsah in enumerate(rozsahy)
+            ]
+            if rozdeleni == "hash":
+                sharding.split_by_hash(
+                    db_path, [uloha["posidenty"] for uloha in ulohy], self.logger
+                )
+            # spawn - the parent process runs threads (logger, transports)
+            with ProcessPoolExecutor(
+                max_workers=len(ulohy), mp_context=multiprocessing.get_context("spawn")
+            ) as executor:
+                try:
+                    casti = list(executor.map(sharding.run_shard, ulohy))
+                except RuntimeError as exc:
+                    raise WSDPError(self.logger, str(exc)) from exc
+
+            klient = self.client
+            for cast in casti:
+                klient.number_of_requests += cast["pozadavky"]
+                klient.counter.neplatny_identifikator += cast["neplatny_identifikator"]
+                klient.counter.expirovany_identifikator += cast[
+                    "expirovany_identifikator"
+                ]
+                klient.counter.opravneny_subjekt_neexistuje += cast[
+                    "opravneny_subjekt_neexistuje"
+                ]
+                klient.counter.uspesne_stazeno += cast["uspesne_stazeno"]
+            klient.number_of_posidents = sum(cast["posidenty"] for cast in casti)
+            klient.number_of_posidents_final = klient.number_of_posidents
+
+            cas = datetime.now().strftime("%H_%M_%S_%d_%m_%Y")
+            with self.tracer.span("slouceni"):
+                if format_souboru == OutputFormat.GdalDb:
+                    vystup = os.path.join(vystupni_adresar, "ctios_{}.db".format(cas))
+                    sharding.merge_db(casti, db_path, vystup, self.logger)
+                elif format_souboru == OutputFormat.Json:
+                    vystup = os.path.join(vystupni_adresar, "ctios_{}.json".format(cas))
+                    sharding.merge_json(casti, vystup)
+                else:
+                    vystup = os.path.join(vystupni_adresar, "ctios_{}.csv".format(cas))
+                    sharding.merge_csv(casti, vystup)
+                vystup_chybnych = self.uloz_vystup_chybnych(
+                    sharding.merge_errors(casti), vystupni_adresar
+                )
+        shutil.rmtree(adresar_casti, ignore_errors=True)
+        klient.log_statistics()
+        self.logger.info("Vystup byl ulozen zde: %s", vystup)
+        return {"vystup": vystup, "vystup chybnych": vystup_chybnych, "casti": casti}
 
     def uloz_vystup_chybnych(
-        self, slovnik_chybnych_identifikatoru: dict, vystupni_adresar: str
+        self,
+        slovnik_chybnych_identifikatoru: dict,
+        vystupni_adresar: str,
+        komprese: Compression = None,
     ):
         """Ulozi slovnik chybnych identifikatoru vraceny metodou posli_pozadavek do json souboru.
 
         :param slovnik_chybnych_identifikatoru: slovnik vraceny pro neuspesne zpracovane identifikatory
         :param vystupni_adresar: cesta k vystupnimu adresari
+        :param komprese: komprese souboru (viz uloz_vystup) nebo None
         """
         # zapsani chybnych identifikatoru do json souboru
         if slovnik_chybnych_identifikatoru:
             cas = datetime.now().strftime("%H_%M_%S_%d_%m_%Y")
             vystupni_soubor = "".join(["ctios_errors_", cas, ".json"])
-            vystupni_cesta = os.path.join(vystupni_adresar, vystupni_soubor)
-            with open(vystupni_cesta, "w", newline="", encoding="utf-8") as f:
+            vystupni_cesta = compressed_path(
+                os.path.join(vystupni_adresar, vystupni_soubor), komprese
+            )
+            with open_output(vystupni_cesta, komprese, self.logger) as f:
                 json.dump(slovnik_chybnych_identifikatoru, f, ensure_ascii=False)
                 self.logger.info(
-                    "Zaznam o nezpracovanych identifikatorech byl ulozen zde: {}".format(
-                        vystupni_cesta
-                    )
+                    "Zaznam o nezpracovanych identifikatorech byl ulozen zde: %s",
+                    vystupni_cesta,
                 )
             return vystupni_cesta
         return None
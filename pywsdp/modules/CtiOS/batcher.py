@@ -0,0 +1,191 @@
+"""
+@package modules.CtiOS.batcher
+
+@brief Micro-batching of single posident lookups for ctiOS service
+
+Classes:
+ - batcher::PosidentBatcher
+
+(C) 2021 Linda Kladivova lindakladivova@gmail.com
+This library is free under the MIT License.
+"""
+
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from pywsdp.base.exceptions import (
+    WSDPError,
+    WSDPPosidentError,
+    WSDPResponseError,
+)
+
+
+class PosidentBatcher:
+    """
+    Collects posidents requested one by one (e.g. by web handlers) and sends them
+    to ctiOS service in requests of batch_size posidents. The batch is sent when it is
+    full or when the oldest waiting posident waits longer than max_wait seconds.
+    Every caller gets its own result (or error) through a future.
+    """
+
+    def __init__(self, send, logger, batch_size=10, max_wait=0.05, max_concurrent=4):
+        """
+        :param send: callable sending list of posidents,
+            returns tuple (dict - xml response, dict - errorneous posidents)
+        :param logger: logging class (WSDPLogger)
+        :param batch_size: max number of posidents in one request (int)
+        :param max_wait: max time the posident waits for the others [s] (float)
+        :param max_concurrent: max number of requests sent at once (int)
+        """
+        if batch_size < 1 or max_wait < 0 or max_concurrent < 1:
+            raise WSDPError(logger, "Invalid parameters of posident batcher")
+        self.send = send
+        self.logger = logger
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.posidents = 0
+        self._pending = OrderedDict()  # posident -> (time of arrival, [futures])
+        self._closed = False
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrent, thread_name_prefix="pywsdp-batch"
+        )
+        self._thread = threading.Thread(
+            target=self._run, name="pywsdp-batcher", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, posident):
+        """
+        Add posident to the next batch.
+        :param posident: str
+        :rtype: concurrent.futures.Future (result is dict with personal data,
+            exception is WSDPPosidentError or error of the whole request)
+        """
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise WSDPError(self.logger, "Posident batcher is closed")
+            if posident in self._pending:
+                # the same posident is sent only once
+                self._pending[posident][1].append(future)
+            else:
+                self._pending[posident] = (time.monotonic(), [future])
+                if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+                    self._condition.notify()
+        return future
+
+    def lookup(self, posident, timeout=None):
+        """
+        Blocking lookup of one posident.
+        :param posident: str
+        :param timeout: max time to wait for the result [s]
+        :rtype: dict
+        """
+        return self.submit(posident).result(timeout)
+
+    async def lookup_async(self, posident):
+        """
+        Lookup of one posident awaitable from asyncio event loop.
+        :param posident: str
+        :rtype: dict
+        """
+        return await asyncio.wrap_future(self.submit(posident))
+
+    def statistics(self):
+        """
+        Number of sent batches, number of sent posidents and average batch fill.
+        :rtype: dict
+        """
+        with self._condition:
+            return {
+                "davky": self.batches,
+                "posidenty": self.posidents,
+                "prumerne_naplneni": self.posidents / self.batches / self.batch_size
+                if self.batches
+                else 0.0,
+            }
+
+    def _next_batch(self):
+        """Wait until the batch should be sent, None after closing."""
+        with self._condition:
+            while True:
+                if self._pending:
+                    oldest = next(iter(self._pending.values()))[0]
+                    remaining = oldest + self.max_wait - time.monotonic()
+                    if (
+                        len(self._pending) >= self.batch_size
+                        or remaining <= 0
+                        or self._closed
+                    ):
+                        batch = []
+                        while self._pending and len(batch) < self.batch_size:
+                            batch.append(self._pending.popitem(last=False))
+                        self.batches += 1
+                        self.posidents += len(batch)
+                        return batch
+                    self._condition.wait(remaining)
+                elif self._closed:
+                    return None
+                else:
+                    self._condition.wait()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._executor.submit(self._send_batch, batch)
+
+    def _send_batch(self, batch):
+        """Send one request and resolve futures of its posidents."""
+        waiting = [
+            (posident, [f for f in futures if f.set_running_or_notify_cancel()])
+            for posident, (_, futures) in batch
+        ]
+        waiting = [(posident, futures) for posident, futures in waiting if futures]
+        if not waiting:
+            return
+        try:
+            response, response_errors = self.send([p for p, _ in waiting])
+        except Exception as exc:
+            for _, futures in waiting:
+                for future in futures:
+                    future.set_exception(exc)
+            return
+        for posident, futures in waiting:
+            if posident in response:
+                for future in futures:
+                    future.set_result(response[posident])
+            else:
+                if posident in response_errors:
+                    exc = WSDPPosidentError(
+                        self.logger, posident, response_errors[posident]
+                    )
+                else:
+                    exc = WSDPResponseError(
+                        self.logger,
+                        "POSIDENT {} IS MISSING IN RESPONSE".format(posident),
+                    )
+                for future in futures:
+                    future.set_exception(exc)
+
+    def close(self):
+        """Send the waiting posidents and stop the batcher."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,172 @@
+"""
+@package modules.CtiOS.cache
+
+@brief Persistent negative cache of posidents failing in ctiOS service
+
+Classes:
+ - cache::NegativeCache
+
+(C) 2021 Linda Kladivova lindakladivova@gmail.com
+This library is free under the MIT License.
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from datetime import timedelta
+
+from pywsdp.base.exceptions import WSDPError
+
+
+# Codes of cached errors stored in the database
+_ERRORS = (
+    "NEPLATNY_IDENTIFIKATOR",
+    "OPRAVNENY_SUBJEKT_NEEXISTUJE",
+    "EXPIROVANY_IDENTIFIKATOR",
+)
+
+# Max number of SQL variables in one query
+_BATCH = 500
+
+
+class NegativeCache:
+    """
+    Persistent set of posidents for which the service returned an error. Only 64-bit
+    hashes of posidents are stored (as SQLite integer primary key), so one entry takes
+    tens of bytes and the cache can hold millions of posidents. Probability of a false
+    hit is about n^2 / 2^65 for n cached posidents (1e-7 for a million).
+    Every error type has its own expiry: invalid posidents and posidents of
+    non-existing subjects never succeed, whereas expiry of posidents depends on time.
+    """
+
+    MAX_AGE = {
+        "NEPLATNY_IDENTIFIKATOR": None,
+        "OPRAVNENY_SUBJEKT_NEEXISTUJE": None,
+        "EXPIROVANY_IDENTIFIKATOR": timedelta(days=1),
+    }
+
+    def __init__(self, path, logger, max_age=None):
+        """
+        :param path: str - path to SQLite file of the cache
+        :param logger: logger object (class Logger)
+        :param max_age: dict - error type: timedelta (None = no limit),
+            only listed error types are cached (default MAX_AGE)
+        """
+        self.path = path
+        self.logger = logger
+        self.max_age = dict(self.MAX_AGE if max_age is None else max_age)
+        unknown = set(self.max_age) - set(_ERRORS)
+        if unknown:
+            raise WSDPError(
+                logger, "Neznamy typ chyby v negativni cache: {}".format(unknown)
+            )
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS posidenty "
+            "(klic INTEGER PRIMARY KEY, chyba INTEGER NOT NULL, cas INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def key(posident):
+        """
+        64-bit signed hash of the posident.
+        :param posident: str
+        :rtype: int
+        """
+        digest = hashlib.blake2b(posident.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big", signed=True)
+
+    def _valid_since(self, error, now):
+        """Oldest time of the valid entry of the error type, None if not cached."""
+        if error not in self.max_age:
+            return None
+        max_age = self.max_age[error]
+        return 0 if max_age is None else now - max_age.total_seconds()
+
+    def filter(self, posidents):
+        """
+        Split posidents to those which have to be sent and those known to fail.
+        :param posidents: list of posidents
+        :rtype: tuple (list - posidents to be sent, dict - posident: cached error)
+        """
+        now = time.time()
+        keys = {self.key(posident): posident for posident in posidents}
+        found = {}
+        with self._lock:
+            items = list(keys)
+            for i in range(0, len(items), _BATCH):
+                batch = items[i : i + _BATCH]
+                rows = self._conn.execute(
+                    "SELECT klic, chyba, cas FROM posidenty WHERE klic IN ({})".format(
+                        ",".join("?" * len(batch))
+                    ),
+                    batch,
+                )
+                for klic, chyba, cas in rows:
+                    error = _ERRORS[chyba]
+                    valid_since = self._valid_since(error, now)
+                    if valid_since is not None and cas >= valid_since:
+                        found[keys[klic]] = error
+        if not found:
+            return posidents, {}
+        return [p for p in posidents if p not in found], {
+            p: found[p] for p in posidents if p in found
+        }
+
+    def add(self, errors):
+        """
+        Store errorneous posidents, only cached error types are stored.
+        :param errors: dict - posident: error returned by the service
+        :rtype: int - number of stored posidents
+        """
+        now = int(time.time())
+        rows = [
+            (self.key(posident), _ERRORS.index(error), now)
+            for posident, error in errors.items()
+            if error in self.max_age
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO posidenty (klic, chyba, cas) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+        return len(rows)
+
+    def purge(self):
+        """
+        Delete expired entries.
+        :rtype: int - number of deleted entries
+        """
+        now = time.time()
+        deleted = 0
+        with self._lock:
+            for code, error in enumerate(_ERRORS):
+                valid_since = self._valid_since(error, now)
+                if valid_since is None:
+                    cursor = self._conn.execute(
+                        "DELETE FROM posidenty WHERE chyba = ?", (code,)
+                    )
+                else:
+                    cursor = self._conn.execute(
+                        "DELETE FROM posidenty WHERE chyba = ? AND cas < ?",
+                        (code, valid_since),
+                    )
+                deleted += cursor.rowcount
+            self._conn.commit()
+        return deleted
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM posidenty").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
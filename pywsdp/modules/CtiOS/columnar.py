@@ -0,0 +1,240 @@
+"""
+@package modules.CtiOS.columnar
+
+@brief Columnar (Parquet, Arrow IPC/Feather) output of ctiOS personal data
+
+Classes:
+ - columnar::ColumnarWriter
+
+(C) 2021 Linda Kladivova lindakladivova@gmail.com
+This library is free under the MIT License.
+"""
+
+from datetime import date, datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is an optional dependency
+    pa = None
+
+from pywsdp.base.exceptions import WSDPError
+
+
+# Types of osDetail elements: string, dictionary (repeated strings),
+# int32, int64, timestamp and date
+OS_DETAIL_TYPES = {
+    "osId": "string",
+    "stavDat": "int32",
+    "datumVzniku": "timestamp",
+    "datumZaniku": "timestamp",
+    "priznakKontext": "int32",
+    "rizeniIdVzniku": "int64",
+    "rizeniIdZaniku": "int64",
+    "partnerBsm1": "int64",
+    "partnerBsm2": "int64",
+    "opsubType": "dictionary",
+    "charOsType": "int32",
+    "ico": "int64",
+    "doplnekIco": "int32",
+    "nazev": "string",
+    "nazevU": "string",
+    "rodneCislo": "string",
+    "titulPredJmenem": "dictionary",
+    "jmeno": "dictionary",
+    "jmenoU": "dictionary",
+    "prijmeni": "string",
+    "prijmeniU": "string",
+    "titulZaJmenem": "dictionary",
+    "cisloDomovni": "int32",
+    "cisloOrientacni": "int32",
+    "nazevUlice": "dictionary",
+    "castObce": "dictionary",
+    "obec": "dictionary",
+    "okres": "dictionary",
+    "stat": "dictionary",
+    "psc": "int32",
+    "mestskaCast": "dictionary",
+    "cpCe": "int32",
+    "datumNarozeni": "date",
+    "kodAdresnihoMista": "int64",
+    "idNadrizenePravnickeOsoby": "int64",
+}
+
+
+def _arrow_type(name, dictionary=True):
+    if name == "dictionary" and not dictionary:
+        return pa.string()
+    return {
+        "string": pa.string(),
+        "dictionary": pa.dictionary(pa.int32(), pa.string()),
+        "int32": pa.int32(),
+        "int64": pa.int64(),
+        "timestamp": pa.timestamp("ms"),
+        "date": pa.date32(),
+    }[name]
+
+
+def _to_int(value):
+    if value is None or value == "":
+        return None
+    return int(value)
+
+
+def _to_datetime(value):
+    if value is None or value == "" or isinstance(value, datetime):
+        return value or None
+    return datetime.fromisoformat(value)
+
+
+def _to_date(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(value).date()
+
+
+def _to_str(value):
+    return None if value is None else str(value)
+
+
+CONVERTERS = {
+    "string": _to_str,
+    "dictionary": _to_str,
+    "int32": _to_int,
+    "int64": _to_int,
+    "timestamp": _to_datetime,
+    "date": _to_date,
+}
+
+
+class ColumnarWriter:
+    """
+    Writes personal data of posidents to Parquet or Arrow IPC (Feather v2) file
+    with typed schema - dates as timestamps, codes as integers and repeated strings
+    dictionary encoded. Rows are buffered and written by row groups (record batches)
+    of row_group_size rows, so results can be written while they are downloaded.
+    Elements not known by the schema are stored as strings when they appear in the
+    first row group, later ones are skipped with a warning.
+    Arrow IPC file format does not allow different dictionaries in record batches,
+    so Feather output stores repeated strings as plain strings.
+    """
+
+    FORMATS = ("parquet", "feather")
+
+    def __init__(self, path, file_format, logger, row_group_size=10000):
+        """
+        :param path: str - path to output file
+        :param file_format: str - parquet or feather
+        :param logger: logger object (class Logger)
+        :param row_group_size: int - number of rows in one row group
+        """
+        if pa is None:
+            raise WSDPError(
+                logger,
+                "Pro vystup ve formatu {} je nutne nainstalovat knihovnu pyarrow".format(
+                    file_format
+                ),
+            )
+        if file_format not in self.FORMATS:
+            raise WSDPError(logger, "Format {} neni podporovan".format(file_format))
+        if row_group_size < 1:
+            raise WSDPError(logger, "Invalid size of row group")
+        self.path = path
+        self.file_format = file_format
+        self.logger = logger
+        self.row_group_size = row_group_size
+        self.rows = 0
+        self.row_groups = 0
+        self._buffer = []
+        self._types = None
+        self._writer = None
+        self._skipped = set()
+        self._dictionary = file_format == "parquet"
+
+    def _create_writer(self):
+        """Derive schema from the known elements and the first buffered rows."""
+        self._types = {"posident": "string"}
+        self._types.update(OS_DETAIL_TYPES)
+        for _, udaje in self._buffer:
+            for key in udaje:
+                self._types.setdefault(key, "string")
+        self.schema = pa.schema(
+            [
+                pa.field(name, _arrow_type(kind, self._dictionary))
+                for name, kind in self._types.items()
+            ]
+        )
+        if self.file_format == "parquet":
+            self._writer = pq.ParquetWriter(self.path, self.schema, compression="zstd")
+        else:
+            self._writer = pa.ipc.new_file(
+                self.path,
+                self.schema,
+                options=pa.ipc.IpcWriteOptions(compression="zstd"),
+            )
+
+    def write(self, results):
+        """
+        Add personal data of posidents, full row groups are written immediately.
+        :param results: dict - posident: personal data (osDetail)
+        """
+        self._buffer.extend(results.items())
+        while len(self._buffer) >= self.row_group_size:
+            self._flush(self._buffer[: self.row_group_size])
+            self._buffer = self._buffer[self.row_group_size :]
+
+    def _flush(self, rows):
+        if self._writer is None:
+            self._create_writer()
+        columns = []
+        for name, kind in self._types.items():
+            convert = CONVERTERS[kind]
+            if name == "posident":
+                values = [posident for posident, _ in rows]
+            else:
+                try:
+                    values = [convert(udaje.get(name)) for _, udaje in rows]
+                except (TypeError, ValueError) as exc:
+                    raise WSDPError(
+                        self.logger,
+                        "Neplatna hodnota elementu {}: {}".format(name, exc),
+                    ) from exc
+            if kind == "dictionary" and self._dictionary:
+                columns.append(pa.array(values, pa.string()).dictionary_encode())
+            else:
+                columns.append(pa.array(values, _arrow_type(kind, self._dictionary)))
+        unknown = set(k for _, udaje in rows for k in udaje) - set(self._types)
+        if unknown - self._skipped:
+            self.logger.warning(
+                "Elementy %s nejsou ve schematu vystupu a nebudou ulozeny",
+                ", ".join(sorted(unknown - self._skipped)),
+            )
+            self._skipped |= unknown
+        batch = pa.RecordBatch.from_arrays(columns, schema=self.schema)
+        if self.file_format == "parquet":
+            self._writer.write_batch(batch, row_group_size=len(rows))
+        else:
+            self._writer.write_batch(batch)
+        self.rows += len(rows)
+        self.row_groups += 1
+
+    def close(self):
+        """Write the rest of rows and close the file."""
+        if self._buffer or self._writer is None:
+            self._flush(self._buffer)
+            self._buffer = []
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self._writer is not None:
+            # do not write the rest of rows after a failure
+            self._writer.close()
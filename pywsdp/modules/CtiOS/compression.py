@@ -0,0 +1,157 @@
+"""
+@package modules.CtiOS.compression
+
+@brief Streaming compression of text outputs (JSON, CSV, errors)
+
+Outputs are compressed in one pass while they are written. Gzip output is
+compressed in parallel by independent gzip members (zlib releases the GIL),
+zstd uses threads of the zstd library, lz4 compresses in the writing thread.
+
+Classes:
+ - compression::ParallelGzipWriter
+
+(C) 2021 Linda Kladivova lindakladivova@gmail.com
+This library is free under the MIT License.
+"""
+
+import io
+import os
+import gzip
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:  # zstandard is an optional dependency
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:  # lz4 is an optional dependency
+    lz4 = None
+
+from pywsdp.base.exceptions import WSDPError
+from pywsdp.modules.CtiOS.formats import Compression
+
+
+EXTENSIONS = {
+    Compression.Gzip: ".gz",
+    Compression.Zstd: ".zst",
+    Compression.Lz4: ".lz4",
+}
+
+_LIBRARIES = {
+    Compression.Zstd: ("zstandard", lambda: zstandard),
+    Compression.Lz4: ("lz4", lambda: lz4),
+}
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    """
+    Binary writer compressing blocks of block_size bytes to separate gzip members
+    in a thread pool. Concatenated members are a valid gzip file readable by gzip
+    module and gunzip. At most 2 * threads blocks are compressed at once.
+    """
+
+    def __init__(self, path, level=6, threads=None, block_size=1 << 20):
+        """
+        :param path: str - path to output file
+        :param level: int - compression level (1-9)
+        :param threads: int - number of compressing threads (default number of CPUs)
+        :param block_size: int - size of uncompressed block in bytes
+        """
+        super().__init__()
+        self.level = level
+        self.threads = threads or os.cpu_count() or 1
+        self.block_size = block_size
+        self._file = open(path, "wb")
+        self._buffer = bytearray()
+        self._pending = deque()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.threads, thread_name_prefix="pywsdp-gzip"
+        )
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            self._submit(bytes(self._buffer[: self.block_size]))
+            del self._buffer[: self.block_size]
+        return len(data)
+
+    def _submit(self, block):
+        self._pending.append(
+            self._executor.submit(gzip.compress, block, self.level, mtime=0)
+        )
+        while len(self._pending) > 2 * self.threads:
+            self._file.write(self._pending.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._buffer or not self._pending:
+                self._submit(bytes(self._buffer))
+                self._buffer = bytearray()
+            while self._pending:
+                self._file.write(self._pending.popleft().result())
+        finally:
+            self._executor.shutdown()
+            self._file.close()
+            super().close()
+
+
+def check_compression(compression, logger):
+    """
+    Check that the library of the compression is installed.
+    Raises:
+        WSDPError: unknown compression or missing library
+    :param compression: Compression or None
+    """
+    if compression is None or compression == Compression.Gzip:
+        return
+    if compression not in _LIBRARIES:
+        raise WSDPError(logger, "Komprese {} neni podporovana".format(compression))
+    name, module = _LIBRARIES[compression]
+    if module() is None:
+        raise WSDPError(
+            logger,
+            "Pro kompresi {} je nutne nainstalovat knihovnu {}".format(
+                compression.name.lower(), name
+            ),
+        )
+
+
+def compressed_path(path, compression):
+    """Path to output file with extension of the compression."""
+    if compression is None:
+        return path
+    return path + EXTENSIONS[compression]
+
+
+def open_output(path, compression, logger, level=None, threads=None):
+    """
+    Open text output file compressed while written.
+    Raises:
+        WSDPError: unknown compression or missing library
+    :param path: str - path to output file (including extension of the compression)
+    :param compression: Compression or None (uncompressed file)
+    :param level: int - compression level, default of the codec if None
+    :param threads: int - number of compressing threads (gzip, zstd), number of CPUs if None
+    :rtype: text file object
+    """
+    check_compression(compression, logger)
+    if compression is None:
+        return open(path, "w", newline="", encoding="utf-8")
+    if compression == Compression.Gzip:
+        raw = io.BufferedWriter(
+            ParallelGzipWriter(path, level=level or 6, threads=threads)
+        )
+    elif compression == Compression.Zstd:
+        compressor = zstandard.ZstdCompressor(level=level or 3, threads=threads or -1)
+        raw = compressor.stream_writer(open(path, "wb"))
+    else:
+        raw = lz4.frame.open(path, "wb", compression_level=level or 0)
+    return io.TextIOWrapper(raw, encoding="utf-8", newline="")
@@ -0,0 +1,106 @@
+"""
+@package modules.CtiOS.dataframe
+
+@brief Columnar collection of ctiOS personal data to pandas DataFrame
+
+Classes:
+ - dataframe::DataFrameCollector
+
+(C) 2021 Linda Kladivova lindakladivova@gmail.com
+This library is free under the MIT License.
+"""
+
+try:
+    import pandas as pd
+except ImportError:  # pandas is an optional dependency
+    pd = None
+
+from pywsdp.base.exceptions import WSDPError
+from pywsdp.modules.CtiOS.columnar import OS_DETAIL_TYPES, CONVERTERS
+
+
+def _series_data(kind, values):
+    """Typed pandas array of one column."""
+    if kind == "int32":
+        return pd.array(values, dtype="Int32")
+    if kind == "int64":
+        return pd.array(values, dtype="Int64")
+    if kind == "timestamp":
+        # mixed offsets (winter +01:00, summer +02:00) are converted to UTC
+        # like in the Parquet output, naive values are taken as UTC
+        return pd.to_datetime(values, utc=True)
+    if kind == "date":
+        return pd.to_datetime(values)
+    if kind == "dictionary":
+        return pd.Categorical(values)
+    return pd.array(values, dtype="string")
+
+
+class DataFrameCollector:
+    """
+    Collects personal data of posidents chunk by chunk to typed column buffers
+    (one list per osDetail element, values converted when appended) and builds
+    pandas DataFrame once at the end. Responses are not merged to one nested
+    dictionary of all posidents. Types of columns are the same as in the
+    Parquet output - dates as datetimes (timestamps in UTC), codes as nullable integers and
+    repeated strings as categories. Unknown elements are stored as strings.
+    """
+
+    def __init__(self, logger):
+        """
+        :param logger: logger object (class Logger)
+        """
+        if pd is None:
+            raise WSDPError(
+                logger, "Pro vystup do DataFrame je nutne nainstalovat knihovnu pandas"
+            )
+        self.logger = logger
+        self.rows = 0
+        self._posidents = []
+        self._types = {}
+        self._columns = {}
+        self._appenders = []
+        for name, kind in OS_DETAIL_TYPES.items():
+            self._add_column(name, kind)
+
+    def _add_column(self, name, kind):
+        values = [None] * self.rows
+        self._types[name] = kind
+        self._columns[name] = values
+        self._appenders.append((name, values.append, CONVERTERS[kind]))
+
+    def add(self, results):
+        """
+        Append personal data of one chunk of posidents.
+        :param results: dict - posident: personal data (osDetail)
+        """
+        columns = self._columns
+        for posident, udaje in results.items():
+            if not udaje.keys() <= columns.keys():
+                for key in udaje.keys() - columns.keys():
+                    # element unknown by the schema, earlier rows are empty
+                    self._add_column(key, "string")
+            get = udaje.get
+            for name, append, convert in self._appenders:
+                append(convert(get(name)))
+            self._posidents.append(posident)
+            self.rows += 1
+
+    def frames(self, errors):
+        """
+        Build data frames of results and errors.
+        :param errors: dict - posident: error
+        :rtype: tuple (pandas.DataFrame - personal data indexed by posident,
+            pandas.DataFrame - errorneous posidents with column chyba)
+        """
+        index = pd.Index(self._posidents, name="posident", dtype="string")
+        data = {
+            name: _series_data(self._types[name], values)
+            for name, values in self._columns.items()
+        }
+        frame = pd.DataFrame(data, index=index)
+        errors_frame = pd.DataFrame(
+            {"chyba": pd.Categorical(list(errors.values()))},
+            index=pd.Index(list(errors), name="posident", dtype="string"),
+        )
+        return frame, errors_frame
@@ -5,6 +5,7 @@
 
 Classes:
  - CtiOS::OutputFormat
+ - CtiOS::Compression
 
 (C) 2021 Linda Kladivova lindakladivova@gmail.com
 This library is free under the MIT License.
@@ -21,3 +22,15 @@ class OutputFormat(Enum):
     GdalDb = 1
     Json = 2
     Csv = 3
+    Parquet = 4
+    Feather = 5
+
+
+class Compression(Enum):
+    """
+    Compressions of text output files (JSON, CSV).
+    """
+
+    Gzip = 1
+    Zstd = 2
+    Lz4 = 3
@@ -175,27 +175,34 @@ class DbManager:
 
     def update_rows_in_db(self, dictionary):
         """
-        Save attribute dictionary to db
+        Save attribute dictionary to db. Rows with the same set of attributes
+        are updated by one bulk statement in one transaction.
         Raises:
             WSDPError: SQLite error
         :param dictionary: nested dict - XML atributes mapped to DB space
 
         """
+        groups = {}
+        for posident_id, posident_info in dictionary.items():
+            columns = tuple(posident_info)
+            groups.setdefault(columns, []).append(
+                (*posident_info.values(), posident_id)
+            )
+        cur = self.conn.cursor()
         try:
-            cur = self.conn.cursor()
             cur.execute("BEGIN TRANSACTION")
-            for posident_id, posident_info in dictionary.items():
+            for columns, rows in groups.items():
                 #  Update table OPSUB by database attributes items
-                for dat_name in posident_info:
-                    cur.execute(
-                        """UPDATE {0} SET {1} = ? WHERE id = ?""".format(
-                            self.schema, dat_name
-                        ),
-                        (posident_info[dat_name], posident_id),
-                    )
-                cur.execute("COMMIT TRANSACTION")
+                cur.executemany(
+                    """UPDATE {0} SET {1} WHERE id = ?""".format(
+                        self.schema, ", ".join("{} = ?".format(c) for c in columns)
+                    ),
+                    rows,
+                )
+            cur.execute("COMMIT TRANSACTION")
         except self.conn.Error as exc:
-            cur.execute("ROLLBACK TRANSACTION")
+            if self.conn.in_transaction:
+                cur.execute("ROLLBACK TRANSACTION")
             cur.close()
             raise WSDPError(self.logger, "Transaction failed!: {}".format(exc)) from exc
 
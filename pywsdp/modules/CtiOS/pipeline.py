@@ -0,0 +1,218 @@
+"""
+@package modules.CtiOS.pipeline
+
+@brief Pipelined enrichment of SQLite database by ctiOS personal data
+
+Requests to ctiOS service, conversion of responses to database columns and
+updates of the database run at once in three stages connected by bounded queues,
+so the database is written while the next requests are still on the network.
+
+Classes:
+ - pipeline::EnrichmentPipeline
+
+(C) 2021 Linda Kladivova lindakladivova@gmail.com
+This library is free under the MIT License.
+"""
+
+import time
+import queue
+import threading
+
+from pywsdp.base.exceptions import WSDPError
+from pywsdp.modules.CtiOS.helpers import DbManager
+
+# End of the stream sent by every producer and by the converter
+_END = object()
+
+
+class EnrichmentPipeline:
+    """
+    Producer stage (max_concurrent threads sending requests), conversion stage
+    (one thread) and single-writer stage (one thread owning the SQLite connection).
+    Bounded queues between the stages keep the memory limited - a fast network
+    waits for a slow disk and vice versa. The writer commits every commit_size rows.
+    When any stage fails, producers stop sending, the other stages drain the queues
+    and the first error is raised by run.
+    """
+
+    def __init__(
+        self,
+        send,
+        convert,
+        db_path,
+        logger,
+        chunk_size=10,
+        max_concurrent=4,
+        queue_size=16,
+        commit_size=1000,
+    ):
+        """
+        :param send: callable sending list of posidents,
+            returns tuple (dict - xml response, dict - errorneous posidents)
+        :param convert: callable converting xml response to database rows (dict)
+        :param db_path: path to updated SQLite database (str)
+        :param logger: logging class (WSDPLogger)
+        :param chunk_size: number of posidents in one request (int)
+        :param max_concurrent: number of requests sent at once (int)
+        :param queue_size: max number of responses waiting in one queue (int)
+        :param commit_size: number of rows updated in one transaction (int)
+        """
+        if chunk_size < 1 or max_concurrent < 1 or queue_size < 1 or commit_size < 1:
+            raise WSDPError(logger, "Invalid parameters of enrichment pipeline")
+        self.send = send
+        self.convert = convert
+        self.db_path = db_path
+        self.logger = logger
+        self.chunk_size = chunk_size
+        self.max_concurrent = max_concurrent
+        self.queue_size = queue_size
+        self.commit_size = commit_size
+
+    def run(self, posidents):
+        """
+        Send posidents and write their personal data to the database.
+        Raises:
+            WSDPError: the first error of any stage
+        :param posidents: list of unique posidents
+        :rtype: tuple (dict - statistics, dict - errorneous posidents)
+        """
+        self._failure = None
+        self._stop = threading.Event()
+        self._chunks = iter(
+            [
+                posidents[i : i + self.chunk_size]
+                for i in range(0, len(posidents), self.chunk_size)
+            ]
+        )
+        self._chunks_lock = threading.Lock()
+        self._stats = {
+            "pozadavky": 0,
+            "aktualizovano": 0,
+            "transakce": 0,
+            "cas konverze": 0.0,
+            "cas zapisu": 0.0,
+        }
+        self._errors = {}
+        responses = queue.Queue(self.queue_size)
+        rows = queue.Queue(self.queue_size)
+        threads = [
+            threading.Thread(
+                target=self._produce,
+                args=(responses,),
+                name="pywsdp-pipeline-send-{}".format(i),
+                daemon=True,
+            )
+            for i in range(self.max_concurrent)
+        ]
+        threads.append(
+            threading.Thread(
+                target=self._convert,
+                args=(responses, rows),
+                name="pywsdp-pipeline-convert",
+                daemon=True,
+            )
+        )
+        threads.append(
+            threading.Thread(
+                target=self._write,
+                args=(rows,),
+                name="pywsdp-pipeline-write",
+                daemon=True,
+            )
+        )
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self._stats["cas"] = time.monotonic() - start
+        if self._failure is not None:
+            raise self._failure
+        return self._stats, self._errors
+
+    def _fail(self, exc):
+        if self._failure is None:
+            self._failure = exc
+        self._stop.set()
+
+    def _next_chunk(self):
+        with self._chunks_lock:
+            if self._stop.is_set():
+                return None
+            return next(self._chunks, None)
+
+    def _produce(self, responses):
+        try:
+            while True:
+                chunk = self._next_chunk()
+                if chunk is None:
+                    break
+                try:
+                    response = self.send(chunk)
+                except Exception as exc:
+                    self._fail(exc)
+                    break
+                responses.put(response)
+        finally:
+            responses.put(_END)
+
+    def _convert(self, responses, rows):
+        running = self.max_concurrent
+        try:
+            while running:
+                item = responses.get()
+                if item is _END:
+                    running -= 1
+                    continue
+                if self._stop.is_set():
+                    # drain the queue, producers are stopping
+                    continue
+                results, errors = item
+                self._stats["pozadavky"] += 1
+                self._errors.update(errors)
+                if not results:
+                    continue
+                start = time.monotonic()
+                try:
+                    converted = self.convert(results)
+                except Exception as exc:
+                    self._fail(exc)
+                    continue
+                self._stats["cas konverze"] += time.monotonic() - start
+                rows.put(converted)
+        finally:
+            rows.put(_END)
+
+    def _write(self, rows):
+        db = None
+        item = None
+        pending = {}
+        try:
+            db = DbManager(self.db_path, self.logger)
+            while True:
+                item = rows.get()
+                if item is _END:
+                    break
+                if self._stop.is_set():
+                    continue
+                pending.update(item)
+                if len(pending) >= self.commit_size:
+                    self._commit(db, pending)
+                    pending = {}
+            if pending and not self._stop.is_set():
+                self._commit(db, pending)
+        except Exception as exc:
+            self._fail(exc)
+            # the other stages must not block on the full queue
+            while item is not _END:
+                item = rows.get()
+        finally:
+            if db is not None:
+                db.close_connection()
+
+    def _commit(self, db, pending):
+        start = time.monotonic()
+        db.update_rows_in_db(pending)
+        self._stats["cas zapisu"] += time.monotonic() - start
+        self._stats["aktualizovano"] += len(pending)
+        self._stats["transakce"] += 1
@@ -0,0 +1,384 @@
+"""
+@package modules.CtiOS.sharding
+
+@brief Multi-process sharded processing of large posident sets
+
+Posidents of the input database are partitioned to shards by keyset ranges
+over OPSUB.ID or by hash (computed once in the parent process). Every shard runs in its own process with its own client
+and appends results to its journal (JSON lines), so an interrupted run continues
+where it stopped. Journals are merged into one output of the requested format.
+
+Classes:
+ - sharding::ShardJournal
+
+(C) 2021 Linda Kladivova lindakladivova@gmail.com
+This library is free under the MIT License.
+"""
+
+import os
+import csv
+import json
+import zlib
+import shutil
+import sqlite3
+
+from pywsdp.base.exceptions import WSDPError
+from pywsdp.clients.helpers.ctiOS import Counter
+from pywsdp.modules.CtiOS.helpers import AttributeConverter, DbManager
+
+# Number of requests between two writes of the journal
+_REQUESTS_PER_WRITE = 10
+
+
+class ShardJournal:
+    """
+    Journal of one shard - JSON lines with results of processed posidents
+    and numbers of sent requests.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: str - path to journal file
+        """
+        self.path = path
+        self.requests = 0
+
+    def read(self):
+        """
+        Read processed posidents, number of requests of all runs is set to self.requests.
+        :rtype: tuple (dict - posident: personal data, dict - posident: error)
+        """
+        results = {}
+        errors = {}
+        self.requests = 0
+        if not os.path.exists(self.path):
+            return results, errors
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # last line of interrupted run
+                    continue
+                if "posident" not in record:
+                    self.requests += record.get("pozadavky", 0)
+                elif "chyba" in record:
+                    errors[record["posident"]] = record["chyba"]
+                else:
+                    results[record["posident"]] = record["udaje"]
+        return results, errors
+
+    def _truncate_incomplete(self):
+        """Remove the incomplete last line written by interrupted run."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                start = max(0, position - 65536)
+                f.seek(start)
+                block = f.read(position - start)
+                newline = block.rfind(b"\n")
+                if newline >= 0:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position < end:
+                f.truncate(position)
+
+    def append(self, results, errors, requests=0):
+        """
+        Append results of processed posidents and number of requests sent for them.
+        """
+        self._truncate_incomplete()
+        with open(self.path, "a", encoding="utf-8") as f:
+            for posident, udaje in results.items():
+                f.write(
+                    json.dumps(
+                        {"posident": posident, "udaje": udaje},
+                        ensure_ascii=False,
+                        default=str,
+                    )
+                    + "\n"
+                )
+            for posident, chyba in errors.items():
+                f.write(json.dumps({"posident": posident, "chyba": chyba}) + "\n")
+            if requests:
+                f.write(json.dumps({"pozadavky": requests}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def shard_of(posident, shards):
+    """Shard of the posident by stable hash."""
+    return zlib.crc32(posident.encode("utf-8")) % shards
+
+
+def key_ranges(db_path, shards, logger):
+    """
+    Split OPSUB.ID to keyset ranges with the same number of posidents.
+    :rtype: list of tuples (lower bound including, upper bound excluding), None = unbounded
+    """
+    db = DbManager(db_path, logger)
+    try:
+        count = db.conn.execute("SELECT COUNT(DISTINCT ID) FROM OPSUB").fetchone()[0]
+        bounds = [None]
+        for i in range(1, shards):
+            row = db.conn.execute(
+                "SELECT ID FROM (SELECT DISTINCT ID FROM OPSUB ORDER BY ID) "
+                "LIMIT 1 OFFSET ?",
+                (count * i // shards,),
+            ).fetchone()
+            if row and row[0] != bounds[-1]:
+                bounds.append(row[0])
+        bounds.append(None)
+    except sqlite3.Error as exc:
+        raise WSDPError(logger, exc) from exc
+    finally:
+        db.close_connection()
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def split_by_hash(db_path, paths, logger):
+    """
+    Split posidents of the input database to shards by hash in one pass. Posidents
+    of every shard are written to its file (one posident per line), so the worker
+    processes do not read and hash the whole table again.
+    :param paths: list of str - paths to files of shards
+    """
+    db = DbManager(db_path, logger)
+    files = [open(path, "w", encoding="utf-8") for path in paths]
+    try:
+        for (posident,) in db.conn.execute("SELECT DISTINCT ID FROM OPSUB ORDER BY ID"):
+            if posident is not None:
+                files[shard_of(posident, len(files))].write(posident + "\n")
+    except sqlite3.Error as exc:
+        raise WSDPError(logger, exc) from exc
+    finally:
+        for f in files:
+            f.close()
+        db.close_connection()
+
+
+def _shard_posidents(db_path, task, logger):
+    """Posidents of one shard read from the input database or file of the shard."""
+    if task["rozdeleni"] == "hash":
+        with open(task["posidenty"], encoding="utf-8") as f:
+            return [line.rstrip("\n") for line in f if line.strip()]
+    db = DbManager(db_path, logger)
+    try:
+        lower, upper = task["rozsah"]
+        conditions = []
+        params = []
+        if lower is not None:
+            conditions.append("ID >= ?")
+            params.append(lower)
+        if upper is not None:
+            conditions.append("ID < ?")
+            params.append(upper)
+        sql = "SELECT DISTINCT ID FROM OPSUB{} ORDER BY ID".format(
+            " WHERE " + " AND ".join(conditions) if conditions else ""
+        )
+        rows = db.conn.execute(sql, params)
+        return [row[0] for row in rows if row[0] is not None]
+    except sqlite3.Error as exc:
+        raise WSDPError(logger, exc) from exc
+    finally:
+        db.close_connection()
+
+
+def run_shard(task):
+    """
+    Process one shard (runs in the worker process).
+    Raises:
+        RuntimeError: processing of the shard failed (WSDPError holds the logger
+            and cannot be passed to the parent process)
+    :param task: dict - description of the shard (see CtiOS.zpracuj_paralelne)
+    :rtype: dict - statistics and paths of the shard outputs
+    """
+    try:
+        return _run_shard(task)
+    except WSDPError as exc:
+        raise RuntimeError("Cast {}: {}".format(task["cast"], exc.args[-1])) from None
+
+
+def _run_shard(task):
+    # imported here, the module is imported by CtiOS module itself
+    from pywsdp.clients import factory
+    from pywsdp.modules.CtiOS import CtiOS, _XML2DB_mapping
+
+    factory.set_wsdls(task["wsdls"], trial=True)
+    factory.set_wsdls(task["wsdls_ostre"], trial=False)
+    ctios = CtiOS(task["creds"], trial=task["trial"])
+    ctios.log_adresar = task["log_adresar"]
+    ctios.logovani_posidentu = task["logovani_posidentu"]
+    klient = ctios.client
+
+    posidents = _shard_posidents(task["db_path"], task, ctios.logger)
+    journal = ShardJournal(task["denik"])
+    results, errors = journal.read()
+    remaining = [p for p in posidents if p not in results and p not in errors]
+    ctios.logger.info(
+        "Cast %s: %s POSIdentu, z toho %s jiz zpracovano",
+        task["cast"],
+        len(posidents),
+        len(posidents) - len(remaining),
+    )
+
+    step = klient.posidents_per_request * _REQUESTS_PER_WRITE
+    for i in range(0, len(remaining), step):
+        partial_results = {}
+        partial_errors = {}
+        requests = klient.number_of_requests
+        for j in range(i, min(i + step, len(remaining)), klient.posidents_per_request):
+            chunk = remaining[j : j + klient.posidents_per_request]
+            chunk_results, chunk_errors = klient.send_chunk(chunk)
+            partial_results.update(chunk_results)
+            partial_errors.update(chunk_errors)
+        journal.append(
+            partial_results, partial_errors, klient.number_of_requests - requests
+        )
+        results.update(partial_results)
+        errors.update(partial_errors)
+        journal.requests += klient.number_of_requests - requests
+
+    keys = sorted(set(k for udaje in results.values() for k in udaje))
+    part_db = None
+    if task["format"] == "GdalDb":
+        part_db = task["denik"][: -len(".jsonl")] + ".db"
+        _write_part_db(part_db, task["db_path"], results, _XML2DB_mapping, ctios.logger)
+
+    # statistics of all runs of the shard, including the interrupted ones
+    counter = Counter()
+    for chyba in errors.values():
+        counter.add_error(chyba)
+    counter.uspesne_stazeno = len(results)
+    return {
+        "cast": task["cast"],
+        "denik": task["denik"],
+        "db": part_db,
+        "klice": keys,
+        "posidenty": len(posidents),
+        "uspesne": len(results),
+        "chybne": len(errors),
+        "pozadavky": journal.requests,
+        "neplatny_identifikator": counter.neplatny_identifikator,
+        "expirovany_identifikator": counter.expirovany_identifikator,
+        "opravneny_subjekt_neexistuje": counter.opravneny_subjekt_neexistuje,
+        "uspesne_stazeno": counter.uspesne_stazeno,
+    }
+
+
+def _write_part_db(part_db, db_path, results, mapping, logger):
+    """Convert results of the shard to DB columns and save them to part database."""
+    db = DbManager(db_path, logger)
+    columns = db.get_columns_names()
+    db.close_connection()
+    if "OS_ID" not in columns:
+        columns.append("OS_ID")
+    converted = AttributeConverter(
+        mapping, results, columns, logger
+    ).convert_attributes()
+    names = sorted(set(k for row in converted.values() for k in row))
+    if os.path.exists(part_db):
+        os.remove(part_db)
+    conn = sqlite3.connect(part_db)
+    try:
+        conn.execute(
+            "CREATE TABLE vysledky (ID TEXT PRIMARY KEY{})".format(
+                "".join(", {}".format(name) for name in names)
+            )
+        )
+        conn.executemany(
+            "INSERT INTO vysledky VALUES (?{})".format(", ?" * len(names)),
+            (
+                [posident] + [row.get(name) for name in names]
+                for posident, row in converted.items()
+            ),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _journal_records(shards):
+    """Records of processed posidents from journals of the shards."""
+    for shard in shards:
+        with open(shard["denik"], encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if "posident" in record:
+                    yield record
+
+
+def merge_errors(shards):
+    """Errorneous posidents of all shards."""
+    return {
+        record["posident"]: record["chyba"]
+        for record in _journal_records(shards)
+        if "chyba" in record
+    }
+
+
+def merge_json(shards, output_path):
+    """Merge journals to one JSON object (same as output of CtiOS.uloz_vystup)."""
+    with open(output_path, "w", newline="", encoding="utf-8") as f:
+        f.write("{")
+        first = True
+        for record in _journal_records(shards):
+            if "chyba" in record:
+                continue
+            if not first:
+                f.write(", ")
+            first = False
+            f.write(json.dumps(record["posident"]))
+            f.write(": ")
+            f.write(json.dumps(record["udaje"], ensure_ascii=False))
+        f.write("}")
+
+
+def merge_csv(shards, output_path):
+    """Merge journals to one CSV file (same as output of CtiOS.uloz_vystup)."""
+    header = sorted(set(k for shard in shards for k in shard["klice"]))
+    with open(output_path, "w", newline="") as f:
+        write = csv.writer(f)
+        write.writerow(["posident", *header])
+        for record in _journal_records(shards):
+            if "chyba" not in record:
+                udaje = record["udaje"]
+                write.writerow(
+                    [record["posident"]] + [udaje.get(i, "") for i in header]
+                )
+
+
+def merge_db(shards, db_path, output_path, logger):
+    """Copy input database and update it by part databases of shards (SQLite ATTACH)."""
+    shutil.copyfile(db_path, output_path)
+    db = DbManager(output_path, logger)
+    db.add_column_to_db("OS_ID", "text")
+    conn = db.conn
+    try:
+        for shard in shards:
+            conn.execute("ATTACH DATABASE ? AS cast_db", (shard["db"],))
+            names = [
+                row[1]
+                for row in conn.execute("PRAGMA cast_db.table_info(vysledky)")
+                if row[1] != "ID"
+            ]
+            if names:
+                conn.execute(
+                    "UPDATE OPSUB SET ({0}) = (SELECT {0} FROM cast_db.vysledky AS c "
+                    "WHERE c.ID = OPSUB.ID) WHERE ID IN (SELECT ID FROM cast_db.vysledky)".format(
+                        ", ".join(names)
+                    )
+                )
+            conn.commit()
+            conn.execute("DETACH DATABASE cast_db")
+    except sqlite3.Error as exc:
+        raise WSDPError(logger, "Slouceni databazi selhalo: {}".format(exc)) from exc
+    finally:
+        db.close_connection()
@@ -11,10 +11,18 @@ This library is free under the MIT License.
 """
 
 import os
-import base64
 from datetime import datetime
 
 from pywsdp.base import SestavyBase
+from pywsdp.base.exceptions import WSDPError
+from pywsdp.clients.helpers.generujCenoveUdajeDleKu import Base64StreamDecoder
+from pywsdp.modules.GenerujCenoveUdajeDleKu.cache import ReportCache
+from pywsdp.modules.GenerujCenoveUdajeDleKu.dataset import PriceDataset
+from pywsdp.modules.GenerujCenoveUdajeDleKu.analytics import PriceStatistics
+from pywsdp.modules.GenerujCenoveUdajeDleKu.helpers import ReportJobRunner
+
+# Velikost bloku pri stahovani a dekodovani souboru sestavy
+_VELIKOST_BLOKU = 1024 * 1024
 
 
 class GenerujCenoveUdajeDleKu(SestavyBase):
@@ -26,22 +34,226 @@ class GenerujCenoveUdajeDleKu(SestavyBase):
 
     def __init__(self, creds: dict, trial: dict = False):
         self._nazev_sluzby = "generujCenoveUdajeDleKu"
+        self._cache = None
 
         super().__init__(creds, trial=trial)
 
-    def uloz_vystup(self, zauctovana_sestava: dict, vystupni_adresar: str) -> str:
+    @property
+    def cache(self) -> ReportCache:
+        """Vraci cache vygenerovanych sestav (None, pokud neni nastavena).
+        Zaroven funguje i jako setter - lze nastavit cestu k adresari cache
+        nebo vlastni objekt ReportCache s nastavenou politikou platnosti a velikosti."""
+        return self._cache
+
+    @cache.setter
+    def cache(self, cache):
+        """Nastavi cache vygenerovanych sestav.
+
+        :param cache: cesta k adresari cache, objekt ReportCache nebo None
+        """
+        if cache is not None and not isinstance(cache, ReportCache):
+            cache = ReportCache(cache, self.logger)
+        self._cache = cache
+        if cache is not None:
+            self.logger.info("Cache sestav nastavena na cestu: %s", cache.cache_dir)
+
+    def uloz_vystup(
+        self,
+        zauctovana_sestava: dict,
+        vystupni_adresar: str,
+        nazev_souboru: str = None,
+    ) -> str:
         """Rozkoduje soubor z vystupnich hodnot sluzby VratSestavu a ulozi ho na disk.
+        Soubor se dekoduje a zapisuje po blocich.
 
         :param zauctovana_sestava: slovnik vraceny po zauctovani sestavy
+        :param vystupni_adresar: cesta k vystupnimu adresari
+        :param nazev_souboru: nazev vystupniho souboru, implicitne cen_udaje_<cas>.<format>
         :rtype: string - cesta k vystupnimu souboru
         """
-        datum = datetime.now().strftime("%H_%M_%S_%d_%m_%Y")
-        vystupni_soubor = "cen_udaje_{}.{}".format(datum, zauctovana_sestava["format"])
-        vystupni_cesta = os.path.join(vystupni_adresar, vystupni_soubor)
-        binary = base64.b64decode(zauctovana_sestava["souborSestavy"])
+        vystupni_cesta = self._vystupni_cesta(
+            vystupni_adresar, nazev_souboru, zauctovana_sestava["format"]
+        )
+        soubor = zauctovana_sestava["souborSestavy"]
         with open(vystupni_cesta, "wb") as f:
-            f.write(binary)
-            self.logger.info(
-                "Vystupni soubor je k dispozici zde: {}".format(vystupni_cesta)
-            )
+            dekoder = Base64StreamDecoder(f, _VELIKOST_BLOKU)
+            for i in range(0, len(soubor), _VELIKOST_BLOKU):
+                dekoder.write(soubor[i : i + _VELIKOST_BLOKU])
+            dekoder.close()
+            self.logger.info("Vystupni soubor je k dispozici zde: %s", vystupni_cesta)
         return vystupni_cesta
+
+    def zauctuj_a_uloz_sestavu(
+        self,
+        sestava: dict,
+        vystupni_adresar: str,
+        nazev_souboru: str = None,
+    ) -> tuple:
+        """Zauctuje sestavu sluzbou VratSestavu a soubor sestavy rovnou ulozi na disk.
+        Odpoved sluzby se zpracovava prubezne behem stahovani a soubor se dekoduje
+        po blocich, takze pametova narocnost nezavisi na velikosti sestavy.
+
+        :param sestava: slovnik vraceny pri vytvoreni sestavy
+        :param vystupni_adresar: cesta k vystupnimu adresari
+        :param nazev_souboru: nazev vystupniho souboru, implicitne cen_udaje_<cas>.<format>
+        :return: tuple (cesta k vystupnimu souboru,
+                        slovnik s informacemi o sestave bez souboru sestavy)
+        """
+        vystupni_cesta = self._vystupni_cesta(
+            vystupni_adresar, nazev_souboru, sestava.get("format")
+        )
+        info = self._klient_sestav("vratSestavu").send_request_to_file(
+            sestava["id"], vystupni_cesta, _VELIKOST_BLOKU
+        )
+        self.logger.info("Vystupni soubor je k dispozici zde: %s", vystupni_cesta)
+        return vystupni_cesta, info
+
+    def _vystupni_cesta(
+        self, vystupni_adresar: str, nazev_souboru: str, format_souboru: str
+    ) -> str:
+        """Privatni metoda sestavujici cestu k vystupnimu souboru."""
+        if not nazev_souboru:
+            datum = datetime.now().strftime("%H_%M_%S_%d_%m_%Y")
+            nazev_souboru = "cen_udaje_{}.{}".format(datum, format_souboru)
+        return os.path.join(vystupni_adresar, nazev_souboru)
+
+    def ziskej_vystup(
+        self,
+        parametry: dict,
+        vystupni_adresar: str,
+        timeout: float = 3600.0,
+        smazat: bool = True,
+    ) -> str:
+        """Vytvori sestavu, pocka na jeji vygenerovani, zauctuje ji, ulozi vystup na disk
+        a sestavu z uctu smaze. Pokud je nastavena cache a sestava se stejnymi parametry
+        v ni je, vrati vystup z cache bez volani sluzby.
+
+        :param parametry: slovnik vstupnich parametru sluzby
+        :param vystupni_adresar: cesta k vystupnimu adresari
+        :param timeout: maximalni doba cekani na vygenerovani sestavy v sekundach
+        :param smazat: True/False - smazat sestavu z uctu po stazeni
+        :return: cesta k vystupnimu souboru
+        """
+        souhrn = self.zpracuj_davku(
+            [parametry],
+            vystupni_adresar,
+            max_soubeznych=1,
+            timeout=timeout,
+            smazat=smazat,
+        )
+        sestava = souhrn["sestavy"][0]
+        if sestava["chyba"]:
+            raise WSDPError(self.logger, sestava["chyba"])
+        return sestava["cesta"]
+
+    def zpracuj_davku(
+        self,
+        seznam_parametru: list,
+        vystupni_adresar: str,
+        max_soubeznych: int = 4,
+        interval: float = 1.0,
+        timeout: float = 3600.0,
+        smazat: bool = True,
+        prubeh=None,
+    ) -> dict:
+        """Zpracuje davku sestav - kazdou sestavu vytvori, pocka na jeji vygenerovani,
+        zauctuje ji, ulozi vystup na disk a nakonec ji z uctu smaze. Sestavy se zpracovavaji
+        soubezne, kazda vygenerovana sestava je stazena hned, jak je k dispozici.
+        Je-li nastavena cache, sestavy v ni nalezene se ze sluzby znovu negeneruji.
+
+        :param seznam_parametru: seznam slovniku vstupnich parametru sluzby
+        :param vystupni_adresar: cesta k vystupnimu adresari
+        :param max_soubeznych: maximalni pocet soubezne zpracovavanych sestav
+        :param interval: pocatecni interval mezi dotazy na stav sestavy v sekundach
+        :param timeout: maximalni doba cekani na vygenerovani jedne sestavy v sekundach
+        :param smazat: True/False - smazat sestavy z uctu po stazeni
+        :param prubeh: funkce volana po zpracovani kazde sestavy (s udaji o sestave)
+        :return: slovnik se souhrnem casu a chyb zpracovani
+        """
+        if not os.path.exists(vystupni_adresar):
+            try:
+                os.makedirs(vystupni_adresar)
+            except OSError:
+                raise WSDPError(self.logger, "Cilovy adresar se nepodarilo vytvorit.")
+
+        runner = ReportJobRunner(
+            self,
+            vystupni_adresar,
+            max_workers=max_soubeznych,
+            poll_interval=interval,
+            timeout=timeout,
+            delete=smazat,
+            progress=prubeh,
+        )
+        runner.run(seznam_parametru)
+        souhrn = runner.summary()
+        self.logger.info(
+            "Zpracovano %s sestav (%s chybnych) za %s s",
+            souhrn["pocet sestav"],
+            souhrn["pocet chybnych sestav"],
+            souhrn["celkovy cas [s]"],
+        )
+        return souhrn
+
+    def nacti_vystupy_do_db(self, vystupy: list, db_path: str) -> str:
+        """Nacte cenove udaje ze stazenych sestav do jedne SQLite databaze. Archivy se ctou
+        prubezne bez rozbaleni na disk, hodnoty se ukladaji jako typovane sloupce a zaznamy
+        z prekryvajicich se obdobi se ulozi jen jednou. Tabulka cenove_udaje ma indexy
+        na kod katastralniho uzemi a datum.
+
+        :param vystupy: seznam cest k souborum sestav nebo slovniku {"cesta": ..., "parametry": ...}
+            (napr. polozky "sestavy" ze souhrnu metody zpracuj_davku)
+        :param db_path: cesta k SQLite databazi, pokud neexistuje, vytvori se
+        :return: cesta k databazi
+        """
+        dataset = PriceDataset(db_path, self.logger)
+        try:
+            for vystup in vystupy:
+                if isinstance(vystup, dict):
+                    if vystup.get("cesta"):
+                        dataset.add_report(vystup["cesta"], vystup.get("parametry"))
+                else:
+                    dataset.add_report(vystup)
+        finally:
+            dataset.close_connection()
+        self.logger.info("Cenove udaje nacteny do databaze: %s", db_path)
+        return db_path
+
+    def statistika_cen(
+        self,
+        db_path: str,
+        hodnota: str = "CENA",
+        delitel: str = None,
+        skupiny: tuple = ("KATASTR_UZEMI_KOD", "OBDOBI"),
+        kvantily: tuple = (0.25, 0.5, 0.75),
+    ) -> dict:
+        """Spocte pocet, prumer a kvantily hodnoty (napr. ceny za m2 pri zadani delitele
+        s vymerou) za skupiny zaznamu databaze vytvorene metodou nacti_vystupy_do_db.
+        Vypocet probiha vektorove nad celymi sloupci pomoci knihovny numpy.
+
+        :param db_path: cesta k SQLite databazi s cenovymi udaji
+        :param hodnota: nazev sloupce s hodnotou
+        :param delitel: nazev sloupce, kterym se hodnota deli (napr. vymera)
+        :param skupiny: sloupce, podle kterych se zaznamy seskupi, OBDOBI je mesic ve tvaru RRRR-MM
+        :param kvantily: pozadovane kvantily z intervalu <0, 1>
+        :return: slovnik {nazev sloupce: numpy pole s hodnotou pro kazdou skupinu}
+        """
+        return PriceStatistics(db_path, self.logger).aggregate(
+            hodnota, delitel, skupiny, kvantily
+        )
+
+    def pocty_dle_kategorie(
+        self,
+        db_path: str,
+        kategorie: str,
+        skupiny: tuple = ("KATASTR_UZEMI_KOD", "OBDOBI"),
+    ) -> dict:
+        """Spocte pocty zaznamu jednotlivych kategorii (napr. typu nemovitosti)
+        za skupiny zaznamu databaze vytvorene metodou nacti_vystupy_do_db.
+
+        :param db_path: cesta k SQLite databazi s cenovymi udaji
+        :param kategorie: nazev sloupce s kategorii
+        :param skupiny: sloupce, podle kterych se zaznamy seskupi, OBDOBI je mesic ve tvaru RRRR-MM
+        :return: slovnik {nazev sloupce: numpy pole s hodnotou pro kazdou skupinu a kategorii}
+        """
+        return PriceStatistics(db_path, self.logger).count(kategorie, skupiny)
@@ -0,0 +1,188 @@
+"""
+@package modules.GenerujCenoveUdajeDleKu.analytics
+
+@brief Vectorized statistics over the dataset of price records
+
+Classes:
+ - analytics::PriceStatistics
+
+(C) 2021 Linda Kladivova lindakladivova@gmail.com
+This library is free under the MIT License.
+"""
+
+import re
+import sqlite3
+
+try:
+    import numpy as np
+except ImportError:  # numpy is an optional dependency
+    np = None
+
+from pywsdp.base.exceptions import WSDPError
+
+
+# Derived column with the month of the record (YYYY-MM)
+_PERIOD = "OBDOBI"
+_COLUMN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class PriceStatistics:
+    """
+    Aggregations of price records grouped by cadastral unit and period computed
+    by NumPy operations over whole columns (no iteration over rows in Python).
+    """
+
+    def __init__(self, db_path, logger, table="cenove_udaje"):
+        """
+        :param db_path: str - path to SQLite dataset created by PriceDataset
+        :param logger: logger object (class Logger)
+        :param table: str - name of the table with records
+        """
+        if np is None:
+            raise WSDPError(
+                logger, "Pro vypocet statistik je nutne nainstalovat knihovnu numpy"
+            )
+        self.db_path = db_path
+        self.logger = logger
+        self.table = table
+
+    def _select(self, column):
+        if column == _PERIOD:
+            return "substr(DATUM, 1, 7)"
+        if not _COLUMN.match(column):
+            raise WSDPError(self.logger, "Neplatny nazev sloupce: {}".format(column))
+        return column
+
+    def load_columns(self, columns, where=None, parameters=()):
+        """
+        Load columns of the dataset to NumPy arrays.
+        :param columns: list of column names (OBDOBI is derived from DATUM)
+        :param where: str - optional SQL condition
+        :param parameters: tuple - parameters of the condition
+        :rtype: dict - column name: numpy array
+        """
+        sql = "SELECT {} FROM {}".format(
+            ", ".join(self._select(c) for c in columns), self.table
+        )
+        if where:
+            sql += " WHERE " + where
+        try:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                rows = conn.execute(sql, parameters).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as exc:
+            raise WSDPError(self.logger, exc) from exc
+        values = list(zip(*rows)) if rows else [()] * len(columns)
+        return {c: np.asarray(v, dtype=object) for c, v in zip(columns, values)}
+
+    @staticmethod
+    def _group_codes(keys):
+        """
+        Combine key columns to one integer code per row.
+        :param keys: list of numpy arrays
+        :rtype: tuple (numpy array of codes, list of arrays of unique key values)
+        """
+        uniques = []
+        inverses = []
+        for key in keys:
+            _, first, inverse = np.unique(
+                key.astype(str), return_index=True, return_inverse=True
+            )
+            uniques.append(key[first])
+            inverses.append(inverse.reshape(-1))
+        if not keys or not len(keys[0]):
+            return np.zeros(0, dtype=np.int64), uniques
+        codes = np.ravel_multi_index(inverses, [len(u) for u in uniques])
+        return codes, uniques
+
+    @staticmethod
+    def _decode(codes, uniques, group_by, columns):
+        """
+        Convert group codes back to key columns.
+        """
+        if not uniques:
+            return
+        indices = np.unravel_index(codes, [len(u) for u in uniques])
+        for name, unique, index in zip(group_by, uniques, indices):
+            columns[name] = unique[index]
+
+    def aggregate(
+        self,
+        value="CENA",
+        divisor=None,
+        group_by=("KATASTR_UZEMI_KOD", _PERIOD),
+        quantiles=(0.25, 0.5, 0.75),
+        where=None,
+        parameters=(),
+    ):
+        """
+        Count, mean and quantiles of the value (or value/divisor, eg. price per m2)
+        for every group.
+        :param value: str - column with the value
+        :param divisor: str - optional column the value is divided by
+        :param group_by: tuple of columns to group by
+        :param quantiles: tuple of floats from interval <0, 1>
+        :param where: str - optional SQL condition
+        :param parameters: tuple - parameters of the condition
+        :rtype: dict - column name: numpy array (one item per group)
+        """
+        names = list(group_by) + [value] + ([divisor] if divisor else [])
+        data = self.load_columns(names, where, parameters)
+        values = data[value].astype(float)
+        if divisor:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                values = values / data[divisor].astype(float)
+        valid = np.isfinite(values)
+        codes, uniques = self._group_codes([data[c][valid] for c in group_by])
+        values = values[valid]
+
+        order = np.lexsort((values, codes))
+        codes = codes[order]
+        values = values[order]
+        if len(codes):
+            starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        else:
+            starts = np.zeros(0, dtype=np.int64)
+        counts = np.diff(np.r_[starts, len(codes)]).astype(np.int64)
+
+        result = {}
+        self._decode(codes[starts], uniques, group_by, result)
+        result["POCET"] = counts
+        if len(starts):
+            result["PRUMER"] = np.add.reduceat(values, starts) / counts
+        else:
+            result["PRUMER"] = np.zeros(0)
+        for q in quantiles:
+            position = starts + q * (counts - 1)
+            lower = np.floor(position).astype(np.int64)
+            upper = np.ceil(position).astype(np.int64)
+            result["KVANTIL_{:g}".format(q)] = values[lower] + (
+                values[upper] - values[lower]
+            ) * (position - lower)
+        return result
+
+    def count(
+        self,
+        category,
+        group_by=("KATASTR_UZEMI_KOD", _PERIOD),
+        where=None,
+        parameters=(),
+    ):
+        """
+        Number of records of every category (eg. property type) in every group.
+        :param category: str - column with the category
+        :param group_by: tuple of columns to group by
+        :param where: str - optional SQL condition
+        :param parameters: tuple - parameters of the condition
+        :rtype: dict - column name: numpy array (one item per group and category)
+        """
+        names = list(group_by) + [category]
+        data = self.load_columns(names, where, parameters)
+        codes, uniques = self._group_codes([data[c] for c in names])
+        unique_codes, counts = np.unique(codes, return_counts=True)
+        result = {}
+        self._decode(unique_codes, uniques, names, result)
+        result["POCET"] = counts
+        return result
@@ -0,0 +1,251 @@
+"""
+@package modules.GenerujCenoveUdajeDleKu.cache
+
+@brief Local cache of generated price reports
+
+Classes:
+ - cache::ReportCache
+
+(C) 2021 Linda Kladivova lindakladivova@gmail.com
+This library is free under the MIT License.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+from pywsdp.base.exceptions import WSDPError
+
+
+# Report parameters which identify the report content
+_KEY_FIELDS = ("katastrUzemiKod", "rok", "mesicOd", "mesicDo", "format")
+
+
+class ReportCache:
+    """
+    Cache of decoded report files keyed by report parameters. File contents are stored
+    once per content hash, the index entries point to them. Reports of closed periods
+    can be kept forever, reports of periods which are not closed yet expire soon.
+    Least recently used reports are evicted when the total size exceeds the limit.
+    """
+
+    def __init__(
+        self,
+        cache_dir,
+        logger,
+        max_size=1024**3,
+        max_age_open=timedelta(days=1),
+        max_age_closed=None,
+        closed_after=timedelta(days=30),
+    ):
+        """
+        :param cache_dir: str - path to cache directory
+        :param logger: logger object (class Logger)
+        :param max_size: int - max total size of cached files in bytes
+        :param max_age_open: timedelta - max age of reports of periods which are not closed
+        :param max_age_closed: timedelta - max age of reports of closed periods (None = no limit)
+        :param closed_after: timedelta - period is closed this long after its last month ends
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.max_age_open = max_age_open
+        self.max_age_closed = max_age_closed
+        self.closed_after = closed_after
+        self.logger = logger
+        self._index_dir = os.path.join(cache_dir, "index")
+        self._blob_dir = os.path.join(cache_dir, "soubory")
+        self._lock = threading.Lock()
+        os.makedirs(self._index_dir, exist_ok=True)
+        os.makedirs(self._blob_dir, exist_ok=True)
+
+    def key(self, parametry):
+        """
+        Key of the report derived from its parameters.
+        :param parametry: dict - input parameters of GenerujCenoveUdajeDleKu service
+        :rtype: str
+        """
+        try:
+            normalized = {
+                field: int(parametry[field])
+                if field != "format"
+                else str(parametry[field]).lower()
+                for field in _KEY_FIELDS
+            }
+        except (KeyError, ValueError) as exc:
+            raise WSDPError(
+                self.logger, "Neplatne parametry sestavy: {}".format(exc)
+            ) from exc
+        return hashlib.sha256(
+            json.dumps(normalized, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def _is_closed(self, parametry, now):
+        """
+        Check if the report period has ended long enough ago not to be changed.
+        :param parametry: dict - input parameters of the report
+        :param now: datetime
+        :rtype: bool
+        """
+        rok, mesic = int(parametry["rok"]), int(parametry["mesicDo"])
+        first_day_after = datetime(rok + mesic // 12, mesic % 12 + 1, 1)
+        return now >= first_day_after + self.closed_after
+
+    def _is_fresh(self, metadata, now):
+        """
+        Check the freshness policy.
+        :param metadata: dict - metadata of the cached report
+        :param now: datetime
+        :rtype: bool
+        """
+        age = now - datetime.fromisoformat(metadata["vytvoreno"])
+        if self._is_closed(metadata["parametry"], now):
+            return self.max_age_closed is None or age <= self.max_age_closed
+        return self.max_age_open is not None and age <= self.max_age_open
+
+    def _index_path(self, key):
+        return os.path.join(self._index_dir, key + ".json")
+
+    def _blob_path(self, metadata):
+        return os.path.join(self._blob_dir, metadata["soubor"])
+
+    def _write_json(self, path, data):
+        """Atomically write json file."""
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _read_index(self):
+        """
+        Read all index entries.
+        :rtype: dict - key: metadata
+        """
+        entries = {}
+        for name in os.listdir(self._index_dir):
+            if name.endswith(".json"):
+                try:
+                    with open(
+                        os.path.join(self._index_dir, name), encoding="utf-8"
+                    ) as f:
+                        entries[name[:-5]] = json.load(f)
+                except (OSError, ValueError):
+                    continue
+        return entries
+
+    def get(self, parametry):
+        """
+        Get cached report.
+        :param parametry: dict - input parameters of the report
+        :rtype: tuple (str - path to cached file, dict - metadata) or None
+        """
+        key = self.key(parametry)
+        now = datetime.now()
+        with self._lock:
+            try:
+                with open(self._index_path(key), encoding="utf-8") as f:
+                    metadata = json.load(f)
+            except (OSError, ValueError):
+                return None
+            path = self._blob_path(metadata)
+            if not os.path.exists(path) or not self._is_fresh(metadata, now):
+                self._remove(key, metadata)
+                return None
+            metadata["posledni_pouziti"] = now.isoformat()
+            self._write_json(self._index_path(key), metadata)
+        return path, metadata
+
+    def put(self, parametry, file_path, info=None):
+        """
+        Store the decoded report file in the cache.
+        :param parametry: dict - input parameters of the report
+        :param file_path: str - path to the decoded report file
+        :param info: dict - report info returned by the service (id, cena, ...)
+        :rtype: str - path to cached file
+        """
+        key = self.key(parametry)
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        now = datetime.now().isoformat()
+        metadata = {
+            "parametry": {field: parametry[field] for field in _KEY_FIELDS},
+            "soubor": "{}.{}".format(
+                digest.hexdigest(), str(parametry["format"]).lower()
+            ),
+            "velikost": os.path.getsize(file_path),
+            "vytvoreno": now,
+            "posledni_pouziti": now,
+            "sestava": {
+                k: v if isinstance(v, (str, int, float, type(None))) else str(v)
+                for k, v in (info or {}).items()
+                if k != "souborSestavy"
+            },
+        }
+        with self._lock:
+            path = self._blob_path(metadata)
+            if not os.path.exists(path):
+                fd, tmp = tempfile.mkstemp(dir=self._blob_dir, suffix=".tmp")
+                os.close(fd)
+                shutil.copyfile(file_path, tmp)
+                os.replace(tmp, path)
+            self._write_json(self._index_path(key), metadata)
+            self._evict(keep=key)
+        self.logger.info("Sestava %s ulozena do cache", metadata["parametry"])
+        return path
+
+    def _remove(self, key, metadata):
+        """
+        Remove index entry and its file if no other entry points to it.
+        """
+        try:
+            os.remove(self._index_path(key))
+        except OSError:
+            pass
+        if not any(
+            m["soubor"] == metadata["soubor"] for m in self._read_index().values()
+        ):
+            try:
+                os.remove(self._blob_path(metadata))
+            except OSError:
+                pass
+
+    def _evict(self, keep=None):
+        """
+        Remove least recently used reports until the total size fits the limit.
+        :param keep: str - key of the just stored report, it is never removed
+        """
+        entries = self._read_index()
+        sizes = {m["soubor"]: m["velikost"] for m in entries.values()}
+        total = sum(sizes.values())
+        for key, metadata in sorted(
+            entries.items(), key=lambda item: item[1]["posledni_pouziti"]
+        ):
+            if total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            del entries[key]
+            os.remove(self._index_path(key))
+            if not any(m["soubor"] == metadata["soubor"] for m in entries.values()):
+                total -= sizes.pop(metadata["soubor"], 0)
+                try:
+                    os.remove(self._blob_path(metadata))
+                except OSError:
+                    pass
+
+    def size(self):
+        """
+        Total size of cached files in bytes.
+        :rtype: int
+        """
+        with self._lock:
+            return sum(
+                {
+                    m["soubor"]: m["velikost"] for m in self._read_index().values()
+                }.values()
+            )
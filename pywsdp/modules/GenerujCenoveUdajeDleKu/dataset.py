@@ -0,0 +1,404 @@
+"""
+@package modules.GenerujCenoveUdajeDleKu.dataset
+
+@brief Loading of price reports into one SQLite dataset
+
+Classes:
+ - dataset::PriceRecordReader
+ - dataset::PriceDataset
+
+(C) 2021 Linda Kladivova lindakladivova@gmail.com
+This library is free under the MIT License.
+"""
+
+import re
+import json
+import sqlite3
+import hashlib
+import zipfile
+from datetime import datetime
+from lxml import etree
+
+from pywsdp.base.exceptions import WSDPError
+
+
+# Names of record elements which may contain code of cadastral unit
+_KU_FIELDS = ("katastrUzemiKod", "kodKu", "kuKod", "katuzeKod", "kodKatastralnihoUzemi")
+
+_INT = re.compile(r"^-?(0|[1-9][0-9]{0,17})$")
+_FLOAT = re.compile(r"^-?[0-9]+[.,][0-9]+$")
+_DATE = re.compile(r"^[0-9]{4}-[0-9]{2}-[0-9]{2}([T ][0-9:.]+)?(Z|[+-][0-9:]+)?$")
+
+# Number of elements scanned to detect the record element
+_DETECTION_LIMIT = 5000
+
+# Number of rows inserted at once
+_BATCH_SIZE = 10000
+
+# Columns derived by the dataset, record fields of the same name get prefix PUVODNI_
+_DERIVED_COLUMNS = ("ZAZNAM_HASH", "KATASTR_UZEMI_KOD", "DATUM", "SESTAVA")
+
+
+def convert_value(text):
+    """
+    Convert text of XML element to typed value (int, float, ISO date or str).
+    Codes with leading zeros stay strings.
+    :param text: str
+    :rtype: int, float or str
+    """
+    if text is None:
+        return None
+    text = text.strip()
+    if not text:
+        return None
+    if _INT.match(text):
+        return int(text)
+    if _FLOAT.match(text):
+        return float(text.replace(",", "."))
+    if _DATE.match(text):
+        return text[:10] if len(text) == 10 else text
+    return text
+
+
+def _quote(name):
+    """Quote SQL identifier (names of elements can be SQL keywords)."""
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else None
+
+
+class PriceRecordReader:
+    """
+    Stream price records from the report file (ZIP archive of XML files or single
+    XML file) without extracting it to disk. Record elements are detected as the
+    shallowest elements with leaf children whose parent holds only elements of the
+    same name (otherwise the shallowest repeated elements with children), nested
+    elements are flattened to columns named parent_child.
+    """
+
+    def __init__(self, file_path, logger, record_tag=None):
+        """
+        :param file_path: str - path to the report file
+        :param logger: logger object (class Logger)
+        :param record_tag: str - name of record element (detected if not set)
+        """
+        self.file_path = file_path
+        self.logger = logger
+        self.record_tag = record_tag
+
+    def _sources(self):
+        """
+        Generate openers of XML documents in the report.
+        :rtype: generator of (name, callable returning binary file object)
+        """
+        if zipfile.is_zipfile(self.file_path):
+            with zipfile.ZipFile(self.file_path) as archive:
+                for info in archive.infolist():
+                    if info.filename.lower().endswith(".xml"):
+                        yield info.filename, lambda info=info: archive.open(info)
+        else:
+            yield self.file_path, lambda: open(self.file_path, "rb")
+
+    def _detect(self, opener):
+        """
+        Find depth and name of the record element from the beginning of the document.
+        :rtype: tuple (int, str) or None
+        """
+        counts = {}
+        # elements with leaf children inside container of elements of one name
+        containers = {}
+        depth = 0
+        with opener() as f:
+            for n, (event, element) in enumerate(
+                etree.iterparse(f, events=("start", "end"), huge_tree=True)
+            ):
+                if event == "start":
+                    depth += 1
+                    continue
+                depth -= 1
+                tag = _local(element.tag)
+                if len(element) and tag:
+                    key = (depth, tag)
+                    counts[key] = counts.get(key, 0) + 1
+                    parent = element.getparent()
+                    if parent is not None:
+                        siblings = {_local(child.tag) for child in parent}
+                        if siblings == {tag}:
+                            if any(not len(child) for child in element):
+                                containers.setdefault(key, True)
+                        else:
+                            for sibling in siblings:
+                                containers[(depth, sibling)] = False
+                if n > _DETECTION_LIMIT:
+                    break
+        if self.record_tag:
+            depths = [d for d, tag in counts if tag == self.record_tag]
+            return (min(depths), self.record_tag) if depths else None
+        # structure does not depend on number of records (report with one record)
+        records = sorted(key for key, container in containers.items() if container)
+        if records:
+            return records[0]
+        repeated = sorted(key for key, count in counts.items() if count > 1)
+        if repeated:
+            return repeated[0]
+        return min(counts) if counts else None
+
+    def _flatten(self, element, prefix, record):
+        for child in element:
+            name = _local(child.tag)
+            if name is None:
+                continue
+            column = prefix + name
+            if len(child):
+                self._flatten(child, column + "_", record)
+            else:
+                value = convert_value(child.text)
+                if column in record and record[column] is not None:
+                    record[column] = "{}; {}".format(record[column], value)
+                else:
+                    record[column] = value
+        for name, value in element.attrib.items():
+            record[prefix + _local(name)] = convert_value(value)
+
+    def __iter__(self):
+        """
+        Generate records of the report as dictionaries.
+        :rtype: generator of dicts
+        """
+        for name, opener in self._sources():
+            try:
+                detected = self._detect(opener)
+            except etree.XMLSyntaxError as exc:
+                raise WSDPError(
+                    self.logger, "Soubor {} nelze nacist: {}".format(name, exc)
+                ) from exc
+            if not detected:
+                continue
+            record_depth, record_tag = detected
+            depth = 0
+            with opener() as f:
+                for event, element in etree.iterparse(
+                    f, events=("start", "end"), huge_tree=True
+                ):
+                    if event == "start":
+                        depth += 1
+                        continue
+                    depth -= 1
+                    if depth == record_depth and _local(element.tag) == record_tag:
+                        record = {}
+                        self._flatten(element, "", record)
+                        yield record
+                        element.clear()
+                        while element.getprevious() is not None:
+                            del element.getparent()[0]
+
+
+class PriceDataset:
+    """
+    SQLite dataset of price records loaded from many reports. Records are
+    de-duplicated by their content, cadastral unit and order among identical
+    records of the report, so overlapping periods are stored once.
+    """
+
+    def __init__(self, db_path, logger, table="cenove_udaje"):
+        """
+        :param db_path: str - path to SQLite database (created if it does not exist)
+        :param logger: logger object (class Logger)
+        :param table: str - name of the table with records
+        """
+        self.db_path = db_path
+        self.logger = logger
+        self.table = table
+        try:
+            self.conn = sqlite3.connect(db_path)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS {0} (ZAZNAM_HASH TEXT PRIMARY KEY, "
+                "KATASTR_UZEMI_KOD INTEGER, DATUM TEXT, SESTAVA TEXT)".format(table)
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS {0}_ku_datum ON {0} "
+                "(KATASTR_UZEMI_KOD, DATUM)".format(table)
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS {0}_datum ON {0} (DATUM)".format(table)
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS SESTAVY (HASH TEXT PRIMARY KEY, "
+                "CESTA TEXT, PARAMETRY TEXT, POCET_ZAZNAMU INTEGER, NACTENO TEXT)"
+            )
+            self.conn.commit()
+        except sqlite3.Error as exc:
+            raise WSDPError(self.logger, exc) from exc
+        self.columns = self._get_columns()
+
+    def _get_columns(self):
+        cur = self.conn.execute("PRAGMA table_info({0})".format(self.table))
+        return {row[1] for row in cur.fetchall()}
+
+    @staticmethod
+    def column_name(field):
+        """
+        Convert record field to column name (eg. cenaNemovitosti to CENA_NEMOVITOSTI).
+        Fields named as derived columns (DATUM, KATASTR_UZEMI_KOD, ...) are stored
+        with prefix PUVODNI_ by add_report.
+        :param field: str - flattened name of XML element
+        :rtype: str
+        """
+        name = re.sub("([A-Z]{1})", r"_\1", field).upper()
+        return re.sub("[^A-Z0-9_]", "_", name)
+
+    def _add_columns(self, record):
+        """
+        Add columns for new record fields, declared type follows the first value.
+        """
+        for field, value in record.items():
+            if field not in self.columns:
+                if isinstance(value, int):
+                    datatype = "INTEGER"
+                elif isinstance(value, float):
+                    datatype = "REAL"
+                else:
+                    datatype = "TEXT"
+                self.conn.execute(
+                    "ALTER TABLE {0} ADD COLUMN {1} {2}".format(
+                        self.table, _quote(field), datatype
+                    )
+                )
+                self.columns.add(field)
+
+    @staticmethod
+    def _file_hash(file_path):
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _insert(self, rows):
+        """
+        Insert rows with the same set of columns, existing records are ignored.
+        :rtype: int - number of inserted rows
+        """
+        inserted = 0
+        groups = {}
+        for row in rows:
+            groups.setdefault(tuple(row), []).append(tuple(row.values()))
+        for columns, values in groups.items():
+            cur = self.conn.executemany(
+                "INSERT OR IGNORE INTO {0} ({1}) VALUES ({2})".format(
+                    self.table,
+                    ", ".join(_quote(column) for column in columns),
+                    ", ".join("?" * len(columns)),
+                ),
+                values,
+            )
+            inserted += cur.rowcount
+        return inserted
+
+    def _ku_code(self, value):
+        """
+        Convert code of cadastral unit to int, invalid code is stored as NULL.
+        :rtype: int or None
+        """
+        if value is None or value == "":
+            return None
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            self.logger.warning("Neplatny kod katastralniho uzemi: %s", value)
+            return None
+
+    def add_report(self, file_path, parametry=None, record_tag=None):
+        """
+        Load records of the report to the dataset. Already loaded file is skipped.
+        Raises:
+            WSDPError: SQLite error or invalid report file
+        :param file_path: str - path to the report file (zip or xml)
+        :param parametry: dict - input parameters of the report (katastrUzemiKod, ...)
+        :param record_tag: str - name of record element (detected if not set)
+        :rtype: int - number of newly inserted records
+        """
+        file_hash = self._file_hash(file_path)
+        if self.conn.execute(
+            "SELECT 1 FROM SESTAVY WHERE HASH = ?", (file_hash,)
+        ).fetchone():
+            self.logger.info("Sestava %s uz je nactena", file_path)
+            return 0
+        ku = (parametry or {}).get("katastrUzemiKod")
+        inserted = 0
+        total = 0
+        rows = []
+        occurrences = {}
+        try:
+            with self.conn:
+                for record in PriceRecordReader(file_path, self.logger, record_tag):
+                    row = {self.column_name(k): v for k, v in record.items()}
+                    for name in _DERIVED_COLUMNS:
+                        if name in row:
+                            row["PUVODNI_" + name] = row.pop(name)
+                    row_ku = ku
+                    if row_ku is None:
+                        row_ku = next(
+                            (record[f] for f in _KU_FIELDS if record.get(f)), None
+                        )
+                    dates = [
+                        v
+                        for k, v in record.items()
+                        if isinstance(v, str) and _DATE.match(v)
+                    ]
+                    # identical records of one report are told apart by their order
+                    content = json.dumps(
+                        [str(row_ku), row], sort_keys=True, default=str
+                    )
+                    ordinal = occurrences.get(content, 0)
+                    occurrences[content] = ordinal + 1
+                    row["ZAZNAM_HASH"] = hashlib.sha1(
+                        "{}|{}".format(ordinal, content).encode("utf-8")
+                    ).hexdigest()
+                    row["KATASTR_UZEMI_KOD"] = self._ku_code(row_ku)
+                    row["DATUM"] = dates[0][:10] if dates else None
+                    row["SESTAVA"] = file_hash
+                    self._add_columns(row)
+                    rows.append(row)
+                    total += 1
+                    if len(rows) >= _BATCH_SIZE:
+                        inserted += self._insert(rows)
+                        rows = []
+                inserted += self._insert(rows)
+                self.conn.execute(
+                    "INSERT INTO SESTAVY VALUES (?, ?, ?, ?, ?)",
+                    (
+                        file_hash,
+                        str(file_path),
+                        json.dumps(parametry, default=str) if parametry else None,
+                        total,
+                        datetime.now().isoformat(),
+                    ),
+                )
+        except sqlite3.Error as exc:
+            raise WSDPError(self.logger, exc) from exc
+        self.logger.info(
+            "Ze sestavy %s nacteno %s zaznamu (%s duplicit)",
+            file_path,
+            inserted,
+            total - inserted,
+        )
+        return inserted
+
+    def query(self, sql, parameters=()):
+        """
+        Run SQL query over the dataset.
+        :param sql: str - SQL select statement
+        :param parameters: tuple - query parameters
+        :rtype: list of tuples
+        """
+        try:
+            return self.conn.execute(sql, parameters).fetchall()
+        except sqlite3.Error as exc:
+            raise WSDPError(self.logger, exc) from exc
+
+    def close_connection(self):
+        if self.conn:
+            self.conn.close()
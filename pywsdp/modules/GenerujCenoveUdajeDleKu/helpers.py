@@ -0,0 +1,275 @@
+"""
+@package modules.GenerujCenoveUdajeDleKu.helpers
+
+@brief Helpers for GenerujCenoveUdajeDleKu module
+
+Classes:
+ - helpers::ReportJob
+ - helpers::ReportJobRunner
+
+(C) 2021 Linda Kladivova lindakladivova@gmail.com
+This library is free under the MIT License.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def error_message(exc):
+    """
+    Get readable message from exception (WSDPError does not store the message
+    as its string representation).
+    :param exc: Exception
+    :rtype: str
+    """
+    return str(exc.args[-1]) if exc.args else exc.__class__.__name__
+
+
+class ReportJob:
+    """
+    Track one report through its lifecycle (request, generation, charging,
+    download, deletion) inside the batch run.
+    """
+
+    def __init__(self, parametry):
+        """
+        :param parametry: dict - input parameters of GenerujCenoveUdajeDleKu service
+        """
+        self.parametry = parametry
+        self.sestava = None
+        self.stav = "cekajici"
+        self.cesta = None
+        self.chyba = None
+        self.chyba_smazani = None
+        self.casy = {}
+        self.start = None
+        self.konec = None
+
+    @property
+    def trvani(self):
+        """Duration of the whole job in seconds."""
+        if self.start is None or self.konec is None:
+            return 0.0
+        return self.konec - self.start
+
+    def measure(self, phase, func, *args):
+        """
+        Call the function and add its duration to the given phase.
+        :param phase: str - name of the lifecycle phase
+        :param func: callable
+        :rtype: return value of the function
+        """
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.casy[phase] = self.casy.get(phase, 0.0) + (time.perf_counter() - start)
+
+    def as_dict(self):
+        """
+        Summary of the job.
+        :rtype: dict
+        """
+        return {
+            "parametry": self.parametry,
+            "id": self.sestava.get("id") if self.sestava else None,
+            "stav": self.stav,
+            "cesta": self.cesta,
+            "chyba": self.chyba,
+            "chyba smazani": self.chyba_smazani,
+            "trvani": round(self.trvani, 3),
+            "casy": {k: round(v, 3) for k, v in self.casy.items()},
+        }
+
+
+class ReportJobRunner:
+    """
+    Run many GenerujCenoveUdajeDleKu reports with bounded concurrency. Every report
+    is downloaded as soon as it is generated and deleted from the account afterwards.
+    """
+
+    def __init__(
+        self,
+        module,
+        output_dir,
+        max_workers=4,
+        poll_interval=5.0,
+        timeout=3600.0,
+        delete=True,
+        progress=None,
+    ):
+        """
+        :param module: GenerujCenoveUdajeDleKu instance
+        :param output_dir: str - path to output directory
+        :param max_workers: int - max number of reports processed at once
+        :param poll_interval: float - first interval between two checks of report state
+        :param timeout: float - max seconds to wait for one report to be generated
+        :param delete: bool - delete reports from the account after download
+        :param progress: callable called with ReportJob after every finished report
+        """
+        self.module = module
+        self.logger = module.logger
+        self.output_dir = output_dir
+        self.max_workers = max(1, max_workers)
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.delete = delete
+        self.progress = progress
+        self.jobs = []
+        self.wall_time = 0.0
+
+    def _file_name(self, parametry, id_sestavy=None):
+        """
+        Output file name derived from report parameters and id of the report,
+        so jobs with the same parameters do not overwrite each other.
+        :param parametry: dict - input parameters of the report
+        :param id_sestavy: id of the report (None for reports without id)
+        :rtype: str
+        """
+        return "cen_udaje_{}_{}_{}_{}{}.{}".format(
+            parametry["katastrUzemiKod"],
+            parametry["rok"],
+            parametry["mesicOd"],
+            parametry["mesicDo"],
+            "" if id_sestavy is None else "_{}".format(id_sestavy),
+            parametry["format"],
+        )
+
+    def _process(self, job):
+        """
+        Process the whole lifecycle of one report.
+        :param job: ReportJob
+        :rtype: ReportJob
+        """
+        job.start = time.perf_counter()
+        cache = getattr(self.module, "cache", None)
+        try:
+            if cache is not None:
+                cached = job.measure("cache", cache.get, job.parametry)
+                if cached:
+                    job.cesta = os.path.join(
+                        self.output_dir,
+                        self._file_name(
+                            job.parametry, cached[1].get("sestava", {}).get("id")
+                        ),
+                    )
+                    # jobs with the same cached report write the same content
+                    fd, tmp = tempfile.mkstemp(dir=self.output_dir, suffix=".tmp")
+                    os.close(fd)
+                    shutil.copyfile(cached[0], tmp)
+                    os.replace(tmp, job.cesta)
+                    job.stav = "z cache"
+                    return job
+            job.sestava = job.measure(
+                "vytvoreni", self.module.posli_pozadavek, job.parametry
+            )
+            job.stav = job.sestava.get("stav") or "zarazena"
+            info = job.measure(
+                "generovani",
+                self.module.cekej_na_sestavu,
+                job.sestava,
+                self.timeout,
+                self.poll_interval,
+            )
+            job.stav = info.get("stav") or job.stav
+            job.cesta, zauctovana = job.measure(
+                "zauctovani a ulozeni",
+                self.module.zauctuj_a_uloz_sestavu,
+                job.sestava,
+                self.output_dir,
+                self._file_name(job.parametry, job.sestava.get("id")),
+            )
+            job.stav = "stazena"
+            if cache is not None:
+                try:
+                    job.measure(
+                        "cache", cache.put, job.parametry, job.cesta, zauctovana
+                    )
+                except Exception as exc:
+                    # the report is downloaded, only caching failed
+                    self.logger.warning(
+                        "Sestavu %s nelze ulozit do cache: %s",
+                        job.parametry,
+                        error_message(exc),
+                    )
+        except Exception as exc:
+            job.stav = "chyba"
+            job.chyba = error_message(exc)
+        finally:
+            if job.sestava and job.sestava.get("id") and self.delete:
+                try:
+                    job.measure("smazani", self.module.vymaz_sestavu, job.sestava)
+                except Exception as exc:
+                    # the output is already on disk, deletion failure is reported apart
+                    job.chyba_smazani = error_message(exc)
+                    self.logger.warning(
+                        "Sestavu %s nelze smazat: %s",
+                        job.sestava.get("id"),
+                        job.chyba_smazani,
+                    )
+            job.konec = time.perf_counter()
+        return job
+
+    def run(self, seznam_parametru):
+        """
+        Process all reports.
+        :param seznam_parametru: list of dicts - input parameters of reports
+        :rtype: list of ReportJob
+        """
+        self.jobs = [ReportJob(parametry) for parametry in seznam_parametru]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self._process, job) for job in self.jobs]
+            for future in as_completed(futures):
+                job = future.result()
+                if job.chyba:
+                    self.logger.info(
+                        "Sestava %s nebyla zpracovana: %s", job.parametry, job.chyba
+                    )
+                else:
+                    self.logger.info(
+                        "Sestava %s stazena do %s", job.parametry, job.cesta
+                    )
+                if self.progress:
+                    self.progress(job)
+        self.wall_time = time.perf_counter() - start
+        return self.jobs
+
+    def summary(self):
+        """
+        Summary of timings and failures of the batch run.
+        :rtype: dict
+        """
+        failed = [job for job in self.jobs if job.chyba or job.cesta is None]
+        phases = {}
+        for job in self.jobs:
+            for phase, duration in job.casy.items():
+                phases.setdefault(phase, []).append(duration)
+        return {
+            "pocet sestav": len(self.jobs),
+            "pocet uspesne stazenych sestav": len(self.jobs) - len(failed),
+            "pocet chybnych sestav": len(failed),
+            "pocet sestav z cache": sum(
+                1 for job in self.jobs if job.stav == "z cache"
+            ),
+            "celkovy cas [s]": round(self.wall_time, 3),
+            "soucet casu jednotlivych sestav [s]": round(
+                sum(job.trvani for job in self.jobs), 3
+            ),
+            "prumerne casy fazi [s]": {
+                phase: round(sum(values) / len(values), 3)
+                for phase, values in phases.items()
+            },
+            "chyby": [
+                {"parametry": job.parametry, "chyba": job.chyba} for job in failed
+            ],
+            "chyby smazani": [
+                {"id": job.sestava.get("id"), "chyba": job.chyba_smazani}
+                for job in self.jobs
+                if job.chyba_smazani
+            ],
+            "sestavy": [job.as_dict() for job in self.jobs],
+        }
@@ -18,6 +18,12 @@ setuptools.setup(
     url="https://github.com/ctu-geoforall-lab/pywsdp",
     packages=setuptools.find_packages(),
     scripts=[],
+    entry_points={
+        "console_scripts": [
+            "pywsdp = pywsdp.cli:main",
+            "pywsdp-daemon = pywsdp.daemon:main",
+        ],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
@@ -27,4 +33,11 @@ setuptools.setup(
     install_requires=[
         "zeep>=4.1.0",
     ],
+    extras_require={
+        "analytics": ["numpy"],
+        "parquet": ["pyarrow"],
+        "zstd": ["zstandard"],
+        "lz4": ["lz4"],
+        "dataframe": ["pandas"],
+    },
 )
@@ -0,0 +1,63 @@
+"""
+@package tests.helpers
+
+@brief Shared helpers of the tests, benchmarks and load test
+
+(C) 2021 Linda Kladivova lindakladivova@gmail.com
+This library is free under the MIT License.
+"""
+
+import os
+import shutil
+import random
+import sqlite3
+import logging
+
+from pywsdp.base.profiling import Tracer
+from pywsdp.modules.CtiOS import CtiOS
+
+template_db = os.path.join(
+    os.path.dirname(__file__), "data", "input", "ctios_template.db"
+)
+
+_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+
+logger = logging.getLogger("pywsdp.tests")
+logger.addHandler(logging.NullHandler())
+logger.propagate = False
+
+
+def posident(rnd):
+    """Random posident of the same length as the real ones."""
+    return "".join(rnd.choice(_ALPHABET) for _ in range(107)) + "="
+
+
+def create_opsub_db(path, posidents, rows):
+    """
+    Create copy of the template database with OPSUB table of the given number of
+    rows. The first rows get the given posidents, the rest is random.
+    """
+    shutil.copyfile(template_db, path)
+    rnd = random.Random(1)
+    conn = sqlite3.connect(path)
+    conn.execute("DELETE FROM OPSUB")
+
+    def generate():
+        for i in range(rows):
+            yield (posidents[i] if i < len(posidents) else posident(rnd), i + 1)
+
+    conn.executemany("INSERT INTO OPSUB (ID, ogr_fid) VALUES (?, ?)", generate())
+    conn.commit()
+    conn.close()
+
+
+def ctios_module(input_db, log_dir):
+    """CtiOS module without connection to the service (only for saving outputs)."""
+    module = CtiOS.__new__(CtiOS)
+    module._nazev_sluzby = "ctiOS"
+    module._skupina_sluzeb = "ctios"
+    module._input_db = input_db
+    module._log_adresar = log_dir
+    module.logger = logger
+    module.tracer = Tracer()
+    return module
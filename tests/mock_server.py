@@ -0,0 +1,735 @@
+"""
+@package tests.mock_server
+
+@brief Local stand-in of WSDP SOAP services for load testing
+
+The server implements services ctios, generujCenoveUdajeDleKu, seznamSestav,
+vratSestavu and smazSestavu. WSDL documents of CUZK are not part of the library,
+so the server publishes simplified WSDLs (/ctios.wsdl, /sestavy.wsdl) describing
+only the elements read by pywsdp. Latency of responses, errors of posidents,
+HTTP 5xx errors, timeouts and generation time of reports are configurable.
+
+Classes:
+ - mock_server::LatencyModel
+ - mock_server::MockConfig
+ - mock_server::MockWSDPServer
+
+Usage:
+    python tests/mock_server.py --port 8080 --latence 0.2 --rozptyl 0.5
+
+(C) 2021 Linda Kladivova lindakladivova@gmail.com
+This library is free under the MIT License.
+"""
+
+import io
+import time
+import base64
+import random
+import hashlib
+import zipfile
+import argparse
+import threading
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from lxml import etree
+
+
+NS_CTIOS = "http://katastr.cuzk.cz/ctios/types/v2.8"
+NS_SESTAVY = "http://katastr.cuzk.cz/sestavy/types/v2.9"
+
+_WSDL = """<?xml version="1.0" encoding="UTF-8"?>
+<definitions xmlns="http://schemas.xmlsoap.org/wsdl/"
+    xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/"
+    xmlns:xs="http://www.w3.org/2001/XMLSchema"
+    xmlns:tns="{ns}" targetNamespace="{ns}">
+  <types>
+    <xs:schema targetNamespace="{ns}" elementFormDefault="qualified">
+      <xs:complexType name="ZpravaType">
+        <xs:simpleContent>
+          <xs:extension base="xs:string">
+            <xs:attribute name="kod" type="xs:string"/>
+          </xs:extension>
+        </xs:simpleContent>
+      </xs:complexType>
+      <xs:complexType name="VysledekType">
+        <xs:sequence>
+          <xs:element name="zprava" type="tns:ZpravaType" maxOccurs="unbounded"/>
+        </xs:sequence>
+      </xs:complexType>
+      {types}
+    </xs:schema>
+  </types>
+  {messages}
+  <portType name="PortType">{port_operations}</portType>
+  <binding name="Binding" type="tns:PortType">
+    <soap:binding style="document" transport="http://schemas.xmlsoap.org/soap/http"/>
+    {binding_operations}
+  </binding>
+  <service name="Service">
+    <port name="Port" binding="tns:Binding">
+      <soap:address location="{address}"/>
+    </port>
+  </service>
+</definitions>
+"""
+
+_CTIOS_TYPES = """
+      <xs:element name="ctiOSRequest">
+        <xs:complexType>
+          <xs:sequence>
+            <xs:element name="pOSIdent" type="xs:string" maxOccurs="unbounded"/>
+          </xs:sequence>
+        </xs:complexType>
+      </xs:element>
+      <xs:complexType name="OsDetailType">
+        <xs:sequence>
+          <xs:element name="stavDat" type="xs:int" minOccurs="0"/>
+          <xs:element name="datumVzniku" type="xs:dateTime" minOccurs="0"/>
+          <xs:element name="datumZaniku" type="xs:dateTime" minOccurs="0"/>
+          <xs:element name="priznakKontext" type="xs:int" minOccurs="0"/>
+          <xs:element name="rizeniIdVzniku" type="xs:long" minOccurs="0"/>
+          <xs:element name="opsubType" type="xs:string" minOccurs="0"/>
+          <xs:element name="charOsType" type="xs:int" minOccurs="0"/>
+          <xs:element name="jmeno" type="xs:string" minOccurs="0"/>
+          <xs:element name="prijmeni" type="xs:string" minOccurs="0"/>
+          <xs:element name="rodneCislo" type="xs:string" minOccurs="0"/>
+          <xs:element name="nazevUlice" type="xs:string" minOccurs="0"/>
+          <xs:element name="cisloDomovni" type="xs:int" minOccurs="0"/>
+          <xs:element name="obec" type="xs:string" minOccurs="0"/>
+          <xs:element name="psc" type="xs:int" minOccurs="0"/>
+          <xs:element name="kodAdresnihoMista" type="xs:long" minOccurs="0"/>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:complexType name="OsType">
+        <xs:sequence>
+          <xs:element name="pOSIdent" type="xs:string"/>
+          <xs:element name="chybaPOSIdent" type="xs:string" minOccurs="0"/>
+          <xs:element name="osId" type="xs:string" minOccurs="0"/>
+          <xs:element name="osDetail" type="tns:OsDetailType" minOccurs="0" maxOccurs="unbounded"/>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:element name="ctiOSResponse">
+        <xs:complexType>
+          <xs:sequence>
+            <xs:element name="vysledek" type="tns:VysledekType"/>
+            <xs:element name="osList" minOccurs="0">
+              <xs:complexType>
+                <xs:sequence>
+                  <xs:element name="os" type="tns:OsType" maxOccurs="unbounded"/>
+                </xs:sequence>
+              </xs:complexType>
+            </xs:element>
+          </xs:sequence>
+        </xs:complexType>
+      </xs:element>
+"""
+
+_SESTAVY_TYPES = """
+      <xs:complexType name="ReportType">
+        <xs:sequence>
+          <xs:element name="id" type="xs:integer"/>
+          <xs:element name="nazev" type="xs:string" minOccurs="0"/>
+          <xs:element name="pocetJednotek" type="xs:int" minOccurs="0"/>
+          <xs:element name="pocetStran" type="xs:int" minOccurs="0"/>
+          <xs:element name="cena" type="xs:decimal" minOccurs="0"/>
+          <xs:element name="datumPozadavku" type="xs:dateTime" minOccurs="0"/>
+          <xs:element name="datumSpusteni" type="xs:dateTime" minOccurs="0"/>
+          <xs:element name="datumVytvoreni" type="xs:dateTime" minOccurs="0"/>
+          <xs:element name="stav" type="xs:string" minOccurs="0"/>
+          <xs:element name="format" type="xs:string" minOccurs="0"/>
+          <xs:element name="elZnacka" type="xs:string" minOccurs="0"/>
+          <xs:element name="souborSestavy" type="xs:base64Binary" minOccurs="0"/>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:complexType name="SestavyResponseType">
+        <xs:sequence>
+          <xs:element name="vysledek" type="tns:VysledekType"/>
+          <xs:element name="reportList" minOccurs="0">
+            <xs:complexType>
+              <xs:sequence>
+                <xs:element name="report" type="tns:ReportType" maxOccurs="unbounded"/>
+              </xs:sequence>
+            </xs:complexType>
+          </xs:element>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:element name="generujCenoveUdajeDleKuRequest">
+        <xs:complexType>
+          <xs:sequence>
+            <xs:element name="katastrUzemiKod" type="xs:int"/>
+            <xs:element name="rok" type="xs:int"/>
+            <xs:element name="mesicOd" type="xs:int"/>
+            <xs:element name="mesicDo" type="xs:int"/>
+            <xs:element name="format" type="xs:string"/>
+          </xs:sequence>
+        </xs:complexType>
+      </xs:element>
+      <xs:element name="seznamSestavRequest">
+        <xs:complexType>
+          <xs:sequence>
+            <xs:element name="idSestavy" type="xs:integer" minOccurs="0"/>
+          </xs:sequence>
+        </xs:complexType>
+      </xs:element>
+      <xs:element name="vratSestavuRequest">
+        <xs:complexType>
+          <xs:sequence><xs:element name="idSestavy" type="xs:integer"/></xs:sequence>
+        </xs:complexType>
+      </xs:element>
+      <xs:element name="smazSestavuRequest">
+        <xs:complexType>
+          <xs:sequence><xs:element name="idSestavy" type="xs:integer"/></xs:sequence>
+        </xs:complexType>
+      </xs:element>
+      <xs:element name="generujCenoveUdajeDleKuResponse" type="tns:SestavyResponseType"/>
+      <xs:element name="seznamSestavResponse" type="tns:SestavyResponseType"/>
+      <xs:element name="vratSestavuResponse" type="tns:SestavyResponseType"/>
+      <xs:element name="smazSestavuResponse" type="tns:SestavyResponseType"/>
+"""
+
+# Operation name: (request element, response element)
+_CTIOS_OPERATIONS = {"ctios": ("ctiOSRequest", "ctiOSResponse")}
+_SESTAVY_OPERATIONS = {
+    name: (name + "Request", name + "Response")
+    for name in (
+        "generujCenoveUdajeDleKu",
+        "seznamSestav",
+        "vratSestavu",
+        "smazSestavu",
+    )
+}
+
+_ENVELOPE = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">'
+    "<soapenv:Body>{}</soapenv:Body></soapenv:Envelope>"
+)
+
+_FAULT = (
+    "<soapenv:Fault><faultcode>soapenv:Server</faultcode>"
+    "<faultstring>{}</faultstring></soapenv:Fault>"
+)
+
+_OK = "Požadovaná akce byla úspěšně provedena."
+
+
+def wsdl(ns, types, operations, address):
+    """Compose simplified WSDL document of the service group."""
+    messages = "".join(
+        '<message name="{0}"><part name="parameters" element="tns:{0}"/></message>'.format(
+            element
+        )
+        for pair in operations.values()
+        for element in pair
+    )
+    port_operations = "".join(
+        '<operation name="{}"><input message="tns:{}"/><output message="tns:{}"/>'
+        "</operation>".format(name, request, response)
+        for name, (request, response) in operations.items()
+    )
+    binding_operations = "".join(
+        '<operation name="{0}"><soap:operation soapAction="{0}"/>'
+        '<input><soap:body use="literal"/></input>'
+        '<output><soap:body use="literal"/></output></operation>'.format(name)
+        for name in operations
+    )
+    return _WSDL.format(
+        ns=ns,
+        types=types,
+        messages=messages,
+        port_operations=port_operations,
+        binding_operations=binding_operations,
+        address=address,
+    )
+
+
+def _element(name, value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        value = value.strftime("%Y-%m-%dT%H:%M:%S")
+    return "<{0}>{1}</{0}>".format(name, escape(str(value)))
+
+
+def _share(text, salt):
+    """Deterministic pseudo-random number from <0, 1) derived from the text."""
+    digest = hashlib.sha1((salt + text).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2**64
+
+
+class LatencyModel:
+    """
+    Log-normal distribution of delays. Sigma 0 means fixed delay.
+    """
+
+    def __init__(self, median=0.0, sigma=0.0, minimum=0.0):
+        """
+        :param median: float - median of the delay in seconds
+        :param sigma: float - standard deviation of log of the delay
+        :param minimum: float - lower bound of the delay in seconds
+        """
+        self.median = median
+        self.sigma = sigma
+        self.minimum = minimum
+
+    def sample(self, rnd):
+        """
+        Draw one delay.
+        :param rnd: random.Random
+        :rtype: float - seconds
+        """
+        if self.median <= 0:
+            return self.minimum
+        if self.sigma <= 0:
+            return max(self.median, self.minimum)
+        return max(rnd.lognormvariate(0.0, self.sigma) * self.median, self.minimum)
+
+
+class MockConfig:
+    """
+    Behaviour of the mock server.
+    """
+
+    def __init__(
+        self,
+        latency=None,
+        report_delay=None,
+        invalid=0.0,
+        expired=0.0,
+        nonexistent=0.0,
+        server_errors=0.0,
+        timeouts=0.0,
+        timeout_delay=30.0,
+        records_per_report=100,
+        seed=0,
+    ):
+        """
+        :param latency: LatencyModel or dict operation name: LatencyModel
+        :param report_delay: LatencyModel - generation time of reports
+        :param invalid: float - share of posidents answered NEPLATNY_IDENTIFIKATOR
+        :param expired: float - share of posidents answered EXPIROVANY_IDENTIFIKATOR
+        :param nonexistent: float - share of posidents answered OPRAVNENY_SUBJEKT_NEEXISTUJE
+        :param server_errors: float - share of requests answered by HTTP 500/503
+        :param timeouts: float - share of requests answered after timeout_delay
+        :param timeout_delay: float - delay of timed out requests in seconds
+        :param records_per_report: int - number of price records in generated reports
+        :param seed: int - seed of random generator
+        """
+        self.latency = latency or LatencyModel()
+        self.report_delay = report_delay or LatencyModel()
+        self.invalid = invalid
+        self.expired = expired
+        self.nonexistent = nonexistent
+        self.server_errors = server_errors
+        self.timeouts = timeouts
+        self.timeout_delay = timeout_delay
+        self.records_per_report = records_per_report
+        self.seed = seed
+
+    def latency_of(self, operation):
+        if isinstance(self.latency, dict):
+            return self.latency.get(operation, LatencyModel())
+        return self.latency
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="text/xml; charset=utf-8"):
+        body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server.mock
+        path = self.path.split("?")[0]
+        if path == "/ctios.wsdl":
+            self._send(
+                200,
+                wsdl(NS_CTIOS, _CTIOS_TYPES, _CTIOS_OPERATIONS, server.url + "/ctios"),
+            )
+        elif path == "/sestavy.wsdl":
+            self._send(
+                200,
+                wsdl(
+                    NS_SESTAVY,
+                    _SESTAVY_TYPES,
+                    _SESTAVY_OPERATIONS,
+                    server.url + "/sestavy",
+                ),
+            )
+        else:
+            self._send(404, "Not found", "text/plain")
+
+    def do_POST(self):
+        server = self.server.mock
+        data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            operation, request = server.parse(data)
+        except (etree.XMLSyntaxError, ValueError) as exc:
+            self._send(500, _ENVELOPE.format(_FAULT.format(escape(str(exc)))))
+            return
+        status, body = server.handle(operation, request)
+        self._send(status, body)
+
+
+class MockWSDPServer:
+    """
+    Threaded HTTP server answering SOAP requests of pywsdp clients.
+    """
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        """
+        :param config: MockConfig
+        :param host: str - address to listen on
+        :param port: int - port (0 = any free port)
+        """
+        self.config = config or MockConfig()
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self.url = "http://{}:{}".format(*self.httpd.server_address[:2])
+        self.reports = {}
+        self.requests = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._random = random.Random(self.config.seed)
+        self._thread = None
+
+    @property
+    def wsdls(self):
+        """WSDL endpoints of the server for ClientFactory."""
+        return {
+            "ctios": self.url + "/ctios.wsdl",
+            "sestavy": self.url + "/sestavy.wsdl",
+        }
+
+    def start(self):
+        """Serve requests in a background thread."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _rnd(self):
+        with self._lock:
+            return self._random.random(), self._random.getrandbits(32)
+
+    def parse(self, data):
+        """
+        Find operation and its parameters in the SOAP envelope.
+        :rtype: tuple (str - name of request element, dict - local name: list of texts)
+        """
+        envelope = etree.fromstring(data)
+        for body in envelope:
+            if isinstance(body.tag, str) and body.tag.endswith("}Body"):
+                for operation in body:
+                    name = etree.QName(operation).localname
+                    params = {}
+                    for child in operation:
+                        params.setdefault(etree.QName(child).localname, []).append(
+                            child.text
+                        )
+                    return name, params
+        raise ValueError("SOAP Body not found")
+
+    def handle(self, operation, request):
+        """
+        Answer one request including injected delays and errors.
+        :rtype: tuple (int - HTTP status, str - body)
+        """
+        name = (
+            operation[: -len("Request")] if operation.endswith("Request") else operation
+        )
+        if name == "ctiOS":
+            name = "ctios"
+        with self._lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+        share, seed = self._rnd()
+        rnd = random.Random(seed)
+        time.sleep(self.config.latency_of(name).sample(rnd))
+        if share < self.config.timeouts:
+            time.sleep(self.config.timeout_delay)
+        elif share < self.config.timeouts + self.config.server_errors:
+            if rnd.random() < 0.5:
+                return 503, "Service Unavailable"
+            return 500, _ENVELOPE.format(_FAULT.format("Internal server error"))
+        handler = getattr(self, "_" + name, None)
+        if handler is None:
+            return 500, _ENVELOPE.format(
+                _FAULT.format("Unknown operation {}".format(escape(operation)))
+            )
+        return 200, _ENVELOPE.format(handler(request, rnd))
+
+    @staticmethod
+    def _vysledek(zprava=_OK):
+        return '<vysledek><zprava kod="0">{}</zprava></vysledek>'.format(escape(zprava))
+
+    def _ctios(self, request, rnd):
+        config = self.config
+        items = []
+        for posident in request.get("pOSIdent", []):
+            share = _share(posident, "chyba")
+            error = None
+            if share < config.invalid:
+                error = "NEPLATNY_IDENTIFIKATOR"
+            elif share < config.invalid + config.expired:
+                error = "EXPIROVANY_IDENTIFIKATOR"
+            elif share < config.invalid + config.expired + config.nonexistent:
+                error = "OPRAVNENY_SUBJEKT_NEEXISTUJE"
+            if error:
+                items.append(
+                    "<os>{}{}</os>".format(
+                        _element("pOSIdent", posident),
+                        _element("chybaPOSIdent", error),
+                    )
+                )
+                continue
+            os_id = int(_share(posident, "id") * 10**9)
+            detail = "".join(
+                _element(k, v)
+                for k, v in (
+                    ("stavDat", 0),
+                    (
+                        "datumVzniku",
+                        datetime(2000, 1, 1) + timedelta(days=os_id % 7000),
+                    ),
+                    ("priznakKontext", 1),
+                    ("rizeniIdVzniku", os_id),
+                    ("opsubType", "OFO"),
+                    ("charOsType", 1),
+                    ("jmeno", "Jan"),
+                    ("prijmeni", "Novák"),
+                    ("rodneCislo", str(7000000000 + os_id % 999999999)),
+                    ("nazevUlice", "Thákurova"),
+                    ("cisloDomovni", 1 + os_id % 3000),
+                    ("obec", "Praha"),
+                    ("psc", 16000),
+                    ("kodAdresnihoMista", os_id % 10**8),
+                )
+            )
+            items.append(
+                "<os>{}{}<osDetail>{}</osDetail></os>".format(
+                    _element("pOSIdent", posident), _element("osId", os_id), detail
+                )
+            )
+        return '<ctiOSResponse xmlns="{}">{}<osList>{}</osList></ctiOSResponse>'.format(
+            NS_CTIOS, self._vysledek(), "".join(items)
+        )
+
+    def _report_xml(self, report, include_file=False):
+        now = datetime.now()
+        ready = now >= report["hotovo"]
+        fields = [
+            ("id", report["id"]),
+            ("nazev", "Cenové údaje dle k.ú."),
+            ("pocetJednotek", self.config.records_per_report),
+            ("pocetStran", 1),
+            ("cena", "0.00"),
+            ("datumPozadavku", report["pozadavek"]),
+            ("datumSpusteni", report["pozadavek"]),
+            ("datumVytvoreni", report["hotovo"] if ready else None),
+            ("stav", "zpracována" if ready else "ve frontě"),
+            ("format", report["parametry"]["format"]),
+            ("elZnacka", "ne"),
+        ]
+        if include_file and ready:
+            fields.append(
+                ("souborSestavy", base64.b64encode(self._report_file(report)).decode())
+            )
+        return "<report>{}</report>".format("".join(_element(k, v) for k, v in fields))
+
+    def _report_file(self, report):
+        """ZIP archive with XML of generated price records."""
+        parametry = report["parametry"]
+        rnd = random.Random(report["id"])
+        records = []
+        for i in range(self.config.records_per_report):
+            month = rnd.randint(int(parametry["mesicOd"]), int(parametry["mesicDo"]))
+            records.append(
+                "<cenovyUdaj>{}</cenovyUdaj>".format(
+                    "".join(
+                        _element(k, v)
+                        for k, v in (
+                            ("katastrUzemiKod", parametry["katastrUzemiKod"]),
+                            (
+                                "datumUzavreni",
+                                "{}-{:02d}-{:02d}".format(
+                                    parametry["rok"], month, rnd.randint(1, 28)
+                                ),
+                            ),
+                            ("typNemovitosti", rnd.choice(("byt", "dum", "pozemek"))),
+                            ("cena", rnd.randrange(500000, 20000000, 1000)),
+                            ("plocha", round(rnd.uniform(20, 1500), 1)),
+                        )
+                    )
+                )
+            )
+        content = io.BytesIO()
+        with zipfile.ZipFile(content, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(
+                "cenove_udaje.xml",
+                '<?xml version="1.0" encoding="UTF-8"?><cenoveUdaje>{}</cenoveUdaje>'.format(
+                    "".join(records)
+                ),
+            )
+        return content.getvalue()
+
+    def _sestavy_response(self, name, reports, include_file=False, zprava=_OK):
+        report_list = ""
+        if reports:
+            report_list = "<reportList>{}</reportList>".format(
+                "".join(self._report_xml(r, include_file) for r in reports)
+            )
+        return '<{0}Response xmlns="{1}">{2}{3}</{0}Response>'.format(
+            name, NS_SESTAVY, self._vysledek(zprava), report_list
+        )
+
+    def _find(self, request):
+        try:
+            report_id = int(request["idSestavy"][0])
+        except (KeyError, TypeError, ValueError):
+            return None
+        with self._lock:
+            return self.reports.get(report_id)
+
+    def _generujCenoveUdajeDleKu(self, request, rnd):
+        parametry = {k: v[0] for k, v in request.items()}
+        now = datetime.now()
+        with self._lock:
+            report = {
+                "id": self._next_id,
+                "parametry": parametry,
+                "pozadavek": now,
+                "hotovo": now + timedelta(seconds=self.config.report_delay.sample(rnd)),
+            }
+            self.reports[report["id"]] = report
+            self._next_id += 1
+        return self._sestavy_response("generujCenoveUdajeDleKu", [report])
+
+    def _seznamSestav(self, request, rnd):
+        if request.get("idSestavy"):
+            report = self._find(request)
+            if report is None:
+                return self._sestavy_response(
+                    "seznamSestav", [], zprava="Sestava nebyla nalezena."
+                )
+            return self._sestavy_response("seznamSestav", [report])
+        with self._lock:
+            reports = list(self.reports.values())
+        return self._sestavy_response("seznamSestav", reports)
+
+    def _vratSestavu(self, request, rnd):
+        report = self._find(request)
+        if report is None:
+            return self._sestavy_response(
+                "vratSestavu", [], zprava="Sestava nebyla nalezena."
+            )
+        return self._sestavy_response("vratSestavu", [report], include_file=True)
+
+    def _smazSestavu(self, request, rnd):
+        report = self._find(request)
+        if report is None:
+            return self._sestavy_response(
+                "smazSestavu", [], zprava="Sestava nebyla nalezena."
+            )
+        with self._lock:
+            self.reports.pop(report["id"], None)
+        return self._sestavy_response("smazSestavu", [], zprava="Sestava byla smazána.")
+
+
+def parse_args(parser):
+    """Add options of the mock server to the argument parser."""
+    parser.add_argument(
+        "--latence", type=float, default=0.0, help="median latence odpovedi [s]"
+    )
+    parser.add_argument(
+        "--rozptyl",
+        type=float,
+        default=0.0,
+        help="smerodatna odchylka logaritmu latence (lognormalni rozdeleni)",
+    )
+    parser.add_argument(
+        "--generovani",
+        type=float,
+        default=0.0,
+        help="median doby generovani sestav [s]",
+    )
+    parser.add_argument(
+        "--neplatne", type=float, default=0.0, help="podil neplatnych posidentu"
+    )
+    parser.add_argument(
+        "--expirovane", type=float, default=0.0, help="podil expirovanych posidentu"
+    )
+    parser.add_argument(
+        "--neexistujici", type=float, default=0.0, help="podil posidentu bez OS"
+    )
+    parser.add_argument(
+        "--chyby-5xx", type=float, default=0.0, help="podil odpovedi HTTP 5xx"
+    )
+    parser.add_argument(
+        "--timeouty", type=float, default=0.0, help="podil pozadavku s timeoutem"
+    )
+    parser.add_argument(
+        "--doba-timeoutu",
+        type=float,
+        default=30.0,
+        help="zpozdeni pozadavku s timeoutem [s]",
+    )
+    parser.add_argument(
+        "--zaznamy", type=int, default=100, help="pocet zaznamu v sestave"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="seed generatoru nahodnych cisel"
+    )
+
+
+def config_from_args(args):
+    """Create MockConfig from parsed options."""
+    return MockConfig(
+        latency=LatencyModel(args.latence, args.rozptyl),
+        report_delay=LatencyModel(args.generovani, args.rozptyl),
+        invalid=args.neplatne,
+        expired=args.expirovane,
+        nonexistent=args.neexistujici,
+        server_errors=args.chyby_5xx,
+        timeouts=args.timeouty,
+        timeout_delay=args.doba_timeoutu,
+        records_per_report=args.zaznamy,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lokalni nahrada WSDP sluzeb")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parse_args(parser)
+    args = parser.parse_args()
+    server = MockWSDPServer(config_from_args(args), args.host, args.port)
+    print("WSDL: {}".format(server.wsdls))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
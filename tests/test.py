@@ -1,10 +1,20 @@
 import os
 import sys
 import math
+import time
 import json
 import csv
 import sqlite3
+import base64
+import zipfile
+import gzip
+import logging
+import types
+import asyncio
 import pytest
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
 library_path = os.path.abspath(os.path.join("../"))
 if library_path not in sys.path:
@@ -13,8 +23,37 @@ if library_path not in sys.path:
 from pywsdp.modules import CtiOS
 from pywsdp.modules import GenerujCenoveUdajeDleKu
 from pywsdp.modules.SpravujSestavy import SeznamSestav, VratSestavu, SmazSestavu
-from pywsdp.modules.CtiOS import OutputFormat
-from pywsdp.base.exceptions import WSDPRequestError
+from pywsdp.modules.CtiOS import OutputFormat, Compression
+from pywsdp.modules.CtiOS.compression import ParallelGzipWriter
+from pywsdp.modules.CtiOS.dataframe import DataFrameCollector
+from pywsdp.base import readers
+from pywsdp.base.readers import iter_identifiers
+from pywsdp.base.exceptions import WSDPError, WSDPRequestError
+from pywsdp.modules.GenerujCenoveUdajeDleKu.helpers import ReportJobRunner
+from pywsdp.base.polling import AdaptivePolling, ReportWatcher
+from pywsdp.base.exceptions import WSDPTimeoutError, WSDPPosidentError
+from pywsdp.modules.GenerujCenoveUdajeDleKu.cache import ReportCache
+from pywsdp.modules.CtiOS.sharding import shard_of
+from pywsdp.modules.GenerujCenoveUdajeDleKu.dataset import (
+    PriceDataset,
+    PriceRecordReader,
+)
+from pywsdp.modules.GenerujCenoveUdajeDleKu.analytics import PriceStatistics
+from pywsdp.base.metrics import WSDPMetrics
+from pywsdp.base.profiling import Tracer
+from pywsdp.base.logger import WSDPLogger
+from pywsdp.clients.factory import set_wsdls, set_transport
+from pywsdp.clients.transports import RecordingTransport, ReplayTransport
+from tests.mock_server import MockWSDPServer, MockConfig
+from tests.helpers import create_opsub_db, ctios_module
+from pywsdp.clients.factory import CtiOsClient
+from pywsdp.clients.helpers.ctiOS import HedgingPolicy, PosidentValidator
+from pywsdp.modules.CtiOS.batcher import PosidentBatcher
+from pywsdp.modules.CtiOS.cache import NegativeCache
+from pywsdp.daemon import WSDPDaemon
+from pywsdp import cli
+from pywsdp.clients.helpers.generujCenoveUdajeDleKu import ReportStreamTarget
+from lxml import etree
 
 creds_test = ["WSTEST", "WSHESLO"]
 
@@ -297,3 +336,1075 @@ class TestOutputs:
         os.remove(cesta)
         smazani = gen.vymaz_sestavu(ses)
         assert smazani == {"zprava": "Požadovaná akce byla úspěšně provedena."}
+
+
+class FakeSestavy:
+    """
+    Offline stand-in for GenerujCenoveUdajeDleKu module used by batch tests.
+    """
+
+    def __init__(self, pocet_dotazu_na_stav=2):
+        self.logger = logging.getLogger("fake_sestavy")
+        self.pocet_dotazu_na_stav = pocet_dotazu_na_stav
+        self.dotazy = {}
+        self.smazane = []
+        self.pocet_vypisu_seznamu = 0
+        self.cache = None
+        self.hlidac = ReportWatcher(
+            lambda id_sestavy: self.vypis_info_o_sestave({"id": id_sestavy}),
+            self.vypis_seznam_sestav,
+            AdaptivePolling("fake", initial=0.01, max_interval=0.05),
+            self.logger,
+        )
+
+    def posli_pozadavek(self, parametry):
+        if parametry["katastrUzemiKod"] == 0:
+            raise WSDPRequestError(self.logger, "NEPLATNY KOD")
+        id_sestavy = len(self.dotazy) + 1
+        self.dotazy[id_sestavy] = 0
+        return {"id": id_sestavy, "stav": "zařazena", "format": parametry["format"]}
+
+    def vypis_info_o_sestave(self, sestava):
+        self.dotazy[sestava["id"]] += 1
+        if self.dotazy[sestava["id"]] >= self.pocet_dotazu_na_stav:
+            return {"id": sestava["id"], "stav": "zpracována", "datumVytvoreni": "x"}
+        return {"id": sestava["id"], "stav": "zpracovává se", "datumVytvoreni": None}
+
+    def vypis_seznam_sestav(self):
+        self.pocet_vypisu_seznamu += 1
+        return [self.vypis_info_o_sestave({"id": i}) for i in list(self.dotazy)]
+
+    def cekej_na_sestavu(self, sestava, timeout, interval):
+        return self.hlidac.wait([sestava["id"]], timeout)[sestava["id"]]
+
+    def zauctuj_a_uloz_sestavu(self, sestava, vystupni_adresar, nazev_souboru):
+        zauctovana_sestava = self.zauctuj_sestavu(sestava)
+        cesta = self.uloz_vystup(zauctovana_sestava, vystupni_adresar, nazev_souboru)
+        return cesta, zauctovana_sestava
+
+    def zauctuj_sestavu(self, sestava):
+        return {
+            "id": sestava["id"],
+            "format": sestava["format"],
+            "souborSestavy": base64.b64encode(b"PK" * 1000).decode(),
+        }
+
+    def uloz_vystup(self, zauctovana_sestava, vystupni_adresar, nazev_souboru):
+        cesta = os.path.join(vystupni_adresar, nazev_souboru)
+        with open(cesta, "wb") as f:
+            f.write(base64.b64decode(zauctovana_sestava["souborSestavy"]))
+        return cesta
+
+    def vymaz_sestavu(self, sestava):
+        self.smazane.append(sestava["id"])
+        return {"zprava": "Požadovaná akce byla úspěšně provedena."}
+
+
+class FakeCtiOSService:
+    """
+    Offline stand-in for zeep service of ctiOS. Posidents starting with "x" are
+    invalid, posidents starting with "z" belong to non-existing subjects.
+    """
+
+    def __init__(self):
+        self.dotazy = []
+
+    def ctios(self, pOSIdent):
+        self.dotazy.append(list(pOSIdent))
+        return {
+            "vysledek": {
+                "zprava": [{"_value_1": "Požadovaná akce byla úspěšně provedena."}]
+            },
+            "osList": {"os": [self._os(posident) for posident in pOSIdent]},
+        }
+
+    def _os(self, posident):
+        chyby = {"x": "NEPLATNY_IDENTIFIKATOR", "z": "OPRAVNENY_SUBJEKT_NEEXISTUJE"}
+        if posident[0] in chyby:
+            return {"pOSIdent": posident, "chybaPOSIdent": chyby[posident[0]]}
+        return {
+            "pOSIdent": posident,
+            "chybaPOSIdent": None,
+            "osId": abs(hash(posident)) % 100000,
+            "osDetail": [
+                {
+                    "datumVzniku": datetime(2020, 1, 1),
+                    "datumZaniku": None,
+                    "jmeno": "Jan",
+                    "prijmeni": posident,
+                    "charOsType": 1,
+                }
+            ],
+        }
+
+
+def vytvor_ctios_klienta():
+    """Create CtiOS client communicating with FakeCtiOSService."""
+    klient = CtiOsClient()
+    klient.client = types.SimpleNamespace(service=FakeCtiOSService())
+    klient.service_name = "ctiOS"
+    klient.logger = logging.getLogger("fake_ctios")
+    klient.creds = creds_test
+    klient.metrics = WSDPMetrics()
+    klient.validator = None  # fake posidents are not valid base64 identifiers
+    return klient
+
+
+class TestOffline:
+    """
+    Check the helpers which do not need connection to the service.
+    """
+
+    def test_03a_davka_sestav(self, tmp_path):
+        "Check the batch processing of reports"
+        modul = FakeSestavy()
+        runner = ReportJobRunner(modul, str(tmp_path), max_workers=3, poll_interval=0)
+        parametry = [
+            dict(parametry_generujCen_dict, mesicOd=mesic, mesicDo=mesic)
+            for mesic in range(1, 6)
+        ]
+        runner.run(parametry + [dict(parametry_generujCen_dict, katastrUzemiKod=0)])
+        souhrn = runner.summary()
+        assert souhrn["pocet sestav"] == 6
+        assert souhrn["pocet uspesne stazenych sestav"] == 5
+        assert souhrn["chyby"][0]["parametry"]["katastrUzemiKod"] == 0
+        assert sorted(modul.smazane) == [1, 2, 3, 4, 5]
+        assert len(os.listdir(str(tmp_path))) == 5
+
+        # stejne parametry nepresisuji vystup, chyba smazani neni chybou sestavy
+        def chyba_smazani(sestava):
+            raise WSDPRequestError(modul.logger, "SLUZBA NEDOSTUPNA")
+
+        modul = FakeSestavy()
+        modul.vymaz_sestavu = chyba_smazani
+        vystup = tmp_path / "stejne"
+        os.makedirs(str(vystup))
+        runner = ReportJobRunner(modul, str(vystup), poll_interval=0)
+        runner.run([parametry_generujCen_dict, parametry_generujCen_dict])
+        souhrn = runner.summary()
+        assert souhrn["pocet uspesne stazenych sestav"] == 2
+        assert len(souhrn["chyby smazani"]) == 2
+        assert len(os.listdir(str(vystup))) == 2
+
+    def test_03b_cekani_na_sestavy(self):
+        "Check waiting for more reports by one listing of reports"
+        modul = FakeSestavy(pocet_dotazu_na_stav=3)
+        sestavy = [modul.posli_pozadavek(parametry_generujCen_dict) for i in range(4)]
+        info = modul.hlidac.wait([s["id"] for s in sestavy], timeout=5)
+        assert sorted(info) == [1, 2, 3, 4]
+        assert modul.pocet_vypisu_seznamu == 3
+        assert modul.hlidac.polling.typical is not None
+
+        modul = FakeSestavy(pocet_dotazu_na_stav=1000)
+        sestava = modul.posli_pozadavek(parametry_generujCen_dict)
+        with pytest.raises(WSDPTimeoutError):
+            modul.hlidac.wait([sestava["id"]], timeout=0.1)
+
+        # interval se predava kazdemu cekani, sdilene nastaveni se nemeni
+        polling = AdaptivePolling("interval_cekani", initial=1.0)
+        assert next(polling.intervals(0.01)) == 0.01
+        assert next(polling.intervals()) == 1.0
+        assert polling.initial == 1.0
+
+    def test_03c_cache_sestav(self, tmp_path):
+        "Check the cache of generated reports"
+        modul = FakeSestavy()
+        modul.cache = ReportCache(str(tmp_path / "cache"), modul.logger, max_size=3000)
+        runner = ReportJobRunner(modul, str(tmp_path), poll_interval=0)
+        runner.run([parametry_generujCen_dict])
+        runner.run([dict(parametry_generujCen_dict, katastrUzemiKod="732630")])
+        assert runner.summary()["pocet sestav z cache"] == 1
+        assert len(modul.dotazy) == 1
+
+        # sestava za neuzavrene obdobi po expiraci neni platna
+        cache = ReportCache(str(tmp_path / "cache2"), modul.logger, max_age_open=None)
+        otevrene = dict(parametry_generujCen_dict, rok=datetime.now().year + 1)
+        cache.put(otevrene, runner.jobs[0].cesta)
+        assert cache.get(otevrene) is None
+        cache.put(parametry_generujCen_dict, runner.jobs[0].cesta)
+        assert cache.get(parametry_generujCen_dict) is not None
+
+        # vytlaceni nejdele nepouzitych sestav
+        for mesic in range(1, 4):
+            with open(str(tmp_path / "sestava.zip"), "wb") as f:
+                f.write(bytes([mesic]) * 1000)
+            parametry = dict(parametry_generujCen_dict, mesicOd=mesic, mesicDo=mesic)
+            modul.cache.put(parametry, str(tmp_path / "sestava.zip"))
+        assert modul.cache.size() <= 3000
+        assert modul.cache.get(parametry_generujCen_dict) is None
+
+        # prave ulozena sestava neni vytlacena ani pri prekroceni limitu
+        with open(str(tmp_path / "velka.zip"), "wb") as f:
+            f.write(b"x" * 5000)
+        assert os.path.exists(
+            modul.cache.put(parametry_generujCen_dict, str(tmp_path / "velka.zip"))
+        )
+        assert modul.cache.get(parametry_generujCen_dict) is not None
+
+        # chyba cache neznamena chybu stazene sestavy
+        def chyba_cache(*args):
+            raise OSError("disk je plny")
+
+        modul = FakeSestavy()
+        modul.cache = ReportCache(str(tmp_path / "cache3"), modul.logger)
+        modul.cache.put = chyba_cache
+        runner = ReportJobRunner(modul, str(tmp_path / "vystup3"), poll_interval=0)
+        os.makedirs(str(tmp_path / "vystup3"))
+        job = runner.run([parametry_generujCen_dict])[0]
+        assert job.chyba is None and job.stav == "stazena"
+        assert os.path.exists(job.cesta)
+
+    def test_03d_stream_sestavy(self, tmp_path):
+        "Check decoding of the report file while parsing VratSestavu response"
+        data = os.urandom(100000)
+        zakodovano = base64.encodebytes(data)
+        odpoved = (
+            b'<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/">'
+            b"<s:Body><vratSestavuResponse><vysledek><zprava>OK</zprava></vysledek>"
+            b"<reportList><report><id>42</id><format>zip</format><souborSestavy>"
+            + zakodovano
+            + b"</souborSestavy></report></reportList></vratSestavuResponse>"
+            b"</s:Body></s:Envelope>"
+        )
+        cesta = str(tmp_path / "sestava.zip")
+        with open(cesta, "wb") as f:
+            target = ReportStreamTarget(f, block_size=1000)
+            parser = etree.XMLParser(target=target, huge_tree=True)
+            for i in range(0, len(odpoved), 777):
+                parser.feed(odpoved[i : i + 777])
+            info = parser.close()
+        assert info == {"id": "42", "format": "zip"}
+        assert target.zprava == "OK"
+        with open(cesta, "rb") as f:
+            assert f.read() == data
+
+    def test_03e_dataset_cenovych_udaju(self, tmp_path):
+        "Check loading of price reports into one SQLite dataset"
+
+        def vytvor_sestavu(cesta, mesice):
+            zaznamy = "".join(
+                "<cenovyUdaj><datumVkladu>2020-{:02d}-15</datumVkladu>"
+                "<cena>{}</cena><vymera>{}.5</vymera>"
+                "<nemovitost><typ>pozemek</typ><kodObce>0554</kodObce></nemovitost>"
+                "</cenovyUdaj>".format(mesic, mesic * 100000, mesic)
+                for mesic in mesice
+            )
+            with zipfile.ZipFile(cesta, "w") as archiv:
+                archiv.writestr(
+                    "cenove_udaje.xml",
+                    "<?xml version='1.0'?><cenoveUdaje>{}</cenoveUdaje>".format(
+                        zaznamy
+                    ),
+                )
+
+        vytvor_sestavu(str(tmp_path / "a.zip"), range(9, 12))
+        vytvor_sestavu(str(tmp_path / "b.zip"), range(10, 13))
+        dataset = PriceDataset(str(tmp_path / "ceny.db"), logging.getLogger("test"))
+        assert (
+            dataset.add_report(str(tmp_path / "a.zip"), parametry_generujCen_dict) == 3
+        )
+        assert (
+            dataset.add_report(str(tmp_path / "b.zip"), parametry_generujCen_dict) == 1
+        )
+        assert dataset.add_report(str(tmp_path / "b.zip")) == 0
+        radky = dataset.query(
+            "SELECT KATASTR_UZEMI_KOD, DATUM, CENA, VYMERA, NEMOVITOST_KOD_OBCE "
+            "FROM cenove_udaje ORDER BY DATUM"
+        )
+        assert len(radky) == 4
+        assert radky[0] == (732630, "2020-09-15", 900000, 9.5, "0554")
+        dataset.close_connection()
+
+        # elementy pojmenovane jako klicova slova SQL nebo odvozene sloupce
+        dataset = PriceDataset(str(tmp_path / "ceny2.db"), dataset.logger)
+        with open(str(tmp_path / "c.xml"), "w") as f:
+            f.write(
+                "<ceny>{}</ceny>".format(
+                    "".join(
+                        "<zaznam><order>{0}</order><datum>2019-01-0{0}</datum>"
+                        "<katastrUzemiKod>1</katastrUzemiKod></zaznam>".format(i)
+                        for i in (1, 2)
+                    )
+                )
+            )
+        assert (
+            dataset.add_report(str(tmp_path / "c.xml"), parametry_generujCen_dict) == 2
+        )
+        radky = dataset.query(
+            'SELECT "ORDER", PUVODNI_DATUM, PUVODNI_KATASTR_UZEMI_KOD, KATASTR_UZEMI_KOD '
+            "FROM cenove_udaje ORDER BY 1"
+        )
+        assert radky == [(1, "2019-01-01", 1, 732630), (2, "2019-01-02", 1, 732630)]
+
+        # sestava s jednim zaznamem ma stejne sloupce jako ostatni sestavy
+        zaznam = "<zaznam><cena>{}</cena><kodKu>{}</kodKu></zaznam>"
+        with open(str(tmp_path / "d.xml"), "w") as f:
+            f.write(
+                "<sestava><zaznamy>{}</zaznamy></sestava>".format(zaznam.format(5, 1))
+            )
+        assert next(
+            iter(PriceRecordReader(str(tmp_path / "d.xml"), dataset.logger))
+        ) == {
+            "cena": 5,
+            "kodKu": 1,
+        }
+        # shodne zaznamy jedne sestavy i ruznych uzemi se zachovaji
+        with open(str(tmp_path / "e.xml"), "w") as f:
+            f.write(
+                "<sestava><zaznamy>{}</zaznamy></sestava>".format(
+                    zaznam.format(7, 1) * 2
+                    + zaznam.format(7, 2)
+                    + zaznam.format(7, "ABC")
+                )
+            )
+        assert dataset.add_report(str(tmp_path / "e.xml")) == 4
+        assert dataset.query(
+            "SELECT KATASTR_UZEMI_KOD FROM cenove_udaje WHERE CENA = 7 ORDER BY 1"
+        ) == [(None,), (1,), (1,), (2,)]
+        dataset.close_connection()
+
+        pytest.importorskip("numpy")
+        statistika = PriceStatistics(str(tmp_path / "ceny.db"), dataset.logger)
+        ceny = statistika.aggregate("CENA", "VYMERA", quantiles=(0.5,))
+        assert list(ceny["OBDOBI"]) == ["2020-09", "2020-10", "2020-11", "2020-12"]
+        assert list(ceny["POCET"]) == [1, 1, 1, 1]
+        assert ceny["KVANTIL_0.5"][0] == 900000 / 9.5
+        pocty = statistika.count("NEMOVITOST_TYP", group_by=("KATASTR_UZEMI_KOD",))
+        assert list(pocty["POCET"]) == [4]
+
+    def test_04a_metriky(self):
+        "Check metrics of ctiOS requests"
+        klient = vytvor_ctios_klienta()
+        posidenty = ["a{}".format(i) for i in range(25)] + ["x1", "z1", "a1"]
+        slovnik, chybne = klient.send_request({"pOSIdent": posidenty})
+        assert klient.number_of_requests == 3
+        snapshot = klient.metrics.snapshot()
+        assert snapshot["posidents"] == {"ctiOS": 27}
+        assert snapshot["errors"]["ctiOS"] == {
+            "NEPLATNY_IDENTIFIKATOR": 1,
+            "OPRAVNENY_SUBJEKT_NEEXISTUJE": 1,
+        }
+        klient.metrics.observe_request("ctios", 0.3, 100, 2000)
+        text = klient.metrics.to_prometheus()
+        assert (
+            'pywsdp_request_duration_seconds_bucket{service="ctios",le="0.5"} 1' in text
+        )
+        assert (
+            'pywsdp_errors_total{service="ctiOS",type="NEPLATNY_IDENTIFIKATOR"} 1'
+            in text
+        )
+
+    def test_04b_casy_fazi(self, tmp_path):
+        "Check per-stage timing and run report of ctiOS requests"
+        klient = vytvor_ctios_klienta()
+        klient.tracer = Tracer(cprofile=True, memory=True)
+        with klient.tracer.run("posli_pozadavek"):
+            klient.send_request({"pOSIdent": ["a{}".format(i) for i in range(25)]})
+        report = klient.tracer.report()
+        assert report["faze"]["soap"]["pocet"] == 3
+        assert report["faze"]["DictEditor"]["pocet"] == 3
+        assert report["faze"]["posli_pozadavek"]["pocet"] == 1
+        assert report["behy"][0]["cprofile"]
+        assert report["behy"][0]["pamet"]["spicka"] > 0
+        cesta = klient.tracer.write_report(str(tmp_path), "ctiOS")
+        with open(cesta) as f:
+            assert set(json.load(f)["faze"]) == {
+                "soap",
+                "serialize_object",
+                "DictEditor",
+                "posli_pozadavek",
+            }
+        # dalsi beh ma vlastni rozpis fazi
+        with klient.tracer.run("posli_pozadavek"):
+            klient.send_request({"pOSIdent": ["a1"]})
+        assert klient.tracer.report()["faze"]["soap"]["pocet"] == 1
+
+        # soubezne behy z vice vlaken
+        tracer = Tracer()
+
+        def beh(i):
+            with tracer.run("beh"):
+                with tracer.run("vnoreny"):
+                    time.sleep(0.01)
+            return tracer.running
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            assert not any(executor.map(beh, range(16)))
+        assert len(tracer.runs) == 16
+        assert not tracer.running and tracer._active == 0
+        assert tracer.report()["faze"]["vnoreny"]["pocet"] >= 1
+        # uchovava se jen omezeny pocet poslednich behu
+        tracer = Tracer(max_runs=2)
+        for nazev in ("a", "b", "c"):
+            with tracer.run(nazev):
+                pass
+        assert [beh["nazev"] for beh in tracer.report()["behy"]] == ["b", "c"]
+
+    def test_04c_mock_server(self):
+        "Check the ctiOS client against the local mock server"
+        with MockWSDPServer(MockConfig(invalid=0.3)) as server:
+            puvodni = set_wsdls(server.wsdls)
+            try:
+                ctios = CtiOS(creds_test, trial=True)
+                slovnik, chybne = ctios.posli_pozadavek(parametry_ctiOS_dict)
+            finally:
+                set_wsdls(puvodni)
+        assert server.requests == {"ctios": 1}
+        assert len(slovnik) + len(chybne) == 5
+        assert set(chybne.values()) <= {"NEPLATNY_IDENTIFIKATOR"}
+        assert all(os_detail["osId"] for os_detail in slovnik.values())
+
+    def test_04d_nahravka_pozadavku(self, tmp_path):
+        "Check recording and replaying of requests"
+        nahravka = str(tmp_path / "nahravka.jsonl.gz")
+        with MockWSDPServer(MockConfig(invalid=0.3)) as server:
+            puvodni_wsdl = set_wsdls(server.wsdls)
+            puvodni = set_transport(RecordingTransport(nahravka))
+            try:
+                ctios = CtiOS(creds_test, trial=True)
+                slovnik, chybne = ctios.posli_pozadavek(parametry_ctiOS_dict)
+            finally:
+                set_transport(puvodni).close()
+        try:
+            set_transport(ReplayTransport(nahravka, latency_scale=0))
+            ctios = CtiOS(creds_test, trial=True)
+            assert ctios.posli_pozadavek(parametry_ctiOS_dict) == (slovnik, chybne)
+            with pytest.raises(WSDPRequestError):
+                ctios.posli_pozadavek({"pOSIdent": ["A" * 107 + "="]})
+        finally:
+            set_transport(puvodni)
+            set_wsdls(puvodni_wsdl)
+
+    def test_04e_logovani(self, tmp_path):
+        "Check the log file and sampling of logged posidents"
+        logger = WSDPLogger("test_logovani")
+        logger.set_directory(str(tmp_path))
+        logger.set_directory(str(tmp_path))
+        assert len(os.listdir(tmp_path)) == 1
+        klient = vytvor_ctios_klienta()
+        klient.logger = logger
+        klient.log_every = 10
+        klient.send_request({"pOSIdent": ["a{}".format(i) for i in range(25)] + ["x1"]})
+        logger.flush()
+        with open(logger.log_file, encoding="utf-8") as f:
+            zpravy = f.read()
+        logger.close()
+        assert zpravy.count("USPESNE STAZEN\n") == 3
+        assert (
+            "ZPRACOVANO 6 POSIDENTU, USPESNE STAZENO 5, NEPLATNY IDENTIFIKATOR 1"
+            in zpravy
+        )
+
+    def test_04f_davkovani_posidentu(self):
+        "Check micro-batching of single posident lookups"
+        klient = vytvor_ctios_klienta()
+        posidenty = ["a{}".format(i) for i in range(25)] + ["x1", "a3"]
+        with PosidentBatcher(
+            klient.send_chunk, klient.logger, max_wait=0.2
+        ) as davkovac:
+            with ThreadPoolExecutor(max_workers=27) as executor:
+                vysledky = list(executor.map(davkovac.submit, posidenty))
+            assert vysledky[0].result(5)["prijmeni"] == "a0"
+            assert vysledky[3].result(5) == vysledky[26].result(5)
+            with pytest.raises(WSDPPosidentError) as chyba:
+                vysledky[25].result(5)
+            assert chyba.value.chyba == "NEPLATNY_IDENTIFIKATOR"
+            assert str(chyba.value) == "POSIDENT {} - NEPLATNY_IDENTIFIKATOR".format(
+                chyba.value.posident
+            )
+
+            async def dotazy():
+                return await asyncio.gather(
+                    *(davkovac.lookup_async(p) for p in ("b1", "b2", "b3"))
+                )
+
+            assert [v["prijmeni"] for v in asyncio.run(dotazy())] == ["b1", "b2", "b3"]
+            statistika = davkovac.statistics()
+        dotazy = klient.client.service.dotazy
+        assert all(len(dotaz) <= 10 for dotaz in dotazy)
+        assert statistika["posidenty"] == sum(map(len, dotazy))
+        assert klient.counter.uspesne_stazeno == statistika["posidenty"] - 1
+
+    def test_04g_sluzba_pywsdp(self, tmp_path):
+        "Check the daemon with warm clients against the local mock server"
+        with MockWSDPServer(MockConfig(invalid=0.3)) as server:
+            puvodni = set_wsdls(server.wsdls)
+            try:
+                with WSDPDaemon(
+                    creds_test, trial=True, port=0, output_dir=str(tmp_path)
+                ) as sluzba:
+                    odpovedi = [
+                        requests.post(sluzba.url + "/ctios", json=parametry)
+                        for parametry in (
+                            {"posidenty": parametry_ctiOS_dict["pOSIdent"]},
+                            {"posidenty": parametry_ctiOS_dict["pOSIdent"][:2]},
+                        )
+                    ]
+                    sestava = requests.post(
+                        sluzba.url + "/sestavy/generujCenoveUdajeDleKu",
+                        json={"parametry": parametry_generujCen_dict},
+                    )
+                    chybny = requests.post(sluzba.url + "/ctios", json={})
+                    zauctovana = requests.post(
+                        sluzba.url + "/sestavy/vratSestavu",
+                        json={"sestava": sestava.json(), "vystupni_adresar": "sestavy"},
+                    )
+                    mimo = requests.post(
+                        sluzba.url + "/sestavy/vratSestavu",
+                        json={"sestava": sestava.json(), "vystupni_adresar": "../x"},
+                    )
+                    vnitrni = requests.post(
+                        sluzba.url + "/sestavy/seznamSestav", json={"sestava": 5}
+                    )
+                    stav = requests.get(sluzba.url + "/stav").json()
+            finally:
+                set_wsdls(puvodni)
+        vysledek = odpovedi[0].json()
+        assert len(vysledek["vysledky"]) + len(vysledek["chyby"]) == 5
+        assert set(vysledek["chyby"].values()) <= {"NEPLATNY_IDENTIFIKATOR"}
+        assert odpovedi[1].status_code == 200
+        assert sestava.json()["id"]
+        assert chybny.status_code == 400
+        cesta = zauctovana.json()["cesta"]
+        assert os.path.dirname(cesta) == os.path.realpath(str(tmp_path / "sestavy"))
+        assert os.path.exists(cesta)
+        assert mimo.status_code == 400
+        assert vnitrni.status_code == 500
+        assert "TypeError" in vnitrni.json()["chyba"]
+        assert stav["pozadavky"] == 7
+        assert sorted(k["sluzba"] for k in stav["klienti"]) == [
+            "CtiOS",
+            "GenerujCenoveUdajeDleKu",
+        ]
+
+    def test_04h_prikazova_radka(self, tmp_path, capsys, monkeypatch):
+        "Check the command-line interface against the local mock server"
+        vstup = tmp_path / "posidenty.json"
+        vstup.write_text(json.dumps(parametry_ctiOS_dict))
+        parametry = tmp_path / "parametry.json"
+        parametry.write_text(
+            json.dumps(
+                [dict(parametry_generujCen_dict, mesicOd=mesic) for mesic in (9, 10)]
+            )
+        )
+        prihlaseni = ["--user", creds_test[0], "--password", creds_test[1], "--trial"]
+        kody = []
+        for konfigurace in (MockConfig(invalid=0.3), MockConfig(server_errors=1.0)):
+            with MockWSDPServer(konfigurace) as server:
+                puvodni = set_wsdls(server.wsdls)
+                try:
+                    kody.append(
+                        cli.main(
+                            ["ctios", "--json", str(vstup), "--format", "csv"]
+                            + ["--out", str(tmp_path / "ctios"), "--quiet"]
+                            + ["--chunk-size", "2", "--rate-limit", "100"]
+                            + prihlaseni
+                        )
+                    )
+                    souhrn = json.loads(capsys.readouterr().out)
+                    if not kody[-1]:
+                        kody.append(
+                            cli.main(
+                                ["cenove-udaje", "--params-file", str(parametry)]
+                                + ["--out", str(tmp_path / "sestavy"), "--interval"]
+                                + ["0.01"]
+                                + prihlaseni
+                            )
+                        )
+                        assert (
+                            json.loads(capsys.readouterr().out)[
+                                "pocet uspesne stazenych sestav"
+                            ]
+                            == 2
+                        )
+                finally:
+                    set_wsdls(puvodni)
+        assert kody == [cli.EXIT_OK, cli.EXIT_OK, cli.EXIT_PARTIAL]
+        assert souhrn["neodeslane"] == 3
+        assert souhrn["chybne"] == 2  # vyrazene lokalni kontrolou
+        assert os.path.exists(souhrn["vystup neodeslanych"])
+        # vetsi pocet POSIdentu v pozadavku nez povoluje sluzba se omezi
+        vstup_velky = tmp_path / "posidenty_velky.json"
+        vstup_velky.write_text(
+            json.dumps({"pOSIdent": ["A" * 106 + chr(65 + i) + "=" for i in range(12)]})
+        )
+        with MockWSDPServer(MockConfig()) as server:
+            puvodni = set_wsdls(server.wsdls)
+            try:
+                assert (
+                    cli.main(
+                        ["ctios", "--json", str(vstup_velky), "--chunk-size", "50"]
+                        + ["--out", str(tmp_path / "ctios"), "--quiet"]
+                        + prihlaseni
+                    )
+                    == cli.EXIT_OK
+                )
+            finally:
+                set_wsdls(puvodni)
+        assert json.loads(capsys.readouterr().out)["pozadavky"] == 2
+        with pytest.raises(SystemExit) as chyba:
+            cli.main(
+                [
+                    "ctios",
+                    "--json",
+                    str(vstup),
+                    "--format",
+                    "db",
+                    "--out",
+                    str(tmp_path),
+                ]
+                + prihlaseni
+            )
+        assert chyba.value.code == cli.EXIT_USAGE
+        monkeypatch.delenv("PYWSDP_HESLO", raising=False)
+        with pytest.raises(SystemExit) as chyba:
+            cli.main(["ctios", "--json", str(vstup), "--out", str(tmp_path)])
+        assert chyba.value.code == cli.EXIT_USAGE
+
+    def test_04i_kontrola_posidentu(self):
+        "Check local validation of posidents"
+        klient = vytvor_ctios_klienta()
+        klient.validator = PosidentValidator()
+        posidenty = [
+            "C" * 107,
+            "a" * 106 + "==",
+            "A" * 107 + "=",
+            "a" * 107 + "*",
+            "B" * 128,
+        ] + parametry_ctiOS_dict["pOSIdent"]
+        slovnik, chybne = klient.send_request({"pOSIdent": posidenty})
+        assert (
+            list(chybne)
+            == [
+                "a" * 106 + "==",
+                "a" * 107 + "*",
+            ]
+            + parametry_ctiOS_dict["pOSIdent"][:2]
+        )
+        assert set(chybne.values()) == {"NEPLATNY_IDENTIFIKATOR"}
+        assert klient.client.service.dotazy == [
+            ["C" * 107, "A" * 107 + "=", "B" * 128]
+            + parametry_ctiOS_dict["pOSIdent"][3:]
+        ]
+        assert klient.counter.neplatny_identifikator == 4
+        assert len(slovnik) == 6
+
+    def test_04j_negativni_cache(self, tmp_path):
+        "Check skipping of posidents from the negative cache"
+        posidenty = ["A" * 106 + znak + "=" for znak in "BCDEFGHIJKLMNOPQRSTU"]
+        cesta = str(tmp_path / "negativni.db")
+        with MockWSDPServer(MockConfig(invalid=0.3, nonexistent=0.3)) as server:
+            puvodni = set_wsdls(server.wsdls)
+            try:
+                behy = []
+                for i in range(2):
+                    ctios = CtiOS(creds_test, trial=True)
+                    ctios.negativni_cache = cesta
+                    behy.append(ctios.posli_pozadavek({"pOSIdent": posidenty}))
+                    ctios.negativni_cache.close()
+            finally:
+                set_wsdls(puvodni)
+        slovnik, chybne = behy[0]
+        assert chybne and behy[1] == behy[0]
+        assert list(chybne) == [p for p in posidenty if p in chybne]
+        assert ctios.client.counter.uspesne_stazeno == len(slovnik)
+        assert ctios.client.counter.processed() == len(posidenty)
+        # druhy beh odeslal pouze uspesne POSIdenty
+        assert server.requests["ctios"] == 2 + math.ceil(len(slovnik) / 10)
+
+        cache = NegativeCache(
+            cesta, logging.getLogger("test"), {"NEPLATNY_IDENTIFIKATOR": timedelta(0)}
+        )
+        cache.add({"x": "NEPLATNY_IDENTIFIKATOR", "y": "EXPIROVANY_IDENTIFIKATOR"})
+        assert cache.filter(["x", "y"]) == (["x", "y"], {})
+        assert cache.purge() == len(chybne) + 1
+        assert len(cache) == 0
+        cache.close()
+
+    def test_04k_vice_databazi(self, tmp_path):
+        "Check enrichment of more databases with global de-duplication"
+        vstupy = tmp_path / "vstup"
+        vstupy.mkdir()
+        posidenty = ["A" * 106 + znak + "=" for znak in "BCDEFGHIJKLMNOP"]
+        casti = {}
+        for i, cast in enumerate((posidenty[:8], posidenty[4:12], posidenty[10:])):
+            casti["ku_{}.db".format(i)] = cast
+            create_opsub_db(str(vstupy / "ku_{}.db".format(i)), cast, len(cast))
+        with MockWSDPServer(MockConfig(invalid=0.2)) as server:
+            puvodni = set_wsdls(server.wsdls)
+            try:
+                ctios = CtiOS(creds_test, trial=True)
+                souhrn = ctios.zpracuj_databaze(
+                    str(vstupy), str(tmp_path / "vystup"), max_soubeznych=3
+                )
+                pozadavky = server.requests["ctios"]
+                # stejne nazvy databazi z ruznych adresaru se neprepisuji
+                (tmp_path / "jine").mkdir()
+                jina = str(tmp_path / "jine" / "ku_0.db")
+                create_opsub_db(jina, posidenty[:2], 2)
+                stejne_nazvy = CtiOS(creds_test, trial=True).zpracuj_databaze(
+                    [str(vstupy / "ku_0.db"), jina, jina], str(tmp_path / "vystup2")
+                )
+            finally:
+                set_wsdls(puvodni)
+        assert souhrn["pocet posidentu"] == 21
+        assert souhrn["pocet unikatnich posidentu"] == 15
+        assert pozadavky == 2
+        assert ctios.client.counter.processed() == 15
+        for vstup, vysledek in souhrn["databaze"].items():
+            nazev = os.path.basename(vstup)
+            assert vysledek["vystup"] == str(tmp_path / "vystup" / nazev)
+            assert vysledek["aktualizovano"] == sum(
+                1 for p in casti[nazev] if p not in souhrn["chybne"]
+            )
+            with sqlite3.connect(vysledek["vystup"]) as conn:
+                pocet = conn.execute(
+                    "SELECT COUNT(*) FROM OPSUB WHERE OS_ID IS NOT NULL"
+                ).fetchone()[0]
+            assert pocet == vysledek["aktualizovano"]
+        assert sorted(
+            os.path.basename(v["vystup"]) for v in stejne_nazvy["databaze"].values()
+        ) == ["ku_0.db", "ku_0_1.db"]
+        assert stejne_nazvy["databaze"][jina]["posidenty"] == 2
+        assert stejne_nazvy["pocet posidentu"] == 10
+
+    def test_04l_paralelne(self, tmp_path):
+        "Check sharded processing of the database in more processes"
+        posidenty = ["A" * 106 + znak + "=" for znak in "BCDEFGHIJKLMNOPQRSTU"]
+        db_path = str(tmp_path / "vstup.db")
+        create_opsub_db(db_path, posidenty, len(posidenty))
+        with MockWSDPServer(MockConfig(invalid=0.2)) as server:
+            puvodni = set_wsdls(server.wsdls)
+            try:
+                ctios = CtiOS(creds_test, trial=True)
+                json_souhrn = ctios.zpracuj_paralelne(
+                    db_path, str(tmp_path / "json"), OutputFormat.Json, 2
+                )
+                ctios = CtiOS(creds_test, trial=True)
+                db_souhrn = ctios.zpracuj_paralelne(
+                    db_path, str(tmp_path / "db"), OutputFormat.GdalDb, 2, "hash"
+                )
+                # pokracovani preruseneho behu - denik s neuplnym poslednim radkem
+                casti = tmp_path / "obnoveni" / ".casti_vstup"
+                os.makedirs(str(casti))
+                with open(str(casti / "cast_0_2.jsonl"), "w") as f:
+                    f.write(
+                        json.dumps({"posident": posidenty[0], "udaje": {"osId": "1"}})
+                    )
+                    f.write('\n{"pozadavky": 1}\n{"posident": "')
+                pozadavky = server.requests["ctios"]
+                ctios = CtiOS(creds_test, trial=True)
+                obnoveny_souhrn = ctios.zpracuj_paralelne(
+                    db_path, str(tmp_path / "obnoveni"), OutputFormat.Json, 2
+                )
+                pozadavky = server.requests["ctios"] - pozadavky
+            finally:
+                set_wsdls(puvodni)
+        assert len(json_souhrn["casti"]) == 2
+        assert sum(cast["posidenty"] for cast in json_souhrn["casti"]) == 20
+        with open(json_souhrn["vystup"]) as f:
+            vysledky = json.load(f)
+        with open(json_souhrn["vystup chybnych"]) as f:
+            chybne = json.load(f)
+        assert len(vysledky) + len(chybne) == 20
+        assert not os.path.exists(str(tmp_path / "json" / ".casti_vstup"))
+        assert ctios.client.counter.processed() == 20
+        with sqlite3.connect(db_souhrn["vystup"]) as conn:
+            pocet = conn.execute(
+                "SELECT COUNT(*) FROM OPSUB WHERE OS_ID IS NOT NULL"
+            ).fetchone()[0]
+        assert pocet == len(vysledky)
+        # rozdeleni podle hashe se pocita jednou v rodicovskem procesu
+        assert [cast["posidenty"] for cast in db_souhrn["casti"]] == [
+            sum(shard_of(p, 2) == i for p in posidenty) for i in range(2)
+        ]
+        with open(obnoveny_souhrn["vystup"]) as f:
+            obnovene = json.load(f)
+        assert obnovene[posidenty[0]] == {"osId": "1"}
+        with open(obnoveny_souhrn["vystup chybnych"]) as f:
+            assert len(obnovene) + len(json.load(f)) == 20
+        assert ctios.client.counter.processed() == 20
+        assert ctios.client.counter.uspesne_stazeno == len(obnovene)
+        assert sum(c["pozadavky"] for c in obnoveny_souhrn["casti"]) == pozadavky + 1
+
+    def test_04m_proudove(self, tmp_path):
+        "Check pipelined enrichment of the database"
+        posidenty = ["A" * 106 + znak + "=" for znak in "BCDEFGHIJKLMNOPQRSTU"]
+        db_path = str(tmp_path / "vstup.db")
+        create_opsub_db(db_path, posidenty, len(posidenty))
+        with MockWSDPServer(MockConfig(invalid=0.2)) as server:
+            puvodni = set_wsdls(server.wsdls)
+            try:
+                ctios = CtiOS(creds_test, trial=True)
+                parametry = ctios.nacti_identifikatory_z_db(db_path)
+                souhrn = ctios.aktualizuj_db_proudove(
+                    parametry, max_soubeznych=2, velikost_fronty=1, davka_zapisu=5
+                )
+            finally:
+                set_wsdls(puvodni)
+        assert souhrn["databaze"] == db_path
+        assert souhrn["pozadavky"] == server.requests["ctios"] == 2
+        assert souhrn["aktualizovano"] + len(souhrn["chybne"]) == 20
+        assert souhrn["transakce"] >= souhrn["aktualizovano"] // 5
+        assert ctios.client.counter.processed() == 20
+        with sqlite3.connect(db_path) as conn:
+            pocet = conn.execute(
+                "SELECT COUNT(*) FROM OPSUB WHERE OS_ID IS NOT NULL"
+            ).fetchone()[0]
+        assert pocet == souhrn["aktualizovano"]
+
+    def test_04n_parquet(self, tmp_path):
+        "Check typed columnar output written by row groups"
+        pq = pytest.importorskip("pyarrow.parquet")
+        pa = pytest.importorskip("pyarrow")
+        posidenty = ["A" * 106 + znak + "=" for znak in "BCDEFGHIJKLMNOPQRSTU"]
+        with MockWSDPServer(MockConfig(invalid=0.2)) as server:
+            puvodni = set_wsdls(server.wsdls)
+            try:
+                ctios = CtiOS(creds_test, trial=True)
+                cesta, chybne = ctios.uloz_vystup_proudove(
+                    {"pOSIdent": posidenty},
+                    str(tmp_path),
+                    OutputFormat.Parquet,
+                    max_soubeznych=2,
+                    velikost_skupiny=4,
+                )
+                feather_proudove, _ = ctios.uloz_vystup_proudove(
+                    {"pOSIdent": posidenty},
+                    str(tmp_path / "feather"),
+                    OutputFormat.Feather,
+                    velikost_skupiny=4,
+                )
+                slovnik, _ = ctios.posli_pozadavek({"pOSIdent": posidenty})
+                feather = ctios.uloz_vystup(
+                    slovnik, str(tmp_path), OutputFormat.Feather
+                )
+            finally:
+                set_wsdls(puvodni)
+        soubor = pq.ParquetFile(cesta)
+        uspesne = len(posidenty) - len(chybne)
+        assert soubor.metadata.num_rows == uspesne
+        assert soubor.metadata.num_row_groups == math.ceil(uspesne / 4)
+        schema = soubor.schema_arrow
+        assert schema.field("datumVzniku").type == pa.timestamp("ms")
+        assert schema.field("psc").type == pa.int32()
+        assert pa.types.is_dictionary(schema.field("obec").type)
+        tabulka = soubor.read()
+        assert sorted(tabulka.column("posident").to_pylist()) == sorted(
+            p for p in posidenty if p not in chybne
+        )
+        with pa.memory_map(feather) as zdroj:
+            tabulka = pa.ipc.open_file(zdroj).read_all()
+        assert tabulka.num_rows == len(slovnik)
+        assert tabulka.schema.field("datumVzniku").type == pa.timestamp("ms")
+        assert tabulka.schema.field("obec").type == pa.string()
+        assert tabulka.schema.names == schema.names
+        # vice skupin radku ve formatu Arrow IPC
+        with pa.memory_map(feather_proudove) as zdroj:
+            ctecka = pa.ipc.open_file(zdroj)
+            assert ctecka.num_record_batches == math.ceil(uspesne / 4)
+            assert ctecka.read_all().num_rows == uspesne
+        ctios = ctios_module(None, str(tmp_path))
+        with pytest.raises(WSDPError):
+            ctios.uloz_vystup(
+                {"A" * 108: {"psc": "neni cislo"}}, str(tmp_path), OutputFormat.Feather
+            )
+
+    def test_04o_komprese(self, tmp_path):
+        "Check compressed JSON, CSV and error outputs"
+        ctios = ctios_module(None, str(tmp_path))
+        slovnik = {
+            "A" * 106 + znak + "=": {"jmeno": "Jan", "obec": "Praha", "psc": 16000}
+            for znak in "BCDEFGH"
+        }
+        vystup = ctios.uloz_vystup(
+            slovnik, str(tmp_path), OutputFormat.Json, Compression.Gzip
+        )
+        assert vystup.endswith(".json.gz")
+        with gzip.open(vystup, "rt", encoding="utf-8") as f:
+            assert json.load(f) == slovnik
+        vystup = ctios.uloz_vystup(
+            slovnik, str(tmp_path), OutputFormat.Csv, Compression.Gzip
+        )
+        with gzip.open(vystup, "rt", encoding="utf-8", newline="") as f:
+            radky = list(csv.reader(f))
+        assert radky[0] == ["posident", "jmeno", "obec", "psc"]
+        assert len(radky) == len(slovnik) + 1
+        chybne = ctios.uloz_vystup_chybnych(
+            {"x": "NEPLATNY_IDENTIFIKATOR"}, str(tmp_path), Compression.Gzip
+        )
+        with gzip.open(chybne, "rt", encoding="utf-8") as f:
+            assert json.load(f) == {"x": "NEPLATNY_IDENTIFIKATOR"}
+        with pytest.raises(WSDPError):
+            ctios.uloz_vystup(
+                slovnik, str(tmp_path), OutputFormat.GdalDb, Compression.Gzip
+            )
+
+        # more gzip members compressed in parallel form one valid file
+        data = os.urandom(1000) * 300
+        cesta = str(tmp_path / "bloky.gz")
+        with ParallelGzipWriter(cesta, threads=3, block_size=4096) as f:
+            for i in range(0, len(data), 1000):
+                f.write(data[i : i + 1000])
+        with gzip.open(cesta, "rb") as f:
+            assert f.read() == data
+
+    def test_04p_zdvojovani(self):
+        "Check hedged requests - the slow request is duplicated and the first response wins"
+
+        class PomalaSluzba(FakeCtiOSService):
+            def ctios(self, pOSIdent):
+                pomaly = len(self.dotazy) == 10
+                odpoved = super().ctios(pOSIdent)
+                if pomaly:
+                    time.sleep(1)
+                return odpoved
+
+        klient = vytvor_ctios_klienta()
+        klient.client = types.SimpleNamespace(service=PomalaSluzba())
+        klient.hedging = HedgingPolicy(min_samples=5, min_delay=0.1, max_extra=0.2)
+        posidenty = ["p{}".format(i) for i in range(200)]
+        start = time.monotonic()
+        slovnik, chybne = klient.send_request({"pOSIdent": posidenty})
+        assert time.monotonic() - start < 0.9
+        assert len(slovnik) == 200 and not chybne
+        # only the winning response is processed
+        assert klient.counter.uspesne_stazeno == 200
+        assert klient.number_of_requests == 20
+        assert len(klient.client.service.dotazy) == 21
+        assert klient.metrics.snapshot()["hedges"] == {"ctiOS": 1}
+        assert klient.metrics.snapshot()["retries"] == {"ctiOS": 1}
+        time.sleep(1)
+        statistika = klient.hedging.statistics()
+        assert statistika["zdvojene"] == 1
+        assert statistika["vyhry zdvojenych"] == 1
+        assert statistika["podil zdvojenych"] == 1 / 20
+        assert statistika["usetreny cas [s]"] > 0.5
+
+        # the cap of extra load is kept
+        klient.hedging = HedgingPolicy(min_samples=5, min_delay=0.1, max_extra=0.01)
+        klient.client = types.SimpleNamespace(service=PomalaSluzba())
+        klient.send_request({"pOSIdent": posidenty})
+        assert klient.hedging.statistics()["zdvojene"] == 0
+        assert len(klient.client.service.dotazy) == 20
+
+    def test_04q_dataframe(self):
+        "Check results of ctiOS returned as pandas DataFrame"
+        pd = pytest.importorskip("pandas")
+        posidenty = ["A" * 106 + znak + "=" for znak in "BCDEFGHIJKLMNOPQRSTU"]
+        with MockWSDPServer(MockConfig(invalid=0.2)) as server:
+            puvodni = set_wsdls(server.wsdls)
+            try:
+                ctios = CtiOS(creds_test, trial=True)
+                slovnik, chybne = ctios.posli_pozadavek({"pOSIdent": posidenty})
+                ctios = CtiOS(creds_test, trial=True)
+                tabulka, tabulka_chyb = ctios.posli_pozadavek(
+                    {"pOSIdent": posidenty}, jako_dataframe=True
+                )
+            finally:
+                set_wsdls(puvodni)
+        assert len(tabulka) == len(slovnik)
+        assert sorted(tabulka.index) == sorted(slovnik)
+        assert tabulka_chyb["chyba"].to_dict() == chybne
+        assert str(tabulka["psc"].dtype) == "Int32"
+        assert str(tabulka["kodAdresnihoMista"].dtype) == "Int64"
+        assert pd.api.types.is_datetime64_any_dtype(tabulka["datumVzniku"])
+        assert isinstance(tabulka["obec"].dtype, pd.CategoricalDtype)
+        posident = next(iter(slovnik))
+        radek = tabulka.loc[posident]
+        assert radek["jmeno"] == slovnik[posident]["jmeno"]
+        assert radek["psc"] == int(slovnik[posident]["psc"])
+        assert radek["datumVzniku"] == pd.Timestamp(
+            slovnik[posident]["datumVzniku"]
+        ).tz_localize("UTC")
+        # zimni a letni cas v jednom sloupci
+        sber = DataFrameCollector(ctios.logger)
+        sber.add(
+            {
+                "a": {"datumVzniku": "2020-01-15T10:00:00+01:00"},
+                "b": {"datumVzniku": "2020-07-15T10:00:00+02:00"},
+                "c": {"datumVzniku": None},
+            }
+        )
+        tabulka, _ = sber.frames({})
+        assert list(tabulka["datumVzniku"][:2]) == [
+            pd.Timestamp("2020-01-15T09:00:00Z"),
+            pd.Timestamp("2020-07-15T08:00:00Z"),
+        ]
+        assert pd.isna(tabulka["datumVzniku"]["c"])
+
+    def test_04r_proudovy_vstup(self, tmp_path):
+        "Check streaming readers of posidents from JSON, JSON Lines, CSV and text files"
+        posidenty = ["a{}".format(i) for i in range(25)] + ["x1", "z1", "a1", "a2"]
+        logger = logging.getLogger("readers")
+        soubory = {}
+        soubory["vstup.json"] = json.dumps(
+            {"verze": [1, {"a": "]"}], "pOSIdent": posidenty}
+        )
+        soubory["pole.json"] = json.dumps(posidenty, indent=2)
+        soubory["vstup.jsonl"] = "\n".join(
+            json.dumps({"pOSIdent": p}) if i % 2 else json.dumps(p)
+            for i, p in enumerate(posidenty)
+        )
+        soubory["vstup.csv"] = "id;posident\n" + "".join(
+            "{};{}\n".format(i, p) for i, p in enumerate(posidenty)
+        )
+        soubory["vstup.txt"] = "# POSIdenty\n\n" + "\n".join(posidenty)
+        for nazev, obsah in soubory.items():
+            with open(str(tmp_path / nazev), "w", encoding="utf-8") as f:
+                f.write(obsah)
+            with gzip.open(str(tmp_path / (nazev + ".gz")), "wt") as f:
+                f.write(obsah)
+            for cesta in (nazev, nazev + ".gz"):
+                assert (
+                    list(iter_identifiers(str(tmp_path / cesta), logger)) == posidenty
+                )
+        # hodnoty rozdelene mezi bloky nacitani
+        puvodni_blok = readers._BLOCK_SIZE
+        readers._BLOCK_SIZE = 7
+        try:
+            cesta = str(tmp_path / "vstup.json")
+            assert list(iter_identifiers(cesta, logger)) == posidenty
+        finally:
+            readers._BLOCK_SIZE = puvodni_blok
+        with open(str(tmp_path / "spatny.json"), "w") as f:
+            f.write('{"jine": []}')
+        with pytest.raises(WSDPError):
+            list(iter_identifiers(str(tmp_path / "spatny.json"), logger))
+
+        # generator vede ke stejnym vysledkum a statistikam jako seznam
+        klient = vytvor_ctios_klienta()
+        slovnik, chybne = klient.send_request({"pOSIdent": posidenty})
+        proudovy = vytvor_ctios_klienta()
+        proudovy.posidents_per_request = 3
+        cesta = str(tmp_path / "vstup.csv.gz")
+        vstup = {"pOSIdent": iter_identifiers(cesta, logger)}
+        slovnik2, chybne2 = proudovy.send_request(vstup)
+        assert slovnik2 == slovnik
+        assert chybne2 == chybne
+        assert proudovy.number_of_posidents == len(posidenty)
+        assert proudovy.number_of_posidents_final == len(set(posidenty))
+
+        ctios = ctios_module(None, str(tmp_path))
+        parametry = ctios.nacti_identifikatory_ze_souboru(str(tmp_path / "vstup.jsonl"))
+        assert not isinstance(parametry["pOSIdent"], list)
+        assert list(parametry["pOSIdent"]) == posidenty
+        with pytest.raises(WSDPError):
+            ctios.nacti_identifikatory_ze_souboru(str(tmp_path / "neexistuje.txt"))
+
+    def test_04s_typy_streamovane_sestavy(self, tmp_path):
+        "Check that the streamed report has the same value types as the zeep response"
+        with MockWSDPServer(MockConfig()) as server:
+            puvodni = set_wsdls(server.wsdls)
+            try:
+                gen = GenerujCenoveUdajeDleKu(creds_test, trial=True)
+                sestava = gen.posli_pozadavek(parametry_generujCen_dict)
+                zauctovani = gen.zauctuj_sestavu(sestava)
+                cesta, info = gen.zauctuj_a_uloz_sestavu(sestava, str(tmp_path))
+            finally:
+                set_wsdls(puvodni)
+        with open(cesta, "rb") as f:
+            assert f.read() == zauctovani.pop("souborSestavy")
+        assert info == zauctovani
+        assert isinstance(info["id"], int)
+        assert isinstance(info["datumPozadavku"], str)